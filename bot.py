@@ -942,7 +942,7 @@ class NewsBot:
                 digest_number = datetime.now().strftime("%Y%m%d%H")
                 
                 # Генерируем дайджест с использованием DigestGenerator
-                summary = self.digest_generator.generate_digest(
+                summary = await self.digest_generator.generate_digest_async(
                     analyzed_news=analyzed_news,
                     digest_number=int(digest_number) % 100,  # Для краткости берем остаток от деления
                     style=self.current_style
@@ -1049,15 +1049,9 @@ class NewsBot:
     async def _generate_overall_analysis(self, analyzed_news):
         """Асинхронная генерация общего анализа новостей"""
         try:
-            # Запускаем тяжелую операцию в отдельном потоке
-            loop = asyncio.get_running_loop()
-            
-            return await loop.run_in_executor(
-                None,  # использовать default executor
-                lambda: self.news_analyzer.generate_overall_analysis(
-                    analyzed_news, 
-                    style=self.current_style
-                )
+            return await self.news_analyzer.generate_overall_analysis_async(
+                analyzed_news,
+                style=self.current_style
             )
         except Exception as e:
             logger.error(f"Ошибка при генерации общего анализа: {e}")
@@ -1331,7 +1325,7 @@ class NewsBot:
             # Генерируем финальный дайджест
             digest_number = datetime.now().strftime("%Y%m%d%H")
             
-            summary = self.digest_generator.generate_digest(
+            summary = await self.digest_generator.generate_digest_async(
                 analyzed_news=analyzed_news,
                 digest_number=int(digest_number) % 100,
                 style=self.current_style
@@ -1922,7 +1916,7 @@ class NewsBot:
                 digest_number = datetime.now().strftime("%Y%m%d%H")
                 
                 # Генерируем дайджест с использованием DigestGenerator
-                summary = self.digest_generator.generate_digest(
+                summary = await self.digest_generator.generate_digest_async(
                     analyzed_news=analyzed_news,
                     digest_number=int(digest_number) % 100,  # Для краткости берем остаток от деления
                     style=self.current_style
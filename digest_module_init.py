@@ -5,7 +5,8 @@
 
 import os
 import json
-from flask import Blueprint, jsonify, request, render_template, current_app
+import orjson
+from flask import Blueprint, Response, jsonify, request, render_template, current_app
 import asyncio
 from new_generator import DigestStyle, NewsAnalyzer, DigestGenerator
 from db_manager import MongoDBManager
@@ -27,7 +28,8 @@ def index():
 def generate_digest():
     """API для генерации дайджеста"""
     try:
-        data = request.json
+        # Тело запроса и ответ с новостями разбираем и сериализуем через orjson
+        data = orjson.loads(request.get_data())
         
         # Получаем экземпляр DigestModuleIntegration из текущего приложения
         digest_module = current_app.digest_module
@@ -51,7 +53,7 @@ def generate_digest():
         )
         loop.close()
         
-        return jsonify(digest_result)
+        return Response(orjson.dumps(digest_result, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -204,7 +206,7 @@ class DigestModuleIntegration:
             
             # Генерируем дайджест
             digest_number = 1  # Номер дайджеста (можно настроить)
-            digest_text = self.digest_generator.generate_digest(analyzed_news, digest_number, style)
+            digest_text = await self.digest_generator.generate_digest_async(analyzed_news, digest_number, style)
             
             # Если включен анализ, добавляем его
             overall_analysis = None
@@ -220,6 +222,11 @@ class DigestModuleIntegration:
         except Exception as e:
             print(f"Ошибка при генерации дайджеста: {e}")
             return {'error': str(e)}
+        finally:
+            # Цикл событий живет только в рамках запроса, поэтому открытые в нем
+            # HTTP-соединения анализаторов закрываем до его завершения
+            await self.news_analyzer.aclose()
+            await self.digest_generator.analyzer.aclose()
     
     async def _analyze_news_item_async(self, raw_text, url=None):
         """Асинхронный анализ отдельной новости"""
@@ -248,15 +255,9 @@ class DigestModuleIntegration:
     async def _generate_overall_analysis_async(self, analyzed_news):
         """Асинхронная генерация общего анализа новостей"""
         try:
-            # Запускаем тяжелую операцию в отдельном потоке
-            loop = asyncio.get_event_loop()
-            
-            return await loop.run_in_executor(
-                None,  # использовать default executor
-                lambda: self.news_analyzer.generate_overall_analysis(
-                    analyzed_news, 
-                    style=self.current_style
-                )
+            return await self.news_analyzer.generate_overall_analysis_async(
+                analyzed_news,
+                style=self.current_style
             )
         except Exception as e:
             print(f"Ошибка при генерации общего анализа: {e}")
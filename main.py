@@ -1,7 +1,8 @@
 import json
+import orjson
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from dotenv import load_dotenv
 import logging
 from datetime import datetime, timedelta
@@ -9,8 +10,15 @@ import re
 import pytz
 from pathlib import Path
 import base64
+import hashlib
+import diskcache
+from collections import Counter, OrderedDict, defaultdict
+import ahocorasick
+import numpy as np
+from numba import njit
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 from mistralai import Mistral
 import time
@@ -23,6 +31,9 @@ load_dotenv()
 data_dir = Path("data")
 data_dir.mkdir(exist_ok=True)
 
+# Дисковый кэш эмбеддингов, сохраняется между запусками
+emb_cache = diskcache.Cache(str(data_dir / "emb_cache"))
+
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -32,6 +43,41 @@ logger = logging.getLogger(__name__)
 
 # Константы
 POSTS_TO_ANALYZE = 20  # Количество последних постов для анализа по умолчанию
+CHANNEL_FETCH_CONCURRENCY = 10  # Максимум одновременных запросов к страницам каналов
+CHANNEL_POSTS_FETCH_CONCURRENCY = 5  # Максимум каналов, посты которых собираются одновременно в main
+EMBEDDING_CONCURRENCY = 2  # Максимум одновременных запросов к API эмбеддингов
+EMBEDDING_BATCH_SIZE = 64  # Количество текстов в одном запросе к API эмбеддингов
+EMBEDDING_REQUESTS_PER_SECOND = 1  # Лимит запросов к API эмбеддингов в секунду
+EMBEDDING_MAX_CHARS = 8192  # Максимальная длина текста, отправляемого на эмбеддинг
+
+# Telegram-каналы для сбора постов: пары (название, ссылка)
+CHANNELS: tuple[tuple[str, str], ...] = (
+    ("Банк России", "https://t.me/centralbank_russia"),
+    ("Мультипликатор", "https://t.me/multievan"),
+    ("Ozon Банк", "https://t.me/ozon_bank_official"),
+    ("Простая экономика", "https://t.me/prostoecon"),
+    ("Суверенная экономика", "https://t.me/suverenka"),
+    ("Альфа-Инвестиции", "https://t.me/alfa_investments"),
+    ("Т-Инвестиции", "https://t.me/tb_invest_official"),
+    ("СЛЕЗЫ САТОШИ", "https://t.me/slezisatoshi"),
+    ("Почта Банк", "https://t.me/pochtabank"),
+    ("Газпромбанк", "https://t.me/gazprombank"),
+    ("PIFAGOR TRADE", "https://t.me/pifagortrade"),
+    ("Дерипаска", "https://t.me/olegderipaska"),
+    ("Trader 80/20", "https://t.me/tradertrend"),
+    ("На пенсию в 35 лет", "https://t.me/pensiya35"),
+    ("Coin Post", "https://t.me/coin_post"),
+    ("Больная экономика", "https://t.me/bolecon"),
+    ("КриптоБош", "https://t.me/cryptobosh"),
+    ("bitkogan", "https://t.me/bitkogan"),
+    ("INSTARDING", "https://t.me/instarding"),
+    ("Банк РНКБ", "https://t.me/rncb_official"),
+    ("СберИнвестиции", "https://t.me/sberinvestments"),
+    ("Пауки в банке", "https://t.me/bankuyte"),
+    ("ОТП Банк", "https://t.me/otpbanknews"),
+    ("Профита нет. А если найду?", "https://t.me/profitanet"),
+    ("Топор. Экономика.", "https://t.me/+OTgn6m2qBDw4ZGNi"),
+)
 
 # Пороговые значения для анализа постов
 SIMILARITY_THRESHOLD = 0.6  # Порог для определения похожих постов
@@ -39,6 +85,9 @@ MERGE_SIMILARITY_THRESHOLD = 0.65  # Порог для объединения п
 AD_THRESHOLD = 0.5  # Порог для определения рекламных постов
 ECONOMICS_RELEVANCE_THRESHOLD = 0.4  # Порог для определения релевантности экономической тематике
 AD_FILTER_THRESHOLD = 0.6  # Порог для фильтрации рекламных постов
+SIMHASH_MAX_DISTANCE = 4  # Посты с SimHash ближе этого расстояния Хэмминга считаются дубликатами
+SIMHASH_SHINGLE_SIZE = 3  # Количество слов в шингле для SimHash
+ECONOMICS_MIN_TEXT_LENGTH = 32  # Более короткие тексты не оцениваются по эмбеддингам (слишком шумно)
 
 # Веса для оценки источника
 SOURCE_WEIGHTS = {
@@ -81,6 +130,40 @@ ECONOMICS_WEIGHTS = {
     'рынки': 0.1
 }
 
+# Эталонные тексты для каждой категории
+REFERENCE_TEXTS = {
+    'экономика': [
+        "Экономический рост в стране замедлился до 1.5% в годовом выражении. Инфляция остается в целевых пределах.",
+        "Макроэкономические показатели демонстрируют стабильность. ВВП растет, инфляция под контролем.",
+        "Экономическая политика направлена на стимулирование роста и поддержание финансовой стабильности."
+    ],
+    'финансы': [
+        "Финансовый рынок показал положительную динамику. Инвесторы проявляют повышенный интерес.",
+        "Бюджетная политика остается консервативной. Налоговые поступления растут.",
+        "Финансовая система демонстрирует устойчивость. Банковский сектор укрепляется."
+    ],
+    'банки': [
+        "Банковский сектор показывает рост прибыли. Кредитный портфель расширяется.",
+        "Центральный банк сохраняет ключевую ставку. Банковская система стабильна.",
+        "Банки увеличивают объемы кредитования. Процентные ставки снижаются."
+    ],
+    'инвестиции': [
+        "Инвестиционный климат улучшается. Прямые иностранные инвестиции растут.",
+        "Инвесторы проявляют интерес к новым проектам. Инвестиционный портфель расширяется.",
+        "Инвестиционная активность в регионе увеличивается. Новые проекты привлекают капитал."
+    ],
+    'рынки': [
+        "Фондовый рынок достиг новых максимумов. Торговые объемы растут.",
+        "Рынок облигаций демонстрирует стабильность. Доходности снижаются.",
+        "Товарные рынки показывают разнонаправленную динамику. Волатильность снижается."
+    ]
+}
+
+# Категории, границы их эталонных текстов в общей матрице и веса в том же порядке
+CAT_NAMES = list(REFERENCE_TEXTS)
+CAT_OFFSETS = np.cumsum([0] + [len(refs) for refs in REFERENCE_TEXTS.values()])
+ECONOMICS_WEIGHTS_VEC = np.array([ECONOMICS_WEIGHTS[category] for category in CAT_NAMES], dtype=np.float32)
+
 # Нормализация значений
 NORMALIZATION = {
     'subscribers': 1_000_000,  # Нормализация количества подписчиков
@@ -90,11 +173,86 @@ NORMALIZATION = {
     'numbers_per_score': 10  # Количество цифр/валютных символов для максимального score
 }
 
-# Инициализация клиента Mistral
-api_keys = json.loads(os.getenv('MISTRAL_API_KEYS'))
-client = Mistral(api_key=api_keys[0])  # Используем первый ключ
+# Ключевые слова и фразы, указывающие на рекламу
+AD_KEYWORDS = {
+    'прямые_призывы': [
+        'реклама', 'рекламный', 'спонсор', 'партнер', 'сотрудничество', 'коллаборация',
+        'акция', 'скидка', 'специальное предложение', 'промокод', 'предложение дня',
+        'купить', 'заказать', 'цена', 'стоимость', 'руб', '₽', 'скидочный',
+        'инвестируй', 'инвестиции', 'брокер', 'трейдинг', 'торговля',
+        'регистрация', 'бонус', 'приз', 'выигрыш', 'розыгрыш', 'конкурс',
+        'подпишись', 'подписка', 'канал', 'каналы', 'telegram', 't.me/',
+        't.me', 'telegram.me', 'telegram.org', 'сейчaс', 'сейчас',
+        'эксклюзив', 'новинка', 'ультра', 'ограничено', 'лимитированное'
+    ],
+    'финансовые_термины': [
+        'депозит', 'вклад', 'кредит', 'займ', 'микрозайм', 'финансирование',
+        'процент', 'годовых', 'доходность', 'прибыль', 'дивиденды', 'акции',
+        'облигации', 'фонд', 'портфель', 'инвестиционный', 'брокерский', 'счет',
+        'карта', 'кэшбэк', 'бонусы', 'ликвидность', 'валюта', 'инфляция',
+        'оборот', 'рентабельность', 'ROI'
+    ],
+    'маркетинговые_слова': [
+        'эксклюзивно', 'только сейчас', 'ограниченное предложение', 'успей',
+        'последний шанс', 'специальная цена', 'выгодно', 'бесплатно',
+        'в подарок', 'при покупке', 'скидка', 'распродажа', 'новинка', 'хит продаж',
+        'бестселлер', 'популярный', 'не пропусти', 'горячее предложение', 'ограниченное время',
+        'топ предложение', 'выбор редакции', 'рекомендация эксперта'
+    ],
+    'призывы_к_действию': [
+        'нажми', 'кликни', 'перейди', 'зарегистрируйся', 'подпишись',
+        'оставь заявку', 'заполни форму', 'свяжитесь', 'позвони', 'напиши',
+        'закажи', 'купи', 'получи', 'воспользуйся', 'присоединяйся', 'запишись',
+        'узнай подробнее', 'детали', 'смотри', 'сегодня', 'не упусти шанс',
+        'подробности', 'сделай заказ'
+    ]
+}
+
+def build_ad_automaton(keywords_by_category):
+    """Строит автомат Ахо-Корасик для поиска всех рекламных ключевых слов за один проход"""
+    categories_by_keyword = {}
+    for category, keywords in keywords_by_category.items():
+        for keyword in keywords:
+            categories_by_keyword.setdefault(keyword, []).append(category)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, categories in categories_by_keyword.items():
+        automaton.add_word(keyword, (keyword, tuple(categories)))
+    automaton.make_automaton()
+    return automaton
+
+AD_AUTOMATON = build_ad_automaton(AD_KEYWORDS)
+
+# Рекламные паттерны (компилируются один раз при загрузке модуля)
+AD_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'\b\d+\s*%\s*(?:скидк|скидка|off|discount)\b',
+    r'\b(?:от|до)\s*\d+\s*(?:руб|₽|р\.)\b',
+    r'\b(?:купи|закажи|получи)\b.*\b(?:бесплатно|в подарок)\b',
+    r'\b(?:подпишись|подписка)\b.*\b(?:канал|каналы)\b',
+    r'\b(?:инвестируй|вкладывай)\b.*\b(?:сейчас|сегодня)\b',
+    r'\b(?:только|лишь)\b.*\b(?:до|по)\b.*\d{1,2}(?:\.\d{1,2})?',
+    r'\b(?:акция|спецпредложение)\b.*\b(?:действует|действует до)\b',
+    r'\b(?:получи|забери)\b.*\b(?:бонус|подарок)\b',
+    r'\b(?:регистрация|заявка)\b.*\b(?:бесплатно|без оплаты)\b'
+]]
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?%?')  # Числа и проценты
+CURRENCY_RE = re.compile(r'[$€£₽₴]')  # Валютные символы
+SUBS_RE = re.compile(r'(\d+(?:\.\d+)?[KkMm]?)\s*(?:subscribers|подписчиков)')  # Количество подписчиков
+NUM_RE = re.compile(r'(\d+(?:\.\d+)?)\s*([KkMm]?)')  # Число с необязательным суффиксом K/M
+NUM_SEPARATORS_RE = re.compile(r'[\s,]')  # Разделители разрядов в числах
+NUM_SUFFIXES = {'k': 1_000, 'm': 1_000_000}  # Множители суффиксов
+
+# Инициализация клиента Mistral (список ключей разбирается один раз при загрузке модуля)
+_API_KEYS: tuple[str, ...] = tuple(json.loads(os.environ['MISTRAL_API_KEYS']))
+_current_key_idx = 0  # Индекс ключа, которым сейчас пользуется клиент
+client = Mistral(api_key=_API_KEYS[_current_key_idx])  # Используем первый ключ
 model = "mistral-embed"
 
+def create_http_session():
+    """Создает общую HTTP-сессию с пулом соединений для всех запросов к Telegram"""
+    connector = aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=300, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector)
+
 def convert_to_preview_url(url):
     """Преобразует обычный URL канала в URL для превью"""
     if '/s/' not in url:
@@ -105,64 +263,61 @@ def convert_to_preview_url(url):
 
 def parse_number(text):
     """Парсит число из текста, обрабатывая суффиксы K и M"""
-    # Удаляем все нецифровые символы, кроме точки, K и M
-    text = text.strip().lower()
-    number = ''
-    decimal = ''
-    has_decimal = False
-    
-    for char in text:
-        if char.isdigit():
-            if has_decimal:
-                decimal += char
-            else:
-                number += char
-        elif char == '.' and not has_decimal:
-            has_decimal = True
-        elif char == 'k':
-            return int(float(number + '.' + decimal if decimal else number) * 1_000)
-        elif char == 'm':
-            return int(float(number + '.' + decimal if decimal else number) * 1_000_000)
-    
-    return int(number) if number else 0
+    # Убираем разделители разрядов и ищем число с суффиксом одним регулярным выражением
+    match = NUM_RE.search(NUM_SEPARATORS_RE.sub('', text))
+    if not match:
+        return 0
+    value = float(match.group(1))
+    return int(value * NUM_SUFFIXES.get(match.group(2).lower(), 1))
 
 async def download_image(session, url):
-    """Скачивает изображение и конвертирует его в base64"""
+    """Скачивает изображение и возвращает его байты (base64 формируется только при сохранении)"""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         async with session.get(url, headers=headers) as response:
             if response.status == 200:
-                image_data = await response.read()
-                # Конвертируем в base64
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-                return base64_image
+                return await response.read()
     except Exception as e:
         logger.error(f"Ошибка при скачивании изображения {url}: {e}")
     return None
 
+def encode_post_images(post):
+    """Возвращает копию поста для JSON, в которой скачанные изображения закодированы в base64"""
+    # Служебный флаг _has_text в итоговый JSON не попадает
+    serialized = {key: value for key, value in post.items() if key not in ("images_bytes", "_has_text")}
+    serialized["images_base64"] = [
+        {"url": image["url"], "base64": base64.b64encode(image["bytes"]).decode('utf-8')}
+        for image in post.get("images_bytes", [])
+    ]
+    return serialized
+
+def encode_posts_images(posts):
+    """Кодирует изображения списка постов в base64 (выполняется одной задачей в пуле потоков)"""
+    return [encode_post_images(post) for post in posts]
+
 def extract_post_data(post, channel_name):
     """Извлекает данные из поста"""
     # Получаем текст поста
-    text_elem = post.find('div', {'class': 'tgme_widget_message_text'})
-    text = text_elem.get_text() if text_elem else ""
+    text_elem = post.css_first('div.tgme_widget_message_text')
+    text = text_elem.text() if text_elem else ""
     
     # Получаем дату
-    date_elem = post.find('time')
+    date_elem = post.css_first('time')
     date = None
-    if date_elem and date_elem.get('datetime'):
-        date = date_elem['datetime']
+    if date_elem and date_elem.attributes.get('datetime'):
+        date = date_elem.attributes['datetime']
     
     # Получаем просмотры
-    views_elem = post.find('span', {'class': 'tgme_widget_message_views'})
-    views = parse_number(views_elem.text.strip()) if views_elem else 0
+    views_elem = post.css_first('span.tgme_widget_message_views')
+    views = parse_number(views_elem.text().strip()) if views_elem else 0
     
     # Получаем ссылки
     links = []
     seen_links = set()  # Для отслеживания дубликатов
-    for link in post.find_all('a'):
-        href = link.get('href')
+    for link in post.css('a'):
+        href = link.attributes.get('href')
         # Проверяем, что ссылка начинается с http:// или https://
         if href and (href.startswith('http://') or href.startswith('https://')):
             # Фильтруем ссылки на сам канал и дубликаты
@@ -171,149 +326,180 @@ def extract_post_data(post, channel_name):
                 seen_links.add(href)
     
     # Получаем ID поста и ссылку на пост
-    post_link = post.find('a', {'class': 'tgme_widget_message_date'})
+    post_link = post.css_first('a.tgme_widget_message_date')
     post_id = None
     post_url = None
-    if post_link and post_link.get('href'):
-        post_url = post_link['href']
+    if post_link and post_link.attributes.get('href'):
+        post_url = post_link.attributes['href']
         post_id = post_url.split('/')[-1]
     
     # Получаем изображения
-    images = []
     # Исключаем аватар канала и фото пользователей
-    excluded_classes = ['tgme_widget_message_author_photo', 'tgme_widget_message_user_photo']
+    excluded_classes = {'tgme_widget_message_author_photo', 'tgme_widget_message_user_photo'}
+    # Заранее помечаем img/a внутри тегов i с классом tgme_page_photo_image или tgme_widget_message_user_photo,
+    # чтобы не подниматься к родителям для каждого элемента
+    excluded_nodes = {
+        node.mem_id for node in post.css(
+            'i.tgme_page_photo_image img, i.tgme_page_photo_image a, '
+            'i.tgme_widget_message_user_photo img, i.tgme_widget_message_user_photo a'
+        )
+    }
     
-
-    # Ищем изображения в тегах tgme_widget_message_photo_wrap
-    for img_wrap in post.find_all('a', {'class': 'tgme_widget_message_photo_wrap'}):
-        # Извлекаем URL изображения из атрибута style
-        style = img_wrap.get('style', '')
-        if 'background-image:url(' in style:
-            # Извлекаем URL из строки background-image:url('...')
-            img_url = style.split("background-image:url('")[1].split("')")[0]
-            images.append(img_url)
-    
-    # Также ищем обычные изображения
-    for img in post.find_all(['img', 'a']):
-        # Проверяем, не находится ли изображение внутри тега i с классом tgme_page_photo_image или tgme_widget_message_user_photo
-        parent_i = img.find_parent('i', {'class': ['tgme_page_photo_image', 'tgme_widget_message_user_photo']})
-        if parent_i:
+    # Один проход по всем img и a поста
+    wrap_images = []
+    other_images = []
+    for node in post.css('img, a'):
+        node_classes = set((node.attributes.get('class') or '').split())
+        
+        # Ищем изображения в тегах tgme_widget_message_photo_wrap
+        if node.tag == 'a' and 'tgme_widget_message_photo_wrap' in node_classes:
+            # Извлекаем URL изображения из атрибута style
+            style = node.attributes.get('style') or ''
+            if 'background-image:url(' in style:
+                # Извлекаем URL из строки background-image:url('...')
+                wrap_images.append(style.split("background-image:url('")[1].split("')")[0])
+        
+        if node.mem_id in excluded_nodes or node_classes & excluded_classes:
             continue
-            
+        
         # Проверяем тег img
-        if img.name == 'img' and img.get('src'):
-            # Исключаем аватар канала и фото пользователей
-            if not any(cls in img.get('class', []) for cls in excluded_classes):
-                images.append(img['src'])
+        if node.tag == 'img' and node.attributes.get('src'):
+            other_images.append(node.attributes['src'])
         # Проверяем ссылки на изображения
-        elif img.name == 'a' and img.get('href'):
-            href = img['href']
-            # Исключаем ссылки на аватар канала и фото пользователей
-            if not any(cls in img.get('class', []) for cls in excluded_classes) and any(href.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif']):
-                images.append(href)
+        elif node.tag == 'a' and node.attributes.get('href'):
+            href = node.attributes['href']
+            if href.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
+                other_images.append(href)
+    
+    # Изображения из photo_wrap идут первыми, дубликаты отбрасываются
+    images = list(dict.fromkeys(wrap_images + other_images))
     
     return {
         "channel": channel_name,
         "post_id": post_id,
         "post_url": post_url,
         "text": text,
+        "_has_text": bool(text.strip()),  # Вычисляется один раз, чтобы не вызывать strip() на каждом этапе
         "date": date,
         "views": views,
         "links": links,
         "images": images, 
-        "images_base64": []  
+        "images_bytes": []  # Сырые байты скачанных изображений, в base64 кодируются при сохранении
     }
 
 # 2. Функция для парсинга метаданных канала через веб-скрапинг
-async def get_channel_metadata_web(channel_url, channel_name, all_posts_data, posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
+async def get_channel_metadata_web(channel_url, channel_name, all_posts_data, session, posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
     try:
         preview_url = convert_to_preview_url(channel_url)
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(preview_url, headers=headers) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    # Извлекаем количество подписчиков
-                    subscribers = 0
-                    subscribers_text = soup.find('div', {'class': 'tgme_header_counter'})
-                    if subscribers_text:
-                        # Ищем число подписчиков в тексте
-                        match = re.search(r'(\d+(?:\.\d+)?[KkMm]?)\s*(?:subscribers|подписчиков)', subscribers_text.text)
-                        if match:
-                            subscribers = parse_number(match.group(1))
-                    
-                    # Анализируем последние посты
-                    posts = soup.find_all('div', {'class': 'tgme_widget_message'})
+        async with session.get(preview_url, headers=headers) as response:
+            if response.status == 200:
+                # Передаем парсеру сырые байты без промежуточного декодирования в str
+                html = await response.read()
+                tree = LexborHTMLParser(html)
+                
+                # Извлекаем количество подписчиков
+                subscribers = 0
+                subscribers_text = tree.css_first('div.tgme_header_counter')
+                if subscribers_text:
+                    # Ищем число подписчиков в тексте
+                    match = SUBS_RE.search(subscribers_text.text())
+                    if match:
+                        subscribers = parse_number(match.group(1))
+                
+                # Анализируем последние посты
+                posts = tree.css('div.tgme_widget_message')
+                
+                now = datetime.now(pytz.UTC)
+                day_ago = now - timedelta(days=days_to_analyze)
+                
+                # Подсчитываем количество постов за указанный период
+                recent_posts = []
+                posts_with_links = 0
+                total_views = 0
+                
+                # Страница t.me/s/ упорядочена от старых постов к новым, поэтому
+                # берем последние posts_count постов и идем от новых к старым
+                reached_stale = False
+                for post in reversed(posts[-posts_count:]):  # Используем переданное количество постов
+                    # Проверяем наличие ссылок
+                    links = post.css('a')
+                    if links:
+                        posts_with_links += 1
                     
-                    now = datetime.now(pytz.UTC)
-                    day_ago = now - timedelta(days=days_to_analyze)
+                    # Подсчитываем просмотры
+                    views_elem = post.css_first('span.tgme_widget_message_views')
+                    if views_elem:
+                        views = parse_number(views_elem.text().strip())
+                        total_views += views
                     
-                    # Подсчитываем количество постов за указанный период
-                    recent_posts = []
-                    posts_with_links = 0
-                    total_views = 0
+                    # После первого устаревшего поста все следующие тоже устарели,
+                    # поэтому дату и данные таких постов не разбираем
+                    if reached_stale:
+                        continue
                     
-                    for post in posts[:posts_count]:  # Используем переданное количество постов
-                        # Проверяем наличие ссылок
-                        links = post.find_all('a')
-                        if links:
-                            posts_with_links += 1
+                    # Проверяем дату поста
+                    date_elem = post.css_first('time')
+                    if date_elem and date_elem.attributes.get('datetime'):
+                        post_date = datetime.fromisoformat(date_elem.attributes['datetime'].replace('Z', '+00:00'))
+                        if post_date <= day_ago:
+                            reached_stale = True
+                            continue
                         
-                        # Подсчитываем просмотры
-                        views_elem = post.find('span', {'class': 'tgme_widget_message_views'})
-                        if views_elem:
-                            views = parse_number(views_elem.text.strip())
-                            total_views += views
+                        recent_posts.append(post)
+                        # Извлекаем данные поста
+                        post_data = extract_post_data(post, channel_name)
                         
-                        # Проверяем дату поста
-                        date_elem = post.find('time')
-                        if date_elem and date_elem.get('datetime'):
-                            post_date = datetime.fromisoformat(date_elem['datetime'].replace('Z', '+00:00'))
-                            if post_date > day_ago:
-                                recent_posts.append(post)
-                                # Извлекаем данные поста
-                                post_data = extract_post_data(post, channel_name)
-                                
-                                # Скачиваем и конвертируем изображения в base64
-                                if post_data["images"]:
-                                    for img_url in post_data["images"]:
-                                        base64_img = await download_image(session, img_url)
-                                        if base64_img:
-                                            post_data["images_base64"].append({
-                                                "url": img_url,
-                                                "base64": base64_img
-                                            })
-                                            logger.info(f"Успешно сконвертировано изображение {img_url} в base64")
-                                
-                                all_posts_data.append(post_data)
-                                logger.info(f"Добавлен пост от {post_date} для канала {channel_name}")
-                    
-                    post_frequency = len(recent_posts)
-                    has_links_ratio = posts_with_links / min(len(posts), posts_count) if posts else 0  # Используем переданное количество постов
-                    avg_views = total_views / len(posts) if posts else 0
-                    
-                    metadata = {
-                        "subscribers": subscribers,
-                        "post_frequency_per_day": post_frequency,
-                        "has_links_ratio": has_links_ratio,
-                        "average_views": int(avg_views)
-                    }
-                    
-                    logger.info(f"Успешно получены метаданные для канала {channel_url}: {metadata}")
-                    return metadata
-                else:
-                    logger.error(f"Ошибка при получении страницы канала {preview_url}: {response.status}")
-                    return {
-                        "subscribers": 0,
-                        "post_frequency_per_day": 0,
-                        "has_links_ratio": 0,
-                        "average_views": 0
-                    }
+                        # Проверяем пост на рекламу один раз при сборе
+                        if post_data["_has_text"]:
+                            is_ad, ad_score = is_advertisement(post_data["text"], post_data["links"])
+                        else:
+                            is_ad, ad_score = False, 0.0
+                        post_data["is_advertisement"] = is_ad
+                        post_data["ad_score"] = round(ad_score, 3)
+                        
+                        # Скачиваем изображения
+                        if post_data["images"]:
+                            # Скачиваем все изображения поста параллельно
+                            downloaded = await asyncio.gather(
+                                *(download_image(session, img_url) for img_url in post_data["images"]),
+                                return_exceptions=True
+                            )
+                            for img_url, image_data in zip(post_data["images"], downloaded):
+                                if image_data and not isinstance(image_data, Exception):
+                                    post_data["images_bytes"].append({
+                                        "url": img_url,
+                                        "bytes": image_data
+                                    })
+                                    logger.info(f"Успешно скачано изображение {img_url}")
+                        
+                        all_posts_data.append(post_data)
+                        logger.info(f"Добавлен пост от {post_date} для канала {channel_name}")
+                
+                post_frequency = len(recent_posts)
+                has_links_ratio = posts_with_links / min(len(posts), posts_count) if posts else 0  # Используем переданное количество постов
+                avg_views = total_views / len(posts) if posts else 0
+                
+                metadata = {
+                    "subscribers": subscribers,
+                    "post_frequency_per_day": post_frequency,
+                    "has_links_ratio": has_links_ratio,
+                    "average_views": int(avg_views)
+                }
+                
+                logger.info(f"Успешно получены метаданные для канала {channel_url}: {metadata}")
+                return metadata
+            else:
+                logger.error(f"Ошибка при получении страницы канала {preview_url}: {response.status}")
+                return {
+                    "subscribers": 0,
+                    "post_frequency_per_day": 0,
+                    "has_links_ratio": 0,
+                    "average_views": 0
+                }
     except Exception as e:
         logger.error(f"Ошибка при получении метаданных для канала {channel_url}: {e}")
         return {
@@ -344,13 +530,29 @@ async def update_channels_metadata(channels_json):
         }
     }
     
-    for name, url in channels_urls.items():
-        logger.info(f"Получение метаданных для канала {name}")
-        channel_id = url.split('/')[-1].lower()
-        
-        # Получаем метаданные и посты за последние 24 часа
-        posts_data = []
-        metadata = await get_channel_metadata_web(url, name, posts_data)
+    # Ограничиваем количество одновременных запросов к Telegram
+    sem = asyncio.Semaphore(CHANNEL_FETCH_CONCURRENCY)
+    
+    async def fetch_one(name, url):
+        async with sem:
+            logger.info(f"Получение метаданных для канала {name}")
+            # Получаем метаданные и посты за последние 24 часа
+            posts_data = []
+            metadata = await get_channel_metadata_web(url, name, posts_data, session)
+            return name, url, metadata, posts_data
+    
+    # Одна сессия на все каналы, чтобы переиспользовать соединения
+    async with create_http_session() as session:
+        results = await asyncio.gather(*(fetch_one(name, url) for name, url in channels_urls.items()))
+    
+    # Кодируем изображения всех каналов в base64 одной задачей в пуле потоков,
+    # чтобы не блокировать цикл событий
+    loop = asyncio.get_running_loop()
+    encoded_posts = await loop.run_in_executor(
+        None, lambda: [encode_posts_images(posts_data) for *_, posts_data in results]
+    )
+    
+    for (name, url, metadata, _), posts_data in zip(results, encoded_posts):
         channels_meta[name] = metadata
         
         # Создаем запись о канале
@@ -364,15 +566,12 @@ async def update_channels_metadata(channels_json):
             },
             "posts": posts_data  # Используем полученные посты
         }
-        
-        # Добавляем задержку между запросами
-        await asyncio.sleep(1)
     
     # Сохраняем данные в файл
     if channels_data:
         channels_file = data_dir / "channels_data.json"
-        with open(channels_file, 'w', encoding='utf-8') as f:
-            json.dump(channels_data, f, ensure_ascii=False, indent=2)
+        with open(channels_file, 'wb') as f:
+            f.write(orjson.dumps(channels_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         logger.info(f"Данные каналов успешно сохранены в файл channels_data.json: "
                    f"{len(channels_urls)} каналов")
     
@@ -392,122 +591,245 @@ def estimate_source_weight(channel_info):
         3
     )
 
-def calculate_post_relevance(post, channel_weight, max_views):
-    """Рассчитывает релевантность поста на основе нескольких факторов"""
+def post_timestamp(post):
+    """Возвращает время публикации поста в секундах (NaN, если дату не удалось разобрать)"""
+    try:
+        return datetime.fromisoformat(post["date"].replace('Z', '+00:00')).timestamp()
+    except Exception as e:
+        logger.error(f"Ошибка при разборе даты поста: {e}")
+        return np.nan
+
+def build_posts_table(posts, channel_weights):
+    """Собирает поля постов в отдельные NumPy-массивы для векторных расчетов"""
+    count = len(posts)
+    return {
+        "timestamps": np.fromiter((post_timestamp(post) for post in posts), dtype=np.float64, count=count),
+        "views": np.fromiter((post["views"] for post in posts), dtype=np.int64, count=count),
+        "links": np.fromiter((len(post["links"]) for post in posts), dtype=np.int32, count=count),
+        "channel_weights": np.fromiter((channel_weights.get(post["channel"], 0) for post in posts), dtype=np.float32, count=count)
+    }
+
+def calculate_posts_relevance(table, now=None):
+    """Рассчитывает релевантность сразу для всех постов таблицы"""
+    if not table["views"].size:
+        return np.zeros(0, dtype=np.float64)
+    
+    now = (now or datetime.now(pytz.UTC)).timestamp()
+    time_score = np.maximum(0, 1 - (now - table["timestamps"]) / (24 * 3600))  # 1.0 -> 0.0 за 24 часа
+    views_score = table["views"] / max(table["views"].max(), 1)
+    links_score = np.minimum(table["links"] / NORMALIZATION['links_per_score'], 1.0)  # Максимум 1.0 за 5+ ссылок
+    
+    relevance = (
+        POST_RELEVANCE_WEIGHTS['time'] * time_score +
+        POST_RELEVANCE_WEIGHTS['channel'] * table["channel_weights"] +
+        POST_RELEVANCE_WEIGHTS['views'] * views_score +
+        POST_RELEVANCE_WEIGHTS['links'] * links_score
+    )
+    # Посты с некорректной датой получают нулевую релевантность
+    return np.nan_to_num(relevance, nan=0.0)
+
+class TokenBucket:
+    """Асинхронный ограничитель частоты запросов по алгоритму token bucket"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Забирает один токен, ожидая его пополнения при необходимости"""
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.last = time.monotonic()
+                self.tokens = 1
+            
+            self.tokens -= 1
+
+embedding_rate_limiter = TokenBucket(EMBEDDING_REQUESTS_PER_SECOND)
+
+class HashLRUCache:
+    """LRU-кэш результатов анализа, ключом служит хэш текста"""
+    
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+    
+    def get(self, key):
+        """Возвращает сохраненное значение или None"""
+        if key not in self.data:
+            return None
+        self.data.move_to_end(key)
+        return self.data[key]
+    
+    def put(self, key, value):
+        """Сохраняет значение, вытесняя самое давнее при переполнении"""
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+# Кэш результатов проверки на рекламу
+ad_cache = HashLRUCache()
+
+def text_hash(text):
+    """Возвращает компактный blake2b-хэш текста"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def embedding_cache_key(text):
+    """Возвращает ключ кэша эмбеддинга с учетом модели"""
+    return hashlib.sha256(f"{model}:{text}".encode('utf-8')).digest()
+
+async def get_text_embedding(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """Получение эмбеддингов через Mistral API с учетом ограничений
+    
+    Возвращает непрерывную float32-матрицу (по строке на текст) или None при ошибке
+    """
     try:
-        # Оценка актуальности по времени
-        post_date = datetime.fromisoformat(post["date"].replace('Z', '+00:00'))
-        now = datetime.now(pytz.UTC)
-        time_diff = now - post_date
-        time_score = max(0, 1 - (time_diff.total_seconds() / (24 * 3600)))  # 1.0 -> 0.0 за 24 часа
+        all_embeddings = [None] * len(texts)
         
-        # Оценка по просмотрам (нормализованная)
-        views_score = post["views"] / max_views if max_views > 0 else 0
+        # Берем эмбеддинги из дискового кэша, одинаковые тексты запрашиваем один раз
+        missing = {}
+        for idx, text in enumerate(texts):
+            # Вектор хранится сырыми float32-байтами и читается без копирования
+            cached = emb_cache.get(embedding_cache_key(text))
+            if cached is not None:
+                all_embeddings[idx] = np.frombuffer(cached, dtype=np.float32)
+            else:
+                missing.setdefault(text, []).append(idx)
         
-        # Оценка по наличию внешних ссылок
-        links_score = min(len(post["links"]) * (1.0 / NORMALIZATION['links_per_score']), 1.0)  # Максимум 1.0 за 5+ ссылок
+        missing_texts = list(missing)
         
-        # Итоговая оценка (можно настроить веса)
-        relevance = (
-            POST_RELEVANCE_WEIGHTS['time'] * time_score +      # Актуальность
-            POST_RELEVANCE_WEIGHTS['channel'] * channel_weight +  # Вес источника
-            POST_RELEVANCE_WEIGHTS['views'] * views_score +     # Популярность
-            POST_RELEVANCE_WEIGHTS['links'] * links_score      # Подтверждение информации
-        )
+        # Ограничиваем число одновременных запросов к API
+        sem = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
         
-        return relevance
-    except Exception as e:
-        logger.error(f"Ошибка при расчете релевантности поста: {e}")
-        return 0
-
-def get_text_embedding(texts, batch_size=5):
-    """Получение эмбеддингов через Mistral API с учетом ограничений"""
-    try:
-        all_embeddings = []
+        async def embed_batch(batch):
+            async with sem:
+                # Ждем свободный токен вместо фиксированной паузы между батчами
+                await embedding_rate_limiter.acquire()
+                # Получаем эмбеддинги для текущего батча, обрезая слишком длинные тексты
+                embeddings_response = await client.embeddings.create_async(
+                    model=model,
+                    inputs=[text[:EMBEDDING_MAX_CHARS] for text in batch]
+                )
+                return embeddings_response
         
-        # Разбиваем тексты на батчи
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            
-            # Получаем эмбеддинги для текущего батча
-            embeddings_response = client.embeddings.create(
-                model=model,
-                inputs=batch
-            )
-            
-            # Добавляем эмбеддинги из батча в общий список
-            batch_embeddings = [data.embedding for data in embeddings_response.data]
-            all_embeddings.extend(batch_embeddings)
-            
-            # Строго соблюдаем ограничение в 1 запрос в секунду
-            if i + batch_size < len(texts):
-                time.sleep(2)  # Увеличиваем задержку до 1.2 секунд между запросами
+        # Разбиваем тексты без кэша на батчи
+        batches = [missing_texts[i:i+batch_size] for i in range(0, len(missing_texts), batch_size)]
+        responses = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        
+        # Раскладываем эмбеддинги по исходным позициям и сохраняем в кэш
+        for batch, embeddings_response in zip(batches, responses):
+            for text, data in zip(batch, embeddings_response.data):
+                embedding = np.asarray(data.embedding, dtype=np.float32)
+                emb_cache.set(embedding_cache_key(text), embedding.tobytes())
+                for idx in missing[text]:
+                    all_embeddings[idx] = embedding
         
-        return all_embeddings
+        if not all_embeddings:
+            return np.empty((0, 0), dtype=np.float32)
+        # Вся дальнейшая математика сходства ведется в float32
+        return np.ascontiguousarray(np.stack(all_embeddings), dtype=np.float32)
     except Exception as e:
         logger.error(f"Ошибка при получении эмбеддингов: {e}")
         return None
 
-def find_similar_posts(posts, threshold=SIMILARITY_THRESHOLD, batch_size=5):
+def simhash(text):
+    """Вычисляет 64-битный SimHash текста по словесным шинглам"""
+    tokens = text.lower().split()
+    if not tokens:
+        return 0
+    
+    size = SIMHASH_SHINGLE_SIZE
+    shingles = [' '.join(tokens[i:i+size]) for i in range(max(len(tokens) - size + 1, 1))]
+    # Стабильный между запусками 64-битный хэш каждого шингла
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    
+    # Каждый шингл голосует за значение каждого из 64 битов
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0, bitorder='little').tobytes(), 'little')
+
+def drop_near_duplicates(posts):
+    """Отбрасывает точные и почти точные дубликаты постов по SimHash без обращений к API"""
+    # Посты группируются по старшим 8 битам отпечатка, сравнение идет только внутри группы
+    buckets = defaultdict(list)
+    unique_posts = []
+    for post in posts:
+        # Посты без текста сравнивать не по чему
+        if not post["_has_text"]:
+            unique_posts.append(post)
+            continue
+        
+        fingerprint = simhash(post["text"])
+        bucket = buckets[fingerprint >> 56]
+        if any((fingerprint ^ other).bit_count() < SIMHASH_MAX_DISTANCE for other in bucket):
+            continue
+        bucket.append(fingerprint)
+        unique_posts.append(post)
+    
+    if len(unique_posts) < len(posts):
+        logger.info(f"Отброшено {len(posts) - len(unique_posts)} дубликатов постов по SimHash")
+    return unique_posts
+
+def group_by_components(adj):
+    """Разбивает посты на группы по компонентам связности матрицы смежности"""
+    n_components, labels = connected_components(csr_matrix(adj), directed=False)
+    # Метки компонент идут в порядке первого поста группы, поэтому
+    # устойчивая сортировка сохраняет исходный порядок постов
+    order = np.argsort(labels, kind='stable')
+    bounds = np.cumsum(np.bincount(labels, minlength=n_components))[:-1]
+    return [group.tolist() for group in np.split(order, bounds)]
+
+async def find_similar_posts(posts, threshold=SIMILARITY_THRESHOLD, batch_size=EMBEDDING_BATCH_SIZE):
     """Находит семантически похожие посты используя Mistral эмбеддинги"""
     # Получаем тексты постов
     texts = [post["text"] for post in posts]
     
     # Получаем эмбеддинги для всех текстов с батчингом
-    embeddings = get_text_embedding(texts, batch_size=batch_size)
-    if not embeddings:
+    embeddings = await get_text_embedding(texts, batch_size=batch_size)
+    if embeddings is None or len(embeddings) == 0:
         return []
     
-    # Вычисляем попарную схожесть
-    from sklearn.metrics.pairwise import cosine_similarity
-    similarity_matrix = cosine_similarity(embeddings)
+    # Вычисляем попарную схожесть одним матричным умножением нормированных векторов
+    E = embeddings
+    E /= np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-12)
+    similarity_matrix = E @ E.T
+    np.fill_diagonal(similarity_matrix, 0)
+    adj = similarity_matrix > threshold
     
-    # Группируем похожие посты
-    similar_groups = []
-    used_indices = set()
-    
-    for i in range(len(posts)):
-        if i in used_indices:
-            continue
-            
-        group = [i]
-        used_indices.add(i)
-        
-        for j in range(i + 1, len(posts)):
-            if j not in used_indices and similarity_matrix[i][j] > threshold:
-                group.append(j)
-                used_indices.add(j)
-                
-        similar_groups.append(group)
+    # Группируем похожие посты по компонентам связности графа схожести
+    similar_groups = group_by_components(adj)
     
     return similar_groups
 
-def select_best_post(group_indices, posts, channel_weights):
-    """Выбирает лучший пост из группы похожих"""
-    group_posts = [posts[i] for i in group_indices]
-    
-    # Рассчитываем вес для каждого поста
-    post_scores = []
-    for post in group_posts:
-        channel_weight = channel_weights.get(post["channel"], 0)
-        # Учитываем вес канала, количество просмотров и наличие ссылок
-        score = (
-            BEST_POST_WEIGHTS['channel'] * channel_weight +
-            BEST_POST_WEIGHTS['views'] * (post["views"] / max(p["views"] for p in group_posts)) +
-            BEST_POST_WEIGHTS['links'] * min(len(post["links"]) * (1.0 / NORMALIZATION['links_per_score']), 1.0)
-        )
-        post_scores.append(score)
-    
-    # Возвращаем пост с максимальным весом
-    best_index = group_indices[post_scores.index(max(post_scores))]
-    return posts[best_index]
+def select_best_index(group_indices, table):
+    """Возвращает индекс лучшего поста в группе похожих по таблице постов"""
+    idxs = np.asarray(group_indices)
+    views = table["views"][idxs]
+    # Учитываем вес канала, количество просмотров и наличие ссылок
+    scores = (
+        BEST_POST_WEIGHTS['channel'] * table["channel_weights"][idxs] +
+        BEST_POST_WEIGHTS['views'] * (views / max(views.max(), 1)) +
+        BEST_POST_WEIGHTS['links'] * np.minimum(table["links"][idxs] / NORMALIZATION['links_per_score'], 1.0)
+    )
+    return int(idxs[scores.argmax()])
 
 async def analyze_and_sort_posts(json_file_path):
     """Анализирует, удаляет дубликаты и сортирует посты по достоверности"""
     try:
         # Загружаем данные из JSON
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(json_file_path, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Собираем все посты и рассчитываем веса каналов
         all_posts = []
@@ -525,26 +847,24 @@ async def analyze_and_sort_posts(json_file_path):
                 
                 all_posts.extend(channel_data["posts"])
         
-        # Находим группы похожих постов
-        similar_groups = find_similar_posts(all_posts)
+        # Флаг наличия текста не сохраняется в JSON, вычисляем его при загрузке
+        for post in all_posts:
+            post["_has_text"] = bool(post["text"].strip())
+        
+        # Дубликаты отбрасываем до запросов эмбеддингов
+        all_posts = drop_near_duplicates(all_posts)
         
-        # Выбираем лучшие посты из каждой группы
-        unique_posts = []
-        for group in similar_groups:
-            best_post = select_best_post(group, all_posts, channel_weights)
-            unique_posts.append(best_post)
+        # Находим группы похожих постов
+        similar_groups = await find_similar_posts(all_posts)
         
-        # Рассчитываем итоговый вес для каждого уникального поста
-        posts_with_weight = []
-        max_views = max(post["views"] for post in unique_posts) if unique_posts else 1
+        # Выбираем лучшие посты из каждой группы по общей таблице постов
+        table = build_posts_table(all_posts, channel_weights)
+        best_indices = np.fromiter((select_best_index(group, table) for group in similar_groups), dtype=np.int64, count=len(similar_groups))
+        unique_posts = [all_posts[i] for i in best_indices]
         
-        for post in unique_posts:
-            weight = calculate_post_relevance(
-                post,
-                channel_weights.get(post["channel"], 0),
-                max_views
-            )
-            posts_with_weight.append((post, weight))
+        # Рассчитываем итоговый вес для всех уникальных постов одним векторным проходом
+        weights = calculate_posts_relevance({field: values[best_indices] for field, values in table.items()})
+        posts_with_weight = list(zip(unique_posts, weights.tolist()))
         
         # Сортируем посты по весу
         sorted_posts = sorted(posts_with_weight, key=lambda x: x[1], reverse=True)
@@ -583,8 +903,8 @@ async def analyze_and_sort_posts(json_file_path):
         
         # Сохраняем отсортированные посты в JSON
         sorted_posts_file = data_dir / "sorted_posts.json"
-        with open(sorted_posts_file, 'w', encoding='utf-8') as f:
-            json.dump(sorted_posts_json, f, ensure_ascii=False, indent=2)
+        with open(sorted_posts_file, 'wb') as f:
+            f.write(orjson.dumps(sorted_posts_json, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         
         logger.info(f"Отсортированные посты сохранены в файл {sorted_posts_file}")
         
@@ -594,120 +914,74 @@ async def analyze_and_sort_posts(json_file_path):
         logger.error(f"Ошибка при анализе постов: {e}")
         return []
 
-def calculate_cosine_similarity(text1, text2):
-    """Вычисляет косинусное сходство между двумя текстами"""
-    vectorizer = TfidfVectorizer()
-    try:
-        tfidf_matrix = vectorizer.fit_transform([text1, text2])
-        return cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-    except:
-        return 0.0
-
 def merge_similar_posts(posts, similarity_threshold=MERGE_SIMILARITY_THRESHOLD):
     """Объединяет похожие посты на основе косинусного сходства"""
-    merged_posts = []
-    used_indices = set()
+    if not posts:
+        return []
     
-    for i, post1 in enumerate(posts):
-        if i in used_indices:
-            continue
-            
-        current_group = [post1]
-        used_indices.add(i)
-        
-        for j, post2 in enumerate(posts[i+1:], i+1):
-            if j in used_indices:
-                continue
-                
-            similarity = calculate_cosine_similarity(post1["text"], post2["text"])
-            if similarity >= similarity_threshold:
-                current_group.append(post2)
-                used_indices.add(j)
-        
-        if len(current_group) > 1:
+    # Обучаем TF-IDF один раз на всем корпусе и считаем матрицу сходства
+    # одним разреженным умножением (строки уже L2-нормированы векторизатором)
+    try:
+        tfidf_matrix = TfidfVectorizer().fit_transform([post["text"] for post in posts])
+        similarity_matrix = (tfidf_matrix @ tfidf_matrix.T).toarray()
+    except ValueError:
+        # Пустой словарь (например, все тексты пустые) - объединять нечего
+        similarity_matrix = np.zeros((len(posts), len(posts)))
+    
+    merged_posts = []
+    for group in group_by_components(similarity_matrix >= similarity_threshold):
+        if len(group) > 1:
             # Объединяем посты из группы
-            merged_post = merge_post_group(current_group)
+            merged_post = merge_post_group([posts[i] for i in group])
             merged_posts.append(merged_post)
         else:
-            merged_posts.append(post1)
+            merged_posts.append(posts[group[0]])
     
     return merged_posts
 
 def is_advertisement(text, links):
-    """Определяет, является ли пост рекламным"""
-    # Ключевые слова и фразы, указывающие на рекламу
-    ad_keywords = {
-        'прямые_призывы': [
-            'реклама', 'рекламный', 'спонсор', 'партнер', 'сотрудничество', 'коллаборация',
-            'акция', 'скидка', 'специальное предложение', 'промокод', 'предложение дня',
-            'купить', 'заказать', 'цена', 'стоимость', 'руб', '₽', 'скидочный',
-            'инвестируй', 'инвестиции', 'брокер', 'трейдинг', 'торговля',
-            'регистрация', 'бонус', 'приз', 'выигрыш', 'розыгрыш', 'конкурс',
-            'подпишись', 'подписка', 'канал', 'каналы', 'telegram', 't.me/',
-            't.me', 'telegram.me', 'telegram.org', 'сейчaс', 'сейчас',
-            'эксклюзив', 'новинка', 'ультра', 'ограничено', 'лимитированное'
-        ],
-        'финансовые_термины': [
-            'депозит', 'вклад', 'кредит', 'займ', 'микрозайм', 'финансирование',
-            'процент', 'годовых', 'доходность', 'прибыль', 'дивиденды', 'акции',
-            'облигации', 'фонд', 'портфель', 'инвестиционный', 'брокерский', 'счет',
-            'карта', 'кэшбэк', 'бонусы', 'ликвидность', 'валюта', 'инфляция',
-            'оборот', 'рентабельность', 'ROI'
-        ],
-        'маркетинговые_слова': [
-            'эксклюзивно', 'только сейчас', 'ограниченное предложение', 'успей',
-            'последний шанс', 'специальная цена', 'выгодно', 'бесплатно',
-            'в подарок', 'при покупке', 'скидка', 'распродажа', 'новинка', 'хит продаж',
-            'бестселлер', 'популярный', 'не пропусти', 'горячее предложение', 'ограниченное время',
-            'топ предложение', 'выбор редакции', 'рекомендация эксперта'
-        ],
-        'призывы_к_действию': [
-            'нажми', 'кликни', 'перейди', 'зарегистрируйся', 'подпишись',
-            'оставь заявку', 'заполни форму', 'свяжитесь', 'позвони', 'напиши',
-            'закажи', 'купи', 'получи', 'воспользуйся', 'присоединяйся', 'запишись',
-            'узнай подробнее', 'детали', 'смотри', 'сегодня', 'не упусти шанс',
-            'подробности', 'сделай заказ'
-        ]
-    }
+    """Определяет, является ли пост рекламным (результат кэшируется по хэшу текста)"""
+    # Результат зависит только от текста и количества ссылок
+    key = (text_hash(text), len(links))
+    result = ad_cache.get(key)
+    if result is None:
+        result = detect_advertisement(text, links)
+        ad_cache.put(key, result)
+    return result
 
-    # Проверка на наличие рекламных ключевых слов
+def detect_advertisement(text, links):
+    """Вычисляет рекламный score поста без кэширования"""
+    # Проверка на наличие рекламных ключевых слов одним проходом автомата
     text_lower = text.lower()
-    keyword_scores = {}
-    total_keyword_score = 0
+    found_keywords = {keyword: categories for _, (keyword, categories) in AD_AUTOMATON.iter(text_lower)}
+    hits = Counter(category for categories in found_keywords.values() for category in categories)
     
-    for category, keywords in ad_keywords.items():
-        matches = sum(1 for keyword in keywords if keyword in text_lower)
-        score = matches / len(keywords)
-        keyword_scores[category] = score
-        total_keyword_score += score
+    keyword_scores = {
+        category: hits[category] / len(keywords)
+        for category, keywords in AD_KEYWORDS.items()
+    }
+    total_keyword_score = sum(keyword_scores.values())
+    
+    # Без ключевых слов и ссылок итоговый score не может превысить порог,
+    # поэтому регулярные выражения можно не запускать
+    if total_keyword_score == 0 and not links:
+        return False, 0.0
     
     # Проверка на наличие множества ссылок
     link_score = min(len(links) / NORMALIZATION['links_per_score'], 1.0)  # Нормализуем до 1.0
     
     # Проверка на наличие рекламных паттернов в тексте
-    ad_patterns = [
-        r'\b\d+\s*%\s*(?:скидк|скидка|off|discount)\b',
-        r'\b(?:от|до)\s*\d+\s*(?:руб|₽|р\.)\b',
-        r'\b(?:купи|закажи|получи)\b.*\b(?:бесплатно|в подарок)\b',
-        r'\b(?:подпишись|подписка)\b.*\b(?:канал|каналы)\b',
-        r'\b(?:инвестируй|вкладывай)\b.*\b(?:сейчас|сегодня)\b',
-        r'\b(?:только|лишь)\b.*\b(?:до|по)\b.*\d{1,2}(?:\.\d{1,2})?',
-        r'\b(?:акция|спецпредложение)\b.*\b(?:действует|действует до)\b',
-        r'\b(?:получи|забери)\b.*\b(?:бонус|подарок)\b',
-        r'\b(?:регистрация|заявка)\b.*\b(?:бесплатно|без оплаты)\b'
-    ]
-    
-    pattern_matches = sum(1 for pattern in ad_patterns if re.search(pattern, text_lower, re.IGNORECASE))
-    pattern_score = pattern_matches / len(ad_patterns)
+    pattern_matches = sum(1 for pattern in AD_PATTERNS if pattern.search(text_lower))
+    pattern_score = pattern_matches / len(AD_PATTERNS)
     
     # Проверка на наличие множества цифр и валютных символов
-    number_count = len(re.findall(r'\d+(?:\.\d+)?%?', text))
-    currency_count = len(re.findall(r'[$€£₽₴]', text))
+    number_count = len(NUMBER_RE.findall(text))
+    currency_count = len(CURRENCY_RE.findall(text))
     number_score = min((number_count + currency_count) / NORMALIZATION['numbers_per_score'], 1.0)  # Нормализуем до 1.0
     
     # Вычисляем итоговый score с весами
     ad_score = (
-        AD_WEIGHTS['keywords'] * (total_keyword_score / len(ad_keywords)) +  # Вес ключевых слов
+        AD_WEIGHTS['keywords'] * (total_keyword_score / len(AD_KEYWORDS)) +  # Вес ключевых слов
         AD_WEIGHTS['links'] * link_score +                               # Вес количества ссылок
         AD_WEIGHTS['patterns'] * pattern_score +                            # Вес паттернов
         AD_WEIGHTS['numbers'] * number_score +                            # Вес цифр и валют
@@ -724,66 +998,54 @@ def is_advertisement(text, links):
     
     return is_ad, ad_score
 
-def is_economics_related(text):
-    """Проверяет релевантность поста экономической тематике используя Mistral"""
-    # Эталонные тексты для каждой категории
-    reference_texts = {
-        'экономика': [
-            "Экономический рост в стране замедлился до 1.5% в годовом выражении. Инфляция остается в целевых пределах.",
-            "Макроэкономические показатели демонстрируют стабильность. ВВП растет, инфляция под контролем.",
-            "Экономическая политика направлена на стимулирование роста и поддержание финансовой стабильности."
-        ],
-        'финансы': [
-            "Финансовый рынок показал положительную динамику. Инвесторы проявляют повышенный интерес.",
-            "Бюджетная политика остается консервативной. Налоговые поступления растут.",
-            "Финансовая система демонстрирует устойчивость. Банковский сектор укрепляется."
-        ],
-        'банки': [
-            "Банковский сектор показывает рост прибыли. Кредитный портфель расширяется.",
-            "Центральный банк сохраняет ключевую ставку. Банковская система стабильна.",
-            "Банки увеличивают объемы кредитования. Процентные ставки снижаются."
-        ],
-        'инвестиции': [
-            "Инвестиционный климат улучшается. Прямые иностранные инвестиции растут.",
-            "Инвесторы проявляют интерес к новым проектам. Инвестиционный портфель расширяется.",
-            "Инвестиционная активность в регионе увеличивается. Новые проекты привлекают капитал."
-        ],
-        'рынки': [
-            "Фондовый рынок достиг новых максимумов. Торговые объемы растут.",
-            "Рынок облигаций демонстрирует стабильность. Доходности снижаются.",
-            "Товарные рынки показывают разнонаправленную динамику. Волатильность снижается."
-        ]
-    }
-    
-    # Получаем эмбеддинги для входного текста
-    text_embedding = get_text_embedding([text], batch_size=1)
-    if not text_embedding:
-        return False, 0, {}
-    
-    text_embedding = text_embedding[0]
-    
-    # Получаем эмбеддинги для эталонных текстов по категориям
-    category_embeddings = {}
-    for category, refs in reference_texts.items():
-        # Обрабатываем эталонные тексты небольшими батчами
-        ref_embeddings = get_text_embedding(refs, batch_size=2)
-        if not ref_embeddings:
-            continue
-        category_embeddings[category] = ref_embeddings
-    
-    # Вычисляем схожесть с эталонными текстами
-    from sklearn.metrics.pairwise import cosine_similarity
-    scores = {}
+# Матрица L2-нормированных эмбеддингов всех эталонных текстов (заполняется при первом обращении)
+_REFERENCE_EMBEDDINGS = None
+
+async def _get_reference_embeddings():
+    """Возвращает матрицу эмбеддингов эталонных текстов, запрашивая их у API один раз"""
+    global _REFERENCE_EMBEDDINGS
+    if _REFERENCE_EMBEDDINGS is None:
+        # Все эталонные тексты отправляются одним запросом
+        all_refs = [ref for refs in REFERENCE_TEXTS.values() for ref in refs]
+        embeddings = await get_text_embedding(all_refs, batch_size=len(all_refs))
+        if embeddings is None:
+            return None
+        
+        # Строки идут подряд по категориям в порядке CAT_NAMES
+        vecs = embeddings
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        _REFERENCE_EMBEDDINGS = vecs
+    return _REFERENCE_EMBEDDINGS
+
+def score_econ(text_embedding, ref_mat):
+    """Оценивает готовый эмбеддинг по эталонной матрице без обращения к API"""
+    # Схожесть со всеми эталонными текстами одним матрично-векторным умножением
+    q = np.ascontiguousarray(text_embedding, dtype=np.float32)
+    q = q / max(np.linalg.norm(q), 1e-12)
+    sims = ref_mat @ q
     
-    for category, ref_embeddings in category_embeddings.items():
-        similarities = cosine_similarity([text_embedding], ref_embeddings)[0]
-        scores[category] = max(similarities)
+    # Максимумы по категориям и итоговый score считаются в скомпилированном ядре
+    is_econ, total_score, cat_max = _score_kernel(sims, ECONOMICS_WEIGHTS_VEC, CAT_OFFSETS, ECONOMICS_RELEVANCE_THRESHOLD)
     
-    # Вычисляем итоговый score
-    total_score = sum(score * ECONOMICS_WEIGHTS[category] 
-                     for category, score in scores.items())
+    # Словарь по категориям нужен только для сохранения в JSON
+    scores = dict(zip(CAT_NAMES, cat_max.tolist()))
     
-    return total_score > ECONOMICS_RELEVANCE_THRESHOLD, total_score, scores
+    return bool(is_econ), float(total_score), scores
+
+@njit(cache=True, fastmath=True)
+def _score_kernel(sims, weights_vec, cat_offsets, threshold):
+    """Вычисляет максимальную схожесть по каждой категории и взвешенный итоговый score"""
+    n_cats = cat_offsets.shape[0] - 1
+    cat_max = np.empty(n_cats, dtype=np.float32)
+    total = 0.0
+    for c in range(n_cats):
+        best = sims[cat_offsets[c]]
+        for i in range(cat_offsets[c] + 1, cat_offsets[c + 1]):
+            if sims[i] > best:
+                best = sims[i]
+        cat_max[c] = best
+        total += weights_vec[c] * best
+    return total > threshold, total, cat_max
 
 def get_post_type(category_scores):
     """
@@ -796,16 +1058,16 @@ def get_post_type(category_scores):
     if not category_scores:
         return "общий"
     
-    # Сортируем категории по score
-    sorted_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)
+    # Достаточно найти категорию с максимальным score, полная сортировка не нужна
+    top_category, top_score = max(category_scores.items(), key=lambda x: x[1])
     
     # Если максимальный score выше порога, определяем тип
-    if sorted_categories[0][1] > THRESHOLD:
-        return sorted_categories[0][0]
+    if top_score > THRESHOLD:
+        return top_category
     
     # Если есть несколько категорий с близкими scores
-    top_categories = [cat for cat, score in sorted_categories if score > THRESHOLD * 0.8]
-    if len(top_categories) > 1:
+    top_categories = sum(1 for score in category_scores.values() if score > THRESHOLD * 0.8)
+    if top_categories > 1:
         return "смешанный"
     
     return "общий"
@@ -819,39 +1081,22 @@ def merge_post_group(posts):
     merged_post = main_post.copy()
     
     # Проверяем наличие текста
-    if not merged_post.get("text", "").strip():
+    if not merged_post["_has_text"]:
         return None  # Возвращаем None для постов без текста
     
     # Объединяем просмотры
     merged_post["views"] = sum(post["views"] for post in posts)
     
-    # Объединяем ссылки
-    all_links = set()
-    for post in posts:
-        all_links.update(post.get("links", []))
-    merged_post["links"] = list(all_links)
-    
-    # Объединяем изображения
-    all_images = set()
-    all_images_base64 = []
-    for post in posts:
-        all_images.update(post.get("images", []))
-        all_images_base64.extend(post.get("images_base64", []))
-    merged_post["images"] = list(all_images)
-    merged_post["images_base64"] = all_images_base64
+    # Объединяем ссылки и изображения
+    merged_post["links"] = list(set().union(*(post.get("links", ()) for post in posts)))
+    merged_post["images"] = list(set().union(*(post.get("images", ()) for post in posts)))
+    merged_post["images_bytes"] = [image for post in posts for image in post.get("images_bytes", ())]
     
     # Проверяем на рекламу
     is_ad, ad_score = is_advertisement(merged_post["text"], merged_post["links"])
     merged_post["is_advertisement"] = is_ad
     merged_post["ad_score"] = round(ad_score, 3)
     
-    # Проверяем на релевантность экономической тематике
-    is_econ, econ_score, category_scores = is_economics_related(merged_post["text"])
-    merged_post["is_economics_related"] = is_econ
-    merged_post["economics_score"] = round(econ_score, 3)
-    merged_post["category_scores"] = {k: round(v, 3) for k, v in category_scores.items()}
-    merged_post["post_type"] = get_post_type(category_scores)
-    
     # Добавляем информацию о слиянии
     merged_post["merged_from"] = len(posts)
     merged_post["original_posts"] = [
@@ -860,7 +1105,7 @@ def merge_post_group(posts):
             "date": post["date"],
             "views": post["views"],
             "post_url": post.get("post_url", ""),
-            "is_advertisement": is_advertisement(post.get("text", ""), post.get("links", []))[0] if post.get("text", "").strip() else False
+            "is_advertisement": post.get("is_advertisement", False)
         } for post in posts
     ]
     
@@ -868,16 +1113,14 @@ def merge_post_group(posts):
 
 def get_next_api_key():
     """Получает следующий API ключ из списка"""
-    api_keys = json.loads(os.getenv('MISTRAL_API_KEYS'))
-    current_key = client.api_key
-    current_index = api_keys.index(current_key)
-    next_index = (current_index + 1) % len(api_keys)
-    return api_keys[next_index]
+    global _current_key_idx
+    _current_key_idx = (_current_key_idx + 1) % len(_API_KEYS)
+    return _API_KEYS[_current_key_idx]
 
 def handle_api_error(func):
     """Декоратор для обработки ошибок API"""
     def wrapper(*args, **kwargs):
-        max_retries = len(json.loads(os.getenv('MISTRAL_API_KEYS')))
+        max_retries = len(_API_KEYS)
         for _ in range(max_retries):
             try:
                 return func(*args, **kwargs)
@@ -895,128 +1138,36 @@ async def main(posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
         posts_count (int): Количество постов, которые должны быть в итоговом JSON
         days_to_analyze (int): Количество дней для анализа постов (по умолчанию 2)
     """
-    # JSON с каналами
-    channels_json = '''[
-                {
-                    "name": "Банк России",
-                    "url": "https://t.me/centralbank_russia"
-                },
-                {
-                    "name": "Мультипликатор",
-                    "url": "https://t.me/multievan"
-                },
-                {
-                    "name": "Ozon Банк",
-                    "url": "https://t.me/ozon_bank_official"
-                },
-                {
-                    "name": "Простая экономика",
-                    "url": "https://t.me/prostoecon"
-                },
-                {
-                    "name": "Суверенная экономика",
-                    "url": "https://t.me/suverenka"
-                },
-                {
-                    "name": "Альфа-Инвестиции",
-                    "url": "https://t.me/alfa_investments"
-                },
-                {
-                    "name": "Т-Инвестиции",
-                    "url": "https://t.me/tb_invest_official"
-                },
-                {
-                    "name": "СЛЕЗЫ САТОШИ",
-                    "url": "https://t.me/slezisatoshi"
-                },
-                {
-                    "name": "Почта Банк",
-                    "url": "https://t.me/pochtabank"
-                },
-                {
-                    "name": "Газпромбанк",
-                    "url": "https://t.me/gazprombank"
-                },
-                {
-                    "name": "PIFAGOR TRADE",
-                    "url": "https://t.me/pifagortrade"
-                },
-                {
-                    "name": "Дерипаска",
-                    "url": "https://t.me/olegderipaska"
-                },
-                {
-                    "name": "Trader 80/20",
-                    "url": "https://t.me/tradertrend"
-                },
-                {
-                    "name": "На пенсию в 35 лет",
-                    "url": "https://t.me/pensiya35"
-                },
-                {
-                    "name": "Coin Post",
-                    "url": "https://t.me/coin_post"
-                },
-                {
-                    "name": "Больная экономика",
-                    "url": "https://t.me/bolecon"
-                },
-                {
-                    "name": "КриптоБош",
-                    "url": "https://t.me/cryptobosh"
-                },
-                {
-                    "name": "bitkogan",
-                    "url": "https://t.me/bitkogan"
-                },
-                {
-                    "name": "INSTARDING",
-                    "url": "https://t.me/instarding"
-                },
-                {
-                    "name": "Банк РНКБ",
-                    "url": "https://t.me/rncb_official"
-                },
-                {
-                    "name": "СберИнвестиции",
-                    "url": "https://t.me/sberinvestments"
-                },
-                {
-                    "name": "Пауки в банке",
-                    "url": "https://t.me/bankuyte"
-                },
-                {
-                    "name": "ОТП Банк",
-                    "url": "https://t.me/otpbanknews"
-                },
-                {
-                    "name": "Профита нет. А если найду?",
-                    "url": "https://t.me/profitanet"
-                },
-                {
-                    "name": "Топор. Экономика.",
-                    "url": "https://t.me/+OTgn6m2qBDw4ZGNi"
-                }
-            ]
-            '''
     
     # Создаем структуру для хранения всех постов
     all_posts_data = []
     channels_meta = {}
-    channels_urls = load_channels_from_json(channels_json)
+    channels_urls = dict(CHANNELS)
     
     # Определяем, сколько постов нужно собрать с каждого канала
     # Берем больше постов, чтобы после фильтрации осталось достаточно
     posts_per_channel = max(20, posts_count * 2)  # Автоматически определяем количество постов для сбора
     
+    # Ограничиваем количество каналов, обрабатываемых одновременно
+    sem = asyncio.Semaphore(CHANNEL_POSTS_FETCH_CONCURRENCY)
+    
+    async def fetch_one(name, url):
+        async with sem:
+            logger.info(f"Получение метаданных для канала {name}")
+            posts_data = []
+            metadata = await get_channel_metadata_web(url, name, posts_data, session, posts_per_channel, days_to_analyze)
+            # Пауза удерживает слот семафора, сохраняя ограничение частоты запросов
+            await asyncio.sleep(1)
+            return name, metadata, posts_data
+    
     # Получаем данные каналов и посты
-    for name, url in channels_urls.items():
-        logger.info(f"Получение метаданных для канала {name}")
-        posts_data = []
-        metadata = await get_channel_metadata_web(url, name, posts_data, posts_per_channel, days_to_analyze)
+    async with create_http_session() as session:
+        results = await asyncio.gather(*(fetch_one(name, url) for name, url in channels_urls.items()))
+    
+    # Порядок результатов совпадает с порядком каналов
+    for name, metadata, posts_data in results:
         channels_meta[name] = metadata
         all_posts_data.extend(posts_data)
-        await asyncio.sleep(1)
     
     # Рассчитываем веса каналов
     channel_weights = {
@@ -1024,46 +1175,63 @@ async def main(posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
         for name, info in channels_meta.items()
     }
     
-    # Находим группы похожих постов с меньшим размером батча
-    similar_groups = find_similar_posts(all_posts_data, batch_size=5)
+    # Дубликаты отбрасываем до запросов эмбеддингов
+    all_posts_data = drop_near_duplicates(all_posts_data)
     
-    # Выбираем лучшие посты из каждой группы
-    unique_posts = []
-    for group in similar_groups:
-        best_post = select_best_post(group, all_posts_data, channel_weights)
-        unique_posts.append(best_post)
-    
-    # Рассчитываем итоговый вес для каждого уникального поста
-    posts_with_weight = []
-    max_views = max(post["views"] for post in unique_posts) if unique_posts else 1
-    
-    for post in unique_posts:
-        weight = calculate_post_relevance(
-            post,
-            channel_weights.get(post["channel"], 0),
-            max_views
-        )
-        posts_with_weight.append((post, weight))
+    # Находим группы похожих постов
+    similar_groups = await find_similar_posts(all_posts_data)
+    
+    # Выбираем лучшие посты из каждой группы по общей таблице постов
+    table = build_posts_table(all_posts_data, channel_weights)
+    best_indices = np.fromiter((select_best_index(group, table) for group in similar_groups), dtype=np.int64, count=len(similar_groups))
+    unique_posts = [all_posts_data[i] for i in best_indices]
+    
+    # Рассчитываем итоговый вес для всех уникальных постов одним векторным проходом
+    weights = calculate_posts_relevance({field: values[best_indices] for field, values in table.items()})
     
-    # Сортируем посты по весу
-    sorted_posts = sorted(posts_with_weight, key=lambda x: x[1], reverse=True)
+    # Отбираем лучшие посты по весу с запасом, так как часть отсеется как реклама
+    # (устойчивая сортировка сохраняет исходный порядок постов с равным весом)
+    order = np.argsort(-weights, kind='stable')
+    sorted_posts = [unique_posts[i] for i in order[:posts_count * 2]]
     
     # Объединяем похожие посты
     merged_posts = []
-    for post in merge_similar_posts([post for post, _ in sorted_posts]):
+    for post in merge_similar_posts(sorted_posts):
         if post is not None:  # Проверяем, что пост не был отфильтрован
             merged_posts.append(post)
     
+    # Оцениваем экономическую релевантность: эмбеддинги всех постов запрашиваются
+    # батчами, а сравнение с эталонами выполняется локально без обращений к API
+    econ_posts = [post for post in merged_posts if post["_has_text"]]
+    # Слишком короткие тексты не отправляем на эмбеддинг
+    embed_posts = [post for post in econ_posts if len(post["text"]) >= ECONOMICS_MIN_TEXT_LENGTH]
+    embeddings = await get_text_embedding([post["text"] for post in embed_posts], batch_size=32)
+    ref_mat = await _get_reference_embeddings() if embeddings is not None and len(embeddings) else None
+    econ_results = {}
+    if ref_mat is not None:
+        econ_results = {id(post): score_econ(emb, ref_mat) for post, emb in zip(embed_posts, embeddings)}
+    for post in econ_posts:
+        is_econ, econ_score, category_scores = econ_results.get(id(post), (False, 0, {}))
+        post["post_type"] = get_post_type(category_scores)
+        # Подробные оценки сохраняем только для объединенных постов, как и раньше
+        if "merged_from" in post:
+            post["is_economics_related"] = is_econ
+            post["economics_score"] = round(econ_score, 3)
+            post["category_scores"] = {k: round(v, 3) for k, v in category_scores.items()}
+    
     # Фильтруем рекламные посты с высоким рейтингом
     filtered_posts = []
     for post in merged_posts:
         # Пропускаем посты без текста
-        if not post.get("text", "").strip():
+        if not post["_has_text"]:
             continue
-            
-        is_ad, ad_score = is_advertisement(post["text"], post.get("links", []))
-        post["is_advertisement"] = is_ad
-        post["ad_score"] = round(ad_score, 3)
+        
+        # Посты проверяются на рекламу при сборе и при объединении
+        if "ad_score" not in post:
+            is_ad, ad_score = is_advertisement(post["text"], post.get("links", []))
+            post["is_advertisement"] = is_ad
+            post["ad_score"] = round(ad_score, 3)
+        is_ad, ad_score = post["is_advertisement"], post["ad_score"]
         
         # Пропускаем посты, которые точно реклама
         if is_ad and ad_score > 0.6:
@@ -1079,7 +1247,7 @@ async def main(posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
     sorted_posts_json = {
         "metadata": {
             "last_update": datetime.now(pytz.UTC).isoformat(),
-            "total_posts": len(sorted_posts),
+            "total_posts": len(unique_posts),
             "unique_posts": len(filtered_posts),
             "ad_posts_filtered": len(merged_posts) - len(filtered_posts),
             "economics_relevance_threshold": ECONOMICS_RELEVANCE_THRESHOLD,
@@ -1114,19 +1282,18 @@ async def main(posts_count=POSTS_TO_ANALYZE, days_to_analyze=2):
         "posts": []
     }
     
-    # Добавляем отфильтрованные посты в JSON
+    # Добавляем отфильтрованные посты в JSON (post_type уже определен выше)
     for i, post in enumerate(filtered_posts, 1):
         post["rank"] = i
-        # Убедимся, что post_type присутствует
-        if "post_type" not in post:
-            is_econ, _, category_scores = is_economics_related(post["text"])
-            post["post_type"] = get_post_type(category_scores)
-        sorted_posts_json["posts"].append(post)
+    
+    # Кодируем изображения в base64 в пуле потоков, не блокируя цикл событий
+    loop = asyncio.get_running_loop()
+    sorted_posts_json["posts"] = await loop.run_in_executor(None, encode_posts_images, filtered_posts)
     
     # Сохраняем отсортированные посты в JSON
     sorted_posts_file = data_dir / "sorted_posts.json"
-    with open(sorted_posts_file, 'w', encoding='utf-8') as f:
-        json.dump(sorted_posts_json, f, ensure_ascii=False, indent=2)
+    with open(sorted_posts_file, 'wb') as f:
+        f.write(orjson.dumps(sorted_posts_json, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     logger.info(f"Отсортированные и объединенные посты сохранены в файл {sorted_posts_file}")
     return sorted_posts_json
@@ -1,14 +1,35 @@
 import os
 import base64
-from typing import List, Dict, Optional, Any
-from pydantic import BaseModel
-from jinja2 import Template
+from io import BytesIO
+from typing import List, Dict, Optional, Any, Iterator, Tuple
+from dataclasses import dataclass
+from jinja2 import Template, Environment, DictLoader, FileSystemBytecodeCache
 from mistralai import Mistral
+from PIL import Image
 import re
 import json
 from enum import Enum
+from types import MappingProxyType
 import asyncio
+import threading
 import time
+import random
+import hashlib
+import tempfile
+import functools
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from email.utils import parsedate_to_datetime
+import aiofiles
+import httpx
+import diskcache
+
+# Для разбора ответов модели используем orjson, если он установлен
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 # Попробуем импортировать исключения из библиотеки Mistral AI, если они доступны
 try:
@@ -23,6 +44,9 @@ try:
     class RateLimitError(MistralRateLimitError):
         """Исключение при превышении лимита запросов API"""
         pass
+    
+    _MISTRAL_AUTH_ERRORS = (MistralAuthError,)
+    _MISTRAL_RATE_LIMIT_ERRORS = (MistralRateLimitError,)
 except ImportError:
     # Если импорт не удался, определяем собственные классы исключений
     class AuthorizationError(Exception):
@@ -32,46 +56,445 @@ except ImportError:
     class RateLimitError(Exception):
         """Исключение при превышении лимита запросов API"""
         pass
+    
+    _MISTRAL_AUTH_ERRORS = ()
+    _MISTRAL_RATE_LIMIT_ERRORS = ()
+
+
+def typed_api_error(error: Exception) -> Optional[Exception]:
+    """
+    Приводит ошибку клиента Mistral к AuthorizationError или RateLimitError
+    
+    Ошибка распознается по типу исключения и HTTP-статусу ответа, а не по тексту
+    сообщения, в котором "401" или "429" могут встретиться случайно
+    
+    Args:
+        error: Исключение, полученное от клиента
+        
+    Returns:
+        Исключение нужного типа или None, если ошибка не связана с авторизацией и лимитами
+    """
+    if isinstance(error, (AuthorizationError, RateLimitError)):
+        return error
+    if isinstance(error, _MISTRAL_RATE_LIMIT_ERRORS):
+        return RateLimitError(f"Превышен лимит запросов API: {error}")
+    if isinstance(error, _MISTRAL_AUTH_ERRORS):
+        return AuthorizationError(f"Ошибка авторизации API: {error}")
+    
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+    else:
+        # SDKError клиента mistralai хранит HTTP-статус в атрибуте status_code,
+        # некоторые клиенты - в http_status или в объекте ответа
+        status_code = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+        if status_code is None:
+            response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+            status_code = getattr(response, "status_code", None)
+    
+    if status_code == 429:
+        return RateLimitError(f"Превышен лимит запросов API: {error}")
+    if status_code in (401, 403):
+        return AuthorizationError(f"Ошибка авторизации API: {error}")
+    return None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Извлекает задержку из заголовка Retry-After ответа сервера
+    
+    Args:
+        error: Исключение, полученное от клиента
+        
+    Returns:
+        Задержка в секундах или None, если сервер ее не указал
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    
+    # httpx.HTTPStatusError хранит ответ в response, SDKError клиента mistralai - в raw_response
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    
+    # Заголовок содержит либо количество секунд, либо HTTP-дату
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Оценка стоимости запросов для ограничения по токенам в минуту
+DEFAULT_REQUEST_BURST = 5  # Сколько запросов можно выполнить сразу после простоя
+DEFAULT_TOKENS_PER_MINUTE = 500_000  # Лимит токенов модели в минуту по умолчанию
+CHARS_PER_TOKEN = 4  # Среднее количество символов на токен для оценки размера промпта
+IMAGE_TOKENS_ESTIMATE = 1000  # Оценка количества токенов на одно изображение
+
+# Дисковый кэш ответов модели, переживает перезапуски (путь не зависит от текущего каталога)
+RESPONSE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "mistral_cache")
+
+# Кэш байт-кода скомпилированных шаблонов дайджеста, переживает перезапуски
+TEMPLATE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "jinja_cache")
+# Сколько фрагментов шаблона накапливать перед выдачей при потоковом рендеринге
+DIGEST_STREAM_BUFFER_SIZE = 5
+
+# Пул HTTP-соединений для асинхронных запросов к Mistral API
+HTTP_MAX_CONNECTIONS = 32  # Максимум одновременных соединений (и keep-alive соединений) в пуле
+HTTP_TIMEOUT = 60.0  # Таймаут HTTP-запроса в секундах
+
+# Регулярные выражения для извлечения JSON из ответов модели (компилируются один раз)
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\n?(.*?)\n?```', re.DOTALL)  # Содержимое блока кода
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*({[\s\S]*?})\s*```|({[\s\S]*?})')  # JSON-объект в блоке кода или без него
+_JSON_STRUCT_RE = re.compile(r'[{}"\\]')  # Символы, меняющие вложенность объектов при потоковом разборе
+
+# Пакетный анализ новостей
+NEWS_BATCH_SIZE = 8  # Количество новостей, анализируемых одним запросом к модели
+NEWS_MAX_TOKENS_PER_ITEM = 500  # Максимальная длина ответа модели на одну новость (JSON ограниченного размера)
+NEWS_ANALYSIS_FIELDS = ("category", "title", "description", "importance")  # Обязательные поля анализа новости
+OVERALL_ANALYSIS_MAX_TOKENS = 1200  # Максимальная длина общего анализа
+OVERALL_ANALYSIS_MEMO_SIZE = 64  # Сколько последних общих анализов держать в памяти
+
+# Повторы при превышении лимита запросов
+RETRY_MAX_DELAY = 60.0  # Максимальная задержка между повторами в секундах
+RETRY_HISTORY_SIZE = 32  # Сколько последних запросов учитывать при оценке перегрузки API
+RETRY_CONGESTION_WEIGHT = 4  # Во сколько раз дополнительно растет задержка, если все последние запросы получили 429
+
+# Подготовка изображений перед отправкой в модель
+IMAGE_MAX_SIDE = 1024  # Максимальный размер длинной стороны изображения в пикселях
+IMAGE_JPEG_QUALITY = 80  # Качество JPEG при перекодировании изображения
+
+
+# Промпты модели. Постоянная часть вынесена из методов: она не собирается заново
+# при каждом вызове, а одинаковый префикс запросов позволяет провайдеру кэшировать промпт
+
+# Анализ одной новости
+_NEWS_SYSTEM_PROMPT = """Ты - эксперт по анализу новостей для профессиональных финансовых дайджестов.
+Твоя задача - проанализировать новость и предоставить следующую информацию:
+1. Основная категория новости (выбери одну): Экономика, Финансы, Рынки, Регулирование, Технологии, Компании, Международные отношения, Макроэкономика, Инвестиции
+2. Создай профессиональный и лаконичный заголовок для новости (не более 100 символов)
+3. Напиши краткое описание новости (не более 250 символов)
+4. Детально объясни, почему эта новость важна для бизнеса и инвесторов (до 600 символов)
+
+Отвечай ТОЛЬКО в указанном JSON-формате. Никаких дополнительных комментариев или пояснений."""
+
+_NEWS_USER_TEMPLATE = """Вот текст новости для анализа:
+---
+{raw_text}
+---
+
+Пожалуйста, проанализируй эту новость и предоставь информацию согласно требованиям. Ответ должен быть в строгом JSON-формате:
+{{
+  "category": "Категория",
+  "title": "Заголовок",
+  "description": "Краткое описание",
+  "importance": "Объяснение важности"
+}}"""
+
+# Пакетный анализ нескольких новостей одним запросом
+_NEWS_BATCH_SYSTEM_TEMPLATE = """Ты - эксперт по анализу новостей для профессиональных финансовых дайджестов.
+Тебе будет передано {count} пронумерованных новостей. Для КАЖДОЙ новости предоставь следующую информацию:
+1. Основная категория новости (выбери одну): Экономика, Финансы, Рынки, Регулирование, Технологии, Компании, Международные отношения, Макроэкономика, Инвестиции
+2. Создай профессиональный и лаконичный заголовок для новости (не более 100 символов)
+3. Напиши краткое описание новости (не более 250 символов)
+4. Детально объясни, почему эта новость важна для бизнеса и инвесторов (до 600 символов)
+
+Отвечай ТОЛЬКО JSON-массивом из {count} объектов, по одному на каждую новость. В поле "index" каждого объекта укажи номер новости, к которой он относится. Никаких дополнительных комментариев или пояснений."""
+
+_NEWS_BATCH_USER_TEMPLATE = """{news_block}
+
+Пожалуйста, проанализируй каждую новость и предоставь информацию согласно требованиям. Ответ должен быть в строгом JSON-формате:
+[
+  {{
+    "index": 1,
+    "category": "Категория",
+    "title": "Заголовок",
+    "description": "Краткое описание",
+    "importance": "Объяснение важности"
+  }}
+]"""
+
+# Общий анализ и прогноз по сводке новостей
+_OVERALL_ANALYSIS_SYSTEM_PROMPT = """Ты - опытный финансовый аналитик, составляющий глубокий анализ новостей для профессионального делового дайджеста.
+Твоя задача - проанализировать предоставленную сводку новостей и составить экспертное заключение:
+
+1. Выдели 2-3 ключевых тренда, которые можно распознать в указанных новостях
+2. Объясни, как эти события влияют на экономическую ситуацию и финансовые рынки
+3. Дай аргументированный прогноз дальнейшего развития ситуации и возможных последствий
+4. При необходимости, укажи потенциальные риски и возможности для бизнеса и инвесторов
+
+Твой анализ должен быть:
+- Профессиональным и глубоким, с пониманием фундаментальных экономических механизмов
+- Нейтральным и объективным, основанным на фактах
+- Структурированным, с ясной логикой и разделением на разделы с подзаголовками
+- Полезным для принятия стратегических решений
+
+НЕ НАЧИНАЙ свой ответ с заголовка "Аналитический обзор" или других заголовков - они уже будут добавлены в шаблоне дайджеста."""
+
+_OVERALL_ANALYSIS_USER_TEMPLATE = """Вот сводка последних значимых бизнес-новостей:
+
+{news_summary}
+
+Пожалуйста, проанализируй эти новости и предоставь подробный анализ текущей ситуации и потенциальных последствий."""
+
+
+def estimate_tokens(*texts: str, max_tokens: int = 0) -> int:
+    """Грубо оценивает стоимость запроса в токенах: промпт плюс максимальная длина ответа"""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + max_tokens
+
+
+class JsonObjectStream:
+    """Инкрементальный разбор JSON-объектов из потокового ответа модели
+    
+    Объекты верхнего уровня (например, элементы JSON-массива) возвращаются сразу, как только
+    модель закрывает их фигурную скобку, не дожидаясь окончания ответа. Текст вне объектов
+    (скобки массива, запятые, обрамление блока кода) пропускается
+    """
+    
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0  # Позиция, с которой продолжается просмотр буфера
+        self._depth = 0
+        self._in_string = False
+        self._skip = -1  # Позиция экранированного символа, который нужно пропустить
+    
+    def feed(self, text: str) -> List[Any]:
+        """
+        Добавляет очередной фрагмент ответа
+        
+        Args:
+            text: Фрагмент текста ответа модели
+            
+        Returns:
+            Список объектов, полностью полученных с учетом этого фрагмента
+        """
+        self._buf += text
+        objects = []
+        start = 0
+        
+        # Просматриваем только символы, влияющие на вложенность
+        for match in _JSON_STRUCT_RE.finditer(self._buf, self._pos):
+            char = match.group()
+            if match.start() == self._skip:
+                continue
+            elif self._in_string:
+                if char == "\\":
+                    # Экранируется ровно следующий символ, даже если он не структурный (\n, \u0430)
+                    self._skip = match.end()
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    start = match.start()
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(_loads(self._buf[start:match.end()]))
+                    start = match.end()
+        
+        # Полученные объекты из буфера удаляем, незавершенный оставляем
+        if self._depth == 0:
+            self._buf = ""
+            self._pos = 0
+            self._skip = -1
+        else:
+            self._buf = self._buf[start:]
+            self._pos = len(self._buf)
+            self._skip -= start
+        return objects
+
+
+# Общий фоновый цикл событий синхронных оберток NewsAnalyzer (создается при первом обращении)
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_loop_lock = threading.Lock()
+
+
+def _run_worker_loop(loop: asyncio.AbstractEventLoop):
+    """Точка входа фонового потока: крутит общий цикл событий"""
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Возвращает общий фоновый цикл событий, запуская его поток при первом вызове
+    
+    Все экземпляры NewsAnalyzer выполняют синхронные вызовы в одном потоке и одном цикле,
+    а не создают по потоку на каждый анализатор
+    
+    Returns:
+        Работающий цикл событий фонового потока
+    """
+    global _worker_loop
+    with _worker_loop_lock:
+        if _worker_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_worker_loop, args=(loop,), daemon=True, name="news-analyzer-loop").start()
+            _worker_loop = loop
+    return _worker_loop
 
 
 class RateLimiter:
-    """Класс для ограничения частоты запросов к API"""
+    """Ограничитель частоты запросов к API по алгоритму token bucket (запросы в секунду и токены в минуту)"""
     
-    def __init__(self, requests_per_second=1):
+    def __init__(self, rate: float = 1, capacity: int = 1, tokens_per_minute: Optional[int] = None):
         """
         Инициализация ограничителя запросов
         
         Args:
-            requests_per_second: Максимальное количество запросов в секунду (не более 1)
-        """
-        # Ограничиваем до 1 запроса в секунду максимум, чтобы избежать rate limit
-        requests_per_second = min(requests_per_second, 1)
-        
-        # Устанавливаем минимальный интервал между запросами - не менее 1 секунды
-        self.interval = max(1.0, 1.0 / requests_per_second)
-        self.last_request_time = 0
-        self._lock = asyncio.Lock()
-    
-    async def acquire(self):
-        """Ожидание доступности слота для запроса"""
-        async with self._lock:
-            current_time = time.time()
-            elapsed = current_time - self.last_request_time
-            
-            # Если с момента последнего запроса прошло меньше времени, чем требуемый интервал,
-            # ждем нужное количество времени
-            if elapsed < self.interval:
-                sleep_time = self.interval - elapsed
-                print(f"Ожидание {sleep_time:.2f} сек для соблюдения ограничения запросов API...")
-                await asyncio.sleep(sleep_time)
-            
-            # Обязательно ждем минимум 1 секунду между запросами
-            elif self.interval < 1.0:
-                print(f"Обязательная задержка в 1 секунду между запросами...")
-                await asyncio.sleep(1.0)
+            rate: Скорость пополнения - количество запросов в секунду в установившемся режиме
+            capacity: Емкость корзины - сколько запросов можно выполнить сразу после простоя
+            tokens_per_minute: Лимит токенов модели в минуту (None - не ограничивать)
+        """
+        self._rate = rate
+        self._capacity = capacity
+        # Корзина изначально полная, первые запросы проходят без ожидания
+        self._tokens = capacity
+        
+        # Параллельная корзина для токенов модели, пополняется равномерно в течение минуты
+        self._tpm_capacity = tokens_per_minute or 0
+        self._tpm_rate = tokens_per_minute / 60 if tokens_per_minute else None
+        self._tpm_tokens = self._tpm_capacity
+        
+        # Монотонные часы не зависят от перевода системного времени
+        self._last = time.monotonic()
+        
+        # Корзины общие для всех потоков: запросы приходят и из фонового цикла
+        # NewsAnalyzer, и из цикла вызывающего кода в другом потоке
+        self._lock = threading.Lock()
+        # Условие ожидания и таймер пробуждения у каждого цикла событий свои,
+        # ожидающие одного цикла не зависят от появления другого
+        self._conds: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Condition]" = weakref.WeakKeyDictionary()
+        self._timers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.TimerHandle]" = weakref.WeakKeyDictionary()
+    
+    def _condition(self) -> asyncio.Condition:
+        """Возвращает условие ожидания, привязанное к текущему циклу событий"""
+        loop = asyncio.get_running_loop()
+        cond = self._conds.get(loop)
+        if cond is None:
+            cond = self._conds[loop] = asyncio.Condition()
+        return cond
+    
+    def _schedule_wakeup(self, cond: asyncio.Condition, delay: float):
+        """Планирует пробуждение одного ожидающего через delay секунд, если более ранний таймер еще не запланирован"""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        timer = self._timers.get(loop)
+        if timer is not None:
+            if timer.when() <= when:
+                return
+            timer.cancel()
+        self._timers[loop] = loop.call_at(when, self._on_refill, loop, cond)
+    
+    def _on_refill(self, loop: asyncio.AbstractEventLoop, cond: asyncio.Condition):
+        """Срабатывание таймера: токен появился, будим первого ожидающего этого цикла"""
+        self._timers.pop(loop, None)
+        asyncio.ensure_future(self._notify_one(cond))
+    
+    @staticmethod
+    async def _notify_one(cond: asyncio.Condition):
+        """Будит одного ожидающего в порядке очереди"""
+        async with cond:
+            cond.notify(1)
+    
+    def _refill(self):
+        """Пополняет обе корзины пропорционально прошедшему времени"""
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        if self._tpm_rate:
+            self._tpm_tokens = min(self._tpm_capacity, self._tpm_tokens + elapsed * self._tpm_rate)
+    
+    def _wait_time(self, cost: int) -> float:
+        """Время до момента, когда в обеих корзинах хватит токенов"""
+        wait = 0.0
+        if self._tokens < 1:
+            wait = (1 - self._tokens) / self._rate
+        if self._tpm_rate and self._tpm_tokens < cost:
+            wait = max(wait, (cost - self._tpm_tokens) / self._tpm_rate)
+        return wait
+    
+    async def acquire(self, cost: int = 0):
+        """
+        Ожидание доступности слота для запроса
+        
+        Args:
+            cost: Оценка количества токенов модели, которые израсходует запрос
+        """
+        cond = self._condition()
+        async with cond:
+            # Запрос дороже всей минутной корзины иначе никогда бы не дождался своей очереди
+            if self._tpm_rate:
+                cost = min(cost, self._tpm_capacity)
+            
+            while True:
+                with self._lock:
+                    self._refill()
+                    wait = self._wait_time(cost)
+                    if wait <= 0:
+                        self._tokens -= 1
+                        if self._tpm_rate:
+                            self._tpm_tokens -= cost
+                        break
                 
-            self.last_request_time = time.time()
-            print(f"Запрос к API разрешен после задержки.")
+                print(f"Ожидание {wait:.2f} сек для соблюдения ограничения запросов API...")
+                # Ожидание освобождает блокировку; к моменту пополнения просыпается только первый
+                # в очереди, а не все ожидающие сразу. Возврат неизрасходованных токенов будит раньше срока
+                self._schedule_wakeup(cond, wait)
+                try:
+                    await cond.wait()
+                except asyncio.CancelledError:
+                    # Отмененный запрос не должен забрать пробуждение у следующего в очереди
+                    cond.notify(1)
+                    raise
+            
+            # Следующий в очереди пересчитывает время ожидания и планирует свое пробуждение
+            cond.notify(1)
+    
+    async def pause(self, seconds: float):
+        """
+        Приостанавливает выдачу слотов всем ожидающим после ответа 429
+        
+        Args:
+            seconds: Время, в течение которого новые запросы не выдаются
+        """
+        cond = self._condition()
+        async with cond:
+            with self._lock:
+                self._refill()
+                # Опустошаем корзину так, чтобы следующий слот появился через seconds
+                self._tokens = min(self._tokens, 1 - seconds * self._rate)
+            # Ожидающие пересчитают время ожидания с учетом паузы
+            cond.notify_all()
+    
+    async def reconcile(self, estimated: int, actual: Optional[int]):
+        """
+        Корректирует корзину токенов по фактическому расходу запроса
+        
+        Args:
+            estimated: Оценка, списанная при acquire
+            actual: Фактическое количество токенов из ответа API (None - оставить оценку)
+        """
+        if not self._tpm_rate or actual is None:
+            return
+        
+        cond = self._condition()
+        async with cond:
+            with self._lock:
+                self._refill()
+                self._tpm_tokens = min(self._tpm_capacity, self._tpm_tokens + estimated - actual)
+            # Если запрос оказался дешевле оценки, ожидающие могут пройти раньше
+            if actual < estimated:
+                cond.notify_all()
 
 
 class DigestStyle(str, Enum):
@@ -84,13 +507,15 @@ class DigestStyle(str, Enum):
     SOCIAL = "social"      # Стиль для социальных сетей с хештегами
 
 
-class ImageContent(BaseModel):
+@dataclass(slots=True)
+class ImageContent:
     """Модель для хранения информации об изображении"""
     path: str  # Путь к изображению
     description: Optional[str] = None  # Описание изображения, полученное от модели
 
 
-class NewsItem(BaseModel):
+@dataclass(slots=True)
+class NewsItem:
     """Модель для хранения информации о новости"""
     raw_text: str  # Исходный текст новости
     image: Optional[ImageContent] = None  # Информация об изображении, если есть
@@ -108,14 +533,49 @@ class NewsItem(BaseModel):
 class NewsAnalyzer:
     """Анализатор новостей с использованием Mistral AI"""
     
-    def __init__(self, api_key: Optional[str] = None, requests_per_second: int = 0.5):
+    # Стили, для которых достаточно небольшой быстрой модели (короткие ответы)
+    STYLE_MODELS = {
+        DigestStyle.COMPACT: "mistral-small-latest",
+        DigestStyle.SOCIAL: "mistral-small-latest",
+    }
+    
+    # Ограничение длины описания изображения: время ответа растет с числом сгенерированных токенов
+    IMAGE_MAX_TOKENS = {
+        DigestStyle.COMPACT: 30,
+        DigestStyle.SOCIAL: 120,
+        DigestStyle.STANDARD: 80,
+        DigestStyle.ANALYTICS: 300,
+        DigestStyle.MEDIA: 150,
+        DigestStyle.CARDS: 100,
+    }
+    
+    # Промпты анализа изображения для разных стилей (остальные стили используют STANDARD)
+    IMAGE_PROMPTS = {
+        DigestStyle.MEDIA: "Проанализируй это изображение в контексте экономических новостей. Опиши детально, что на нём изображено и как это относится к экономике. Используй 2-3 предложения.",
+        DigestStyle.COMPACT: "Опиши это экономическое изображение в 3-5 словах.",
+        DigestStyle.ANALYTICS: "Проанализируй графики или экономические данные на этом изображении. Выдели ключевые тренды и цифры.",
+        DigestStyle.SOCIAL: "Опиши это изображение для поста в социальной сети об экономике. Используй яркие, привлекающие внимание формулировки.",
+        DigestStyle.STANDARD: "Проанализируй это изображение в контексте экономических новостей. Выдели ключевую информацию очень кратко, в 5-7 словах.",
+    }
+    
+    def __init__(self, api_key: Optional[str] = None, requests_per_second: int = 0.5,
+                 capacity: int = DEFAULT_REQUEST_BURST,
+                 tokens_per_minute: Optional[int] = DEFAULT_TOKENS_PER_MINUTE,
+                 style_models: Optional[Dict[DigestStyle, str]] = None, verify: bool = False):
         """
         Инициализация анализатора новостей
         
         Args:
             api_key: API ключ для Mistral AI (если не указан, будет взят из переменных окружения)
-            requests_per_second: Максимальное количество запросов в секунду (по умолчанию 0.5, не более 1)
+            requests_per_second: Максимальное количество запросов в секунду (по умолчанию 0.5)
+            capacity: Сколько запросов можно выполнить сразу после простоя, не дожидаясь пополнения
+            tokens_per_minute: Лимит токенов модели в минуту (None - не ограничивать)
+            style_models: Модели для отдельных стилей, дополняющие и переопределяющие STYLE_MODELS
+            verify: Проверить соединение тестовым запросом при создании (тратит один запрос из лимита)
         """
+        # Выбор модели по стилю; для остальных стилей используются text_model/vision_model
+        self._model_for = {**self.STYLE_MODELS, **(style_models or {})}
+        
         # Получение API ключа - сначала из параметра, затем из переменных окружения
         self.api_key = api_key
         
@@ -146,15 +606,35 @@ class NewsAnalyzer:
         self.api_key = self.api_key.strip().strip('"\'')
         
         # Создаем ограничитель частоты запросов
-        self.rate_limiter = RateLimiter(requests_per_second)
+        self.rate_limiter = RateLimiter(requests_per_second, capacity=capacity, tokens_per_minute=tokens_per_minute)
         
-        # Инициализация клиента с проверкой соединения
+        # Кэш ответов модели: повторный анализ того же текста не тратит лимит запросов
+        self._cache = diskcache.Cache(RESPONSE_CACHE_DIR)
+        
+        # Последние общие анализы в памяти: один набор новостей часто оформляется в нескольких
+        # стилях подряд, и повторный анализ не должен обращаться ни к модели, ни к диску
+        self._overall_memo: OrderedDict = OrderedDict()
+        
+        # Исходы последних запросов (True - ответ 429) для адаптивной задержки повторов
+        self._recent_rate_limits: deque = deque(maxlen=RETRY_HISTORY_SIZE)
+        
+        # Асинхронные клиенты с пулами HTTP-соединений по циклам событий: соединения пула
+        # привязаны к циклу, а анализатор вызывается из разных циклов одновременно
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[Mistral, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        
+        # Постоянный фоновый цикл событий для синхронных оберток, общий для всех анализаторов
+        self._worker_loop = get_worker_loop()
+        
+        # Синхронный клиент для проверки соединения; при переключении модели он не пересоздается
+        self.client = Mistral(api_key=self.api_key)
+        self.text_model = "pixtral-large-latest"  # Начинаем с продвинутой модели
+        self.vision_model = "pixtral-large-latest"
+        
+        if not verify:
+            return
+        
+        # Проверка соединения тестовым запросом
         try:
-            # Пытаемся инициализировать клиент с предоставленным ключом
-            self.client = Mistral(api_key=self.api_key)
-            self.text_model = "pixtral-large-latest"  # Начинаем с продвинутой модели
-            self.vision_model = "pixtral-large-latest"
-            
             # Пробуем сделать тестовый запрос для проверки соединения и авторизации
             test_response = self.client.chat.complete(
                 model="mistral-small-latest",  # Используем базовую модель для теста
@@ -166,11 +646,9 @@ class NewsAnalyzer:
             
         except Exception as e:
             print(f"Ошибка при инициализации клиента Mistral AI: {e}")
-            error_message = str(e).lower()
             
             # В случае ошибки, переключаемся на самую базовую модель
             try:
-                self.client = Mistral(api_key=self.api_key)
                 self.text_model = "mistral-small-latest"
                 self.vision_model = "mistral-small-latest"
                 print(f"Переключились на базовую модель: {self.text_model}")
@@ -183,17 +661,41 @@ class NewsAnalyzer:
                 
             except Exception as e2:
                 print(f"Критическая ошибка при инициализации Mistral API: {e2}")
-                error_message = str(e2).lower()
+                typed_err = typed_api_error(e2)
                 
-                if "401" in error_message or "unauthorized" in error_message or "authentication" in error_message:
+                if isinstance(typed_err, AuthorizationError):
                     print("Ошибка авторизации API: Проверьте правильность API ключа.")
-                    raise AuthorizationError(f"Ошибка авторизации API: {e2}")
-                elif "429" in error_message or "too many requests" in error_message or "rate limit" in error_message:
+                    raise typed_err from e2
+                elif isinstance(typed_err, RateLimitError):
                     print("Ошибка API: Слишком много запросов. Возможно, достигнут лимит запросов.")
-                    raise RateLimitError(f"Превышен лимит запросов API: {e2}")
+                    raise typed_err from e2
                 else:
                     raise ValueError(f"Не удалось установить соединение с Mistral API: {e2}")
     
+    def _prepare_image(self, image_path: str, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY) -> str:
+        """
+        Уменьшает изображение до max_side по длинной стороне и перекодирует в JPEG
+        
+        Модели с поддержкой изображений тарифицируют токены пропорционально площади,
+        а исходный файл в base64 занимает на треть больше места
+        
+        Args:
+            image_path: Путь к изображению
+            max_side: Максимальный размер длинной стороны в пикселях
+            quality: Качество JPEG
+            
+        Returns:
+            Закодированное изображение в формате base64
+        """
+        with Image.open(image_path) as im:
+            im.thumbnail((max_side, max_side))
+            if im.mode not in ("RGB", "L"):
+                # JPEG не поддерживает прозрачность и палитру
+                im = im.convert("RGB")
+            buf = BytesIO()
+            im.save(buf, "JPEG", quality=quality, optimize=True)
+        return base64.b64encode(buf.getvalue()).decode('ascii')
+    
     def encode_image(self, image_path: str) -> Optional[str]:
         """
         Кодирует изображение в формат base64
@@ -205,8 +707,38 @@ class NewsAnalyzer:
             Закодированное изображение в формате base64 или None в случае ошибки
         """
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            return self._prepare_image(image_path)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл {image_path} не найден.")
+            return None
+        except Exception as e:
+            print(f"Ошибка при кодировании изображения: {e}")
+            return None
+    
+    async def encode_image_async(self, image_path: str) -> Optional[str]:
+        """
+        Асинхронно кодирует изображение в формат base64, не блокируя цикл событий
+        
+        Args:
+            image_path: Путь к изображению
+            
+        Returns:
+            Закодированное изображение в формате base64 или None в случае ошибки
+        """
+        try:
+            # Уменьшение и кодирование больших изображений выполняем в отдельном потоке
+            return await asyncio.to_thread(self._prepare_image, image_path)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл {image_path} не найден.")
+            return None
+        except OSError as e:
+            # Pillow не смог открыть файл - отправляем его как есть
+            print(f"Не удалось уменьшить изображение {image_path}: {e}")
+        
+        try:
+            async with aiofiles.open(image_path, "rb") as image_file:
+                data = await image_file.read()
+            return await asyncio.to_thread(lambda: base64.b64encode(data).decode('ascii'))
         except FileNotFoundError:
             print(f"Ошибка: Файл {image_path} не найден.")
             return None
@@ -226,26 +758,13 @@ class NewsAnalyzer:
             Описание изображения или пустая строка в случае ошибки
         """
         try:
-            base64_image = self.encode_image(image_path)
+            base64_image = await self.encode_image_async(image_path)
             
             if not base64_image:
                 return ""
             
-            # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
-            print(f"Запрашиваем разрешение на запрос к API для анализа изображения...")
-            await self.rate_limiter.acquire()
-            
             # Настраиваем промпт в зависимости от стиля
-            if style == DigestStyle.MEDIA:
-                image_prompt = "Проанализируй это изображение в контексте экономических новостей. Опиши детально, что на нём изображено и как это относится к экономике. Используй 2-3 предложения."
-            elif style == DigestStyle.COMPACT:
-                image_prompt = "Опиши это экономическое изображение в 3-5 словах."
-            elif style == DigestStyle.ANALYTICS:
-                image_prompt = "Проанализируй графики или экономические данные на этом изображении. Выдели ключевые тренды и цифры."
-            elif style == DigestStyle.SOCIAL:
-                image_prompt = "Опиши это изображение для поста в социальной сети об экономике. Используй яркие, привлекающие внимание формулировки."
-            else:  # STANDARD, CARDS и другие
-                image_prompt = "Проанализируй это изображение в контексте экономических новостей. Выдели ключевую информацию очень кратко, в 5-7 словах."
+            image_prompt = self.IMAGE_PROMPTS.get(style, self.IMAGE_PROMPTS[DigestStyle.STANDARD])
             
             messages = [
                 {
@@ -263,25 +782,40 @@ class NewsAnalyzer:
                 }
             ]
             
+            # Проверяем кэш до обращения к ограничителю запросов
+            image_hash = hashlib.sha256(base64_image.encode('ascii')).hexdigest()
+            model = self._model_for.get(style, self.vision_model)
+            cache_key = self._cache_key(model, image_prompt, image_hash)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
+            print(f"Запрашиваем разрешение на запрос к API для анализа изображения...")
+            max_tokens = self.IMAGE_MAX_TOKENS.get(style, self.IMAGE_MAX_TOKENS[DigestStyle.STANDARD])
+            cost = estimate_tokens(image_prompt, max_tokens=max_tokens) + IMAGE_TOKENS_ESTIMATE
+            await self.rate_limiter.acquire(cost)
+            
             # Вызываем API с системой автоматических повторов
             async def make_api_call():
-                chat_response = self.client.chat.complete(
-                    model=self.vision_model,
-                    messages=messages
+                chat_response = await self._loop_client().chat.complete_async(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens
                 )
                 return chat_response
             
             try:
                 response = await self.retry_with_backoff(make_api_call)
-                return response.choices[0].message.content
+                await self._reconcile_usage(cost, response)
+                description = response.choices[0].message.content
+                self._cache.set(cache_key, description)
+                return description
             except Exception as api_err:
-                error_message = str(api_err).lower()
-                if "401" in error_message or "unauthorized" in error_message or "authentication" in error_message:
-                    raise AuthorizationError(f"Ошибка авторизации API: {api_err}")
-                elif "429" in error_message or "too many requests" in error_message or "rate limit" in error_message:
-                    raise RateLimitError(f"Превышен лимит запросов API: {api_err}")
-                else:
-                    raise api_err  # Пробрасываем другие ошибки дальше
+                typed_err = typed_api_error(api_err)
+                if typed_err is None or typed_err is api_err:
+                    raise  # Пробрасываем другие ошибки дальше
+                raise typed_err from api_err
         except (AuthorizationError, RateLimitError) as e:
             print(f"Ошибка API при анализе изображения: {e}")
             return "Не удалось проанализировать изображение из-за ограничений API."
@@ -301,38 +835,8 @@ class NewsAnalyzer:
             Описание изображения или пустая строка в случае ошибки
         """
         try:
-            # Проверяем, запущен ли уже event loop
-            try:
-                loop = asyncio.get_running_loop()
-                # Если мы здесь, значит event loop уже запущен - используем threading для запуска асинхронного кода
-                import threading
-                import queue
-                
-                result_queue = queue.Queue()
-                
-                def run_in_thread():
-                    try:
-                        # Создаем новый event loop для потока
-                        new_loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(new_loop)
-                        # Запускаем асинхронную функцию
-                        result = new_loop.run_until_complete(self.analyze_image_async(image_path, style))
-                        result_queue.put(result)
-                    except Exception as e:
-                        print(f"Ошибка в потоке при анализе изображения: {e}")
-                        result_queue.put("")
-                
-                # Запускаем асинхронный код в отдельном потоке
-                thread = threading.Thread(target=run_in_thread)
-                thread.start()
-                thread.join()  # Ждем завершения потока
-                
-                # Получаем результат
-                return result_queue.get()
-                
-            except RuntimeError:
-                # Event loop не запущен, используем стандартный подход
-                return asyncio.run(self.analyze_image_async(image_path, style))
+            # Выполняем запрос в постоянном фоновом цикле событий анализатора
+            return self._run_sync(self.analyze_image_async(image_path, style))
                 
         except Exception as e:
             print(f"Ошибка при синхронном анализе изображения: {e}")
@@ -341,7 +845,7 @@ class NewsAnalyzer:
     def extract_json_from_text(self, text: str) -> Dict[str, Any]:
         """Извлекает JSON из текстового ответа модели"""
         # Ищем JSON в ответе (между ```json и ```)
-        json_match = re.search(r'```(?:json)?\n?(.*?)\n?```', text, re.DOTALL)
+        json_match = _JSON_BLOCK_RE.search(text)
         if json_match:
             json_str = json_match.group(1)
         else:
@@ -353,12 +857,76 @@ class NewsAnalyzer:
         
         try:
             # Попытка парсинга JSON
-            return json.loads(json_str)
+            return _loads(json_str)
         except json.JSONDecodeError as e:
             print(f"Ошибка при парсинге JSON: {e}")
             print(f"Исходный текст: {json_str}")
             return {}
     
+    @staticmethod
+    def _cache_key(model: str, *parts: str) -> str:
+        """Ключ кэша ответа модели по имени модели и содержимому запроса"""
+        return hashlib.sha256("|".join((model, *parts)).encode('utf-8')).hexdigest()
+    
+    def _news_cache_key(self, model: str, raw_text: str) -> str:
+        """Ключ кэша анализа одной новости, общий для одиночного и пакетного анализа"""
+        return self._cache_key(model, _NEWS_SYSTEM_PROMPT, _NEWS_USER_TEMPLATE.format(raw_text=raw_text))
+    
+    async def _reconcile_usage(self, estimated: int, response: Any):
+        """Сообщает ограничителю фактический расход токенов по полю usage ответа API"""
+        usage = getattr(response, "usage", None)
+        await self.rate_limiter.reconcile(estimated, getattr(usage, "total_tokens", None))
+    
+    def _create_client(self) -> Tuple[Mistral, httpx.AsyncClient]:
+        """Создает клиент Mistral с пулом keep-alive HTTP/2-соединений для асинхронных запросов"""
+        http = httpx.AsyncClient(
+            http2=True,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=HTTP_MAX_CONNECTIONS, max_connections=HTTP_MAX_CONNECTIONS)
+        )
+        return Mistral(api_key=self.api_key, async_client=http), http
+    
+    def _loop_client(self) -> Mistral:
+        """Возвращает асинхронный клиент текущего цикла событий, создавая его при первом запросе
+        
+        Клиент каждого цикла живет, пока не будет закрыт через aclose() в этом же цикле
+        """
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            entry = self._loop_clients[loop] = self._create_client()
+        return entry[0]
+    
+    def _run_sync(self, coro):
+        """Выполняет корутину в фоновом цикле событий и синхронно дожидается результата"""
+        return asyncio.run_coroutine_threadsafe(coro, self._worker_loop).result()
+    
+    def close(self):
+        """Закрывает пул HTTP-соединений, открытый в фоновом цикле событий
+        
+        Сам цикл общий для всех анализаторов и продолжает работать
+        """
+        if self._worker_loop in self._loop_clients:
+            self._run_sync(self.aclose())
+    
+    async def aclose(self):
+        """Закрывает пул HTTP-соединений текущего цикла событий"""
+        entry = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    def _recent_rate_limit_share(self) -> float:
+        """Доля последних запросов, получивших ответ 429"""
+        if not self._recent_rate_limits:
+            return 0.0
+        return sum(self._recent_rate_limits) / len(self._recent_rate_limits)
+    
     async def retry_with_backoff(self, func, max_retries=3, initial_delay=5.0):
         """
         Выполняет функцию с автоматическим повтором при ошибке превышения лимита запросов
@@ -376,19 +944,39 @@ class NewsAnalyzer:
         
         while True:
             try:
-                return await func()
-            except RateLimitError as e:
+                result = await func()
+                self._recent_rate_limits.append(False)
+                return result
+            except Exception as api_err:
+                # Клиент сообщает о лимите своими исключениями, поэтому приводим их к RateLimitError
+                e = typed_api_error(api_err)
+                if not isinstance(e, RateLimitError):
+                    raise
+                
+                self._recent_rate_limits.append(True)
                 retries += 1
                 if retries > max_retries:
                     print(f"Превышено максимальное количество попыток ({max_retries}). Ошибка: {e}")
-                    raise
+                    if e is api_err:
+                        raise
+                    raise e from api_err
+                
+                # Сервер может сам указать задержку, иначе - экспоненциальная со случайным разбросом,
+                # чтобы параллельные запросы не повторялись одновременно. Чем чаще последние
+                # запросы получали 429, тем сильнее растет задержка
+                delay = retry_after_seconds(api_err)
+                if delay is None:
+                    congestion = 1 + self._recent_rate_limit_share() * RETRY_CONGESTION_WEIGHT
+                    delay = min(random.uniform(current_delay / 2, current_delay) * congestion, RETRY_MAX_DELAY)
                 
                 print(f"Превышен лимит запросов (попытка {retries}/{max_retries}). "
-                      f"Ожидание {current_delay} секунд перед повторной попыткой...")
+                      f"Ожидание {delay:.1f} секунд перед повторной попыткой...")
                 
-                await asyncio.sleep(current_delay)
+                # Остальные запросы тоже ждут, а не получают тот же ответ 429
+                await self.rate_limiter.pause(delay)
+                await asyncio.sleep(delay)
                 # Увеличиваем время ожидания для следующей попытки (экспоненциальная задержка)
-                current_delay *= 2
+                current_delay = min(current_delay * 2, RETRY_MAX_DELAY)
     
     async def analyze_news_async(self, raw_text: str, image_path: Optional[str] = None, style: DigestStyle = DigestStyle.STANDARD, video_link: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -406,59 +994,56 @@ class NewsAnalyzer:
         try:
             raw_text = raw_text.strip()
             
-            # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
-            print(f"Запрашиваем разрешение на запрос к API для анализа новости...")
-            await self.rate_limiter.acquire()
-            
             # Системный промпт для анализа новости
-            system_prompt = """Ты - эксперт по анализу новостей для профессиональных финансовых дайджестов.
-Твоя задача - проанализировать новость и предоставить следующую информацию:
-1. Основная категория новости (выбери одну): Экономика, Финансы, Рынки, Регулирование, Технологии, Компании, Международные отношения, Макроэкономика, Инвестиции
-2. Создай профессиональный и лаконичный заголовок для новости (не более 100 символов)
-3. Напиши краткое описание новости (не более 250 символов)
-4. Детально объясни, почему эта новость важна для бизнеса и инвесторов (до 600 символов)
-
-Отвечай ТОЛЬКО в указанном JSON-формате. Никаких дополнительных комментариев или пояснений."""
+            system_prompt = _NEWS_SYSTEM_PROMPT
 
             # Инструкция для API
-            prompt = f"""Вот текст новости для анализа:
----
-{raw_text}
----
-
-Пожалуйста, проанализируй эту новость и предоставь информацию согласно требованиям. Ответ должен быть в строгом JSON-формате:
-{{
-  "category": "Категория",
-  "title": "Заголовок",
-  "description": "Краткое описание",
-  "importance": "Объяснение важности"
-}}"""
+            prompt = _NEWS_USER_TEMPLATE.format(raw_text=raw_text)
 
+            # Проверяем кэш до обращения к ограничителю запросов
+            model = self._model_for.get(style, self.text_model)
+            cache_key = self._news_cache_key(model, raw_text)
+            result = self._cache.get(cache_key)
+            if result is not None:
+                result["raw_text"] = raw_text
+                result["image_path"] = image_path
+                result["video_link"] = video_link
+                return result
+            
+            # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
+            print(f"Запрашиваем разрешение на запрос к API для анализа новости...")
+            cost = estimate_tokens(system_prompt, prompt, max_tokens=NEWS_MAX_TOKENS_PER_ITEM)
+            await self.rate_limiter.acquire(cost)
+            
             # Вызываем API с системой автоматических повторов
+            # (асинхронный вызов не блокирует цикл событий, поэтому пакетный анализ
+            # выполняет несколько запросов одновременно)
             async def make_api_call():
-                response = self.client.chat.complete(
-                    model=self.text_model,
+                response = await self._loop_client().chat.complete_async(
+                    model=model,
                     messages=[
                         {"role": "system", "content": system_prompt},
                         {"role": "user", "content": prompt}
                     ],
-                    max_tokens=1000
+                    max_tokens=NEWS_MAX_TOKENS_PER_ITEM
                 )
                 return response
             
             try:
                 response = await self.retry_with_backoff(make_api_call)
+                await self._reconcile_usage(cost, response)
                 
                 response_text = response.choices[0].message.content.strip()
                 
                 # Извлекаем JSON из ответа (он может быть обернут в тройные кавычки или блоки кода)
-                match = re.search(r'```(?:json)?\s*({[\s\S]*?})\s*```|({[\s\S]*?})', response_text)
+                match = _JSON_FENCE_RE.search(response_text)
                 if match:
                     json_str = match.group(1) or match.group(2)
                 else:
                     json_str = response_text
                     
-                result = json.loads(json_str)
+                result = _loads(json_str)
+                self._cache.set(cache_key, result)
                 
                 # Добавляем исходный текст и пути к медиа-файлам
                 result["raw_text"] = raw_text
@@ -467,13 +1052,10 @@ class NewsAnalyzer:
                 
                 return result
             except Exception as api_err:
-                error_message = str(api_err).lower()
-                if "401" in error_message or "unauthorized" in error_message or "authentication" in error_message:
-                    raise AuthorizationError(f"Ошибка авторизации API: {api_err}")
-                elif "429" in error_message or "too many requests" in error_message or "rate limit" in error_message:
-                    raise RateLimitError(f"Превышен лимит запросов API: {api_err}")
-                else:
-                    raise api_err  # Пробрасываем другие ошибки дальше
+                typed_err = typed_api_error(api_err)
+                if typed_err is None or typed_err is api_err:
+                    raise  # Пробрасываем другие ошибки дальше
+                raise typed_err from api_err
             
         except (AuthorizationError, RateLimitError) as e:
             print(f"Ошибка авторизации API Mistral: {e}")
@@ -502,6 +1084,206 @@ class NewsAnalyzer:
                 "video_link": video_link
             }
     
+    async def analyze_news_batch_stream_async(self, items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD,
+                                              concurrency: int = 8):
+        """
+        Асинхронно анализирует набор новостей, отдавая результаты по мере готовности
+        
+        Результаты пакетного запроса приходят по одному, пока модель еще генерирует ответ,
+        поэтому обработку первых новостей можно начинать до окончания всего анализа
+        
+        Args:
+            items: Список новостей - словари с ключами raw_text, image_path (опционально) и video_link (опционально)
+            style: Стиль анализа и отображения новостей
+            concurrency: Максимальное количество одновременных запросов к API
+            
+        Yields:
+            Пары (индекс новости в items, результат анализа) в порядке готовности
+        """
+        # Семафор ограничивает число одновременных запросов, а ограничитель
+        # частоты внутри каждого запроса по-прежнему соблюдает лимит API
+        sem = asyncio.Semaphore(concurrency)
+        ready: asyncio.Queue = asyncio.Queue()
+        
+        # Новости с ответом в кэше отдаем сразу, в пакетные запросы попадают только остальные
+        model = self._model_for.get(style, self.text_model)
+        pending = []
+        for index, item in enumerate(items):
+            raw_text = item["raw_text"].strip()
+            result = self._cache.get(self._news_cache_key(model, raw_text))
+            if result is None:
+                pending.append(index)
+                continue
+            result["raw_text"] = raw_text
+            result["image_path"] = item.get("image_path")
+            result["video_link"] = item.get("video_link")
+            ready.put_nowait((index, result))
+        
+        async def analyze_group(indices: List[int]):
+            group = [items[index] for index in indices]
+            remaining = dict(enumerate(indices))  # Позиция в группе -> индекс в items
+            try:
+                async with sem:
+                    # Несколько новостей анализируем одним запросом к модели
+                    if len(group) > 1:
+                        async for position, result in self._analyze_news_group_stream_async(group, style):
+                            ready.put_nowait((remaining.pop(position), result))
+                    
+                    # Новости, которые не удалось получить из пакетного ответа, анализируем по одной
+                    positions = list(remaining)
+                    results = await asyncio.gather(*(
+                        self.analyze_news_async(group[position]["raw_text"], group[position].get("image_path"),
+                                                style, group[position].get("video_link"))
+                        for position in positions
+                    ))
+                    for position, result in zip(positions, results):
+                        ready.put_nowait((remaining.pop(position), result))
+            except Exception as e:
+                # Ошибки группы заменяем заглушками, как и при одиночном анализе
+                for index in remaining.values():
+                    ready.put_nowait((index, e))
+        
+        tasks = [
+            asyncio.create_task(analyze_group(pending[i:i + NEWS_BATCH_SIZE]))
+            for i in range(0, len(pending), NEWS_BATCH_SIZE)
+        ]
+        try:
+            for _ in range(len(items)):
+                index, result = await ready.get()
+                if isinstance(result, Exception):
+                    print(f"Ошибка при пакетном анализе новости: {result}")
+                    raw_text = items[index]["raw_text"]
+                    result = {
+                        "raw_text": raw_text,
+                        "category": "Экономика",
+                        "title": raw_text[:50] + "..." if len(raw_text) > 50 else raw_text,
+                        "description": raw_text[:100] + "..." if len(raw_text) > 100 else raw_text,
+                        "importance": f"Ошибка анализа: {str(result)}",
+                        "image_path": items[index].get("image_path"),
+                        "video_link": items[index].get("video_link")
+                    }
+                yield index, result
+        finally:
+            # Если потребитель прервал перебор, незавершенные запросы не нужны
+            for task in tasks:
+                task.cancel()
+    
+    async def analyze_news_batch_async(self, items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD,
+                                       concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        Асинхронно анализирует набор новостей, выполняя до concurrency запросов одновременно
+        
+        Args:
+            items: Список новостей - словари с ключами raw_text, image_path (опционально) и video_link (опционально)
+            style: Стиль анализа и отображения новостей
+            concurrency: Максимальное количество одновременных запросов к API
+            
+        Returns:
+            Список результатов анализа в порядке исходных новостей
+        """
+        results = [None] * len(items)
+        async for index, result in self.analyze_news_batch_stream_async(items, style, concurrency):
+            results[index] = result
+        return results
+    
+    async def _analyze_news_group_stream_async(self, group: List[Dict[str, Any]],
+                                               style: DigestStyle = DigestStyle.STANDARD):
+        """
+        Анализирует несколько новостей одним потоковым запросом к модели
+        
+        Args:
+            group: Список новостей - словари с ключами raw_text, image_path (опционально) и video_link (опционально)
+            style: Стиль анализа (определяет модель)
+            
+        Yields:
+            Пары (позиция новости в group, результат анализа) по мере разбора ответа. Объекты
+            без номера новости или без обязательных полей пропускаются, поэтому часть новостей
+            группы может остаться без результата
+        """
+        try:
+            raw_texts = [item["raw_text"].strip() for item in group]
+            
+            # Системный промпт отправляется один раз на всю группу
+            system_prompt = _NEWS_BATCH_SYSTEM_TEMPLATE.format(count=len(group))
+            
+            news_block = "\n\n".join(
+                f"Новость {i}:\n---\n{raw_text}\n---" for i, raw_text in enumerate(raw_texts, 1)
+            )
+            prompt = _NEWS_BATCH_USER_TEMPLATE.format(news_block=news_block)
+            
+            max_tokens = NEWS_MAX_TOKENS_PER_ITEM * len(group)
+            
+            # Ожидаем доступности слота для запроса - один слот на всю группу
+            print(f"Запрашиваем разрешение на запрос к API для пакетного анализа {len(group)} новостей...")
+            cost = estimate_tokens(system_prompt, prompt, max_tokens=max_tokens)
+            await self.rate_limiter.acquire(cost)
+            
+            model = self._model_for.get(style, self.text_model)
+            
+            async def make_api_call():
+                return await self._loop_client().chat.stream_async(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens
+                )
+            
+            stream = await self.retry_with_backoff(make_api_call)
+            
+            # Элементы JSON-массива разбираем по мере генерации, не дожидаясь конца ответа
+            parser = JsonObjectStream()
+            answered = set()
+            usage = None
+            async for chunk in stream:
+                if chunk.data.usage:
+                    usage = chunk.data.usage
+                if not chunk.data.choices or not chunk.data.choices[0].delta.content or len(answered) == len(group):
+                    continue
+                for result in parser.feed(chunk.data.choices[0].delta.content):
+                    # Результат относим к новости по ее номеру, а не по порядку в ответе: модель
+                    # может пропустить или переставить новости, а ошибка сохранилась бы в кэше
+                    if not isinstance(result, dict) or not all(field in result for field in NEWS_ANALYSIS_FIELDS):
+                        continue
+                    number = result.pop("index", None)
+                    if type(number) is not int or not 1 <= number <= len(group) or number - 1 in answered:
+                        continue
+                    position = number - 1
+                    answered.add(position)
+                    
+                    # Ответ на каждую новость кэшируем так же, как при одиночном анализе
+                    self._cache.set(self._news_cache_key(model, raw_texts[position]), result)
+                    # Добавляем исходный текст и пути к медиа-файлам
+                    item = group[position]
+                    result["raw_text"] = raw_texts[position]
+                    result["image_path"] = item.get("image_path")
+                    result["video_link"] = item.get("video_link")
+                    yield position, result
+            
+            await self.rate_limiter.reconcile(cost, getattr(usage, "total_tokens", None))
+            
+            if len(answered) != len(group):
+                print(f"Пакетный ответ модели не соответствует количеству новостей ({len(answered)} из {len(group)})")
+        except Exception as e:
+            print(f"Ошибка при пакетном анализе новостей: {e}")
+    
+    def analyze_news_batch(self, items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD,
+                           concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        Синхронно анализирует набор новостей через analyze_news_batch_async
+        
+        Args:
+            items: Список новостей - словари с ключами raw_text, image_path (опционально) и video_link (опционально)
+            style: Стиль анализа и отображения новостей
+            concurrency: Максимальное количество одновременных запросов к API
+            
+        Returns:
+            Список результатов анализа в порядке исходных новостей
+        """
+        # Выполняем пакет в постоянном фоновом цикле событий анализатора
+        return self._run_sync(self.analyze_news_batch_async(items, style, concurrency))
+    
     def analyze_news(self, raw_text: str, image_path: Optional[str] = None, 
                     style: DigestStyle = DigestStyle.STANDARD, video_link: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -517,46 +1299,8 @@ class NewsAnalyzer:
             Словарь с результатами анализа
         """
         try:
-            # Проверяем, запущен ли уже event loop
-            try:
-                loop = asyncio.get_running_loop()
-                # Если мы здесь, значит event loop уже запущен - используем threading для запуска асинхронного кода
-                import threading
-                import queue
-                
-                result_queue = queue.Queue()
-                
-                def run_in_thread():
-                    try:
-                        # Создаем новый event loop для потока
-                        new_loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(new_loop)
-                        # Запускаем асинхронную функцию
-                        result = new_loop.run_until_complete(self.analyze_news_async(raw_text, image_path, style, video_link))
-                        result_queue.put(result)
-                    except Exception as e:
-                        print(f"Ошибка в потоке при анализе новости: {e}")
-                        result_queue.put({
-                            "raw_text": raw_text,
-                            "category": "Экономика",
-                            "title": raw_text[:50] + "..." if len(raw_text) > 50 else raw_text,
-                            "description": raw_text[:100] + "..." if len(raw_text) > 100 else raw_text,
-                            "importance": f"Ошибка анализа в потоке: {str(e)}",
-                            "image_path": image_path,
-                            "video_link": video_link
-                        })
-                
-                # Запускаем асинхронный код в отдельном потоке
-                thread = threading.Thread(target=run_in_thread)
-                thread.start()
-                thread.join()  # Ждем завершения потока
-                
-                # Получаем результат
-                return result_queue.get()
-                
-            except RuntimeError:
-                # Event loop не запущен, используем стандартный подход
-                return asyncio.run(self.analyze_news_async(raw_text, image_path, style, video_link))
+            # Выполняем запрос в постоянном фоновом цикле событий анализатора
+            return self._run_sync(self.analyze_news_async(raw_text, image_path, style, video_link))
                 
         except Exception as e:
             print(f"Ошибка при синхронном анализе новости: {e}")
@@ -570,105 +1314,177 @@ class NewsAnalyzer:
                 "video_link": video_link
             }
     
-    async def generate_overall_analysis_async(self, news_items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD) -> str:
+    def _remember_overall_analysis(self, cache_key: str, analysis: str):
+        """Запоминает общий анализ в памяти, вытесняя самый давно использованный"""
+        self._overall_memo[cache_key] = analysis
+        self._overall_memo.move_to_end(cache_key)
+        if len(self._overall_memo) > OVERALL_ANALYSIS_MEMO_SIZE:
+            self._overall_memo.popitem(last=False)
+    
+    # Заголовки общего анализа для разных стилей дайджеста
+    ANALYSIS_HEADERS = {
+        DigestStyle.STANDARD: "📊 **АНАЛИЗ ТЕНДЕНЦИЙ**",
+        DigestStyle.ANALYTICS: "🔍 **ЭКОНОМИЧЕСКИЙ АНАЛИЗ**",
+        DigestStyle.MEDIA: "📊 **ИТОГИ И ПРОГНОЗ**",
+        DigestStyle.SOCIAL: "💎 **АНАЛИЗ**",
+        DigestStyle.CARDS: "📝 **ОБЩИЙ ВЫВОД**",
+        DigestStyle.COMPACT: "💡 **АНАЛИЗ**",
+    }
+    
+    async def _overall_analysis_chunks(self, news_items: List[Dict[str, Any]], style: DigestStyle):
         """
-        Асинхронно создает общий анализ и прогноз на основе набора новостей
+        Отдает фрагменты общего анализа по мере генерации моделью
+        
+        Ошибки API не перехватываются: решение о заглушке принимает вызывающий код,
+        так как для потоковой выдачи и для готового текста оно разное
         
         Args:
             news_items: Список проанализированных новостей
             style: Стиль анализа
             
-        Returns:
-            Текст с общим анализом и прогнозом
+        Yields:
+            Фрагменты текста общего анализа; первым идет заголовок, соответствующий стилю
         """
-        try:
-            if not news_items:
-                return "📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nНедостаточно данных для анализа. Для создания общего анализа требуются новости."
-            
-            # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
-            print(f"Запрашиваем разрешение на запрос к API для создания общего анализа...")
-            await self.rate_limiter.acquire()
-            
-            # Создаем краткое резюме новостей
-            news_summary = "\n\n".join([
-                f"**{item.get('title', 'Без заголовка')}**\n{item.get('description', 'Нет описания')}"
-                for item in news_items
-            ])
-            
-            # Системный промпт
-            system_prompt = """Ты - опытный финансовый аналитик, составляющий глубокий анализ новостей для профессионального делового дайджеста.
-Твоя задача - проанализировать предоставленную сводку новостей и составить экспертное заключение:
-
-1. Выдели 2-3 ключевых тренда, которые можно распознать в указанных новостях
-2. Объясни, как эти события влияют на экономическую ситуацию и финансовые рынки
-3. Дай аргументированный прогноз дальнейшего развития ситуации и возможных последствий
-4. При необходимости, укажи потенциальные риски и возможности для бизнеса и инвесторов
-
-Твой анализ должен быть:
-- Профессиональным и глубоким, с пониманием фундаментальных экономических механизмов
-- Нейтральным и объективным, основанным на фактах
-- Структурированным, с ясной логикой и разделением на разделы с подзаголовками
-- Полезным для принятия стратегических решений
-
-НЕ НАЧИНАЙ свой ответ с заголовка "Аналитический обзор" или других заголовков - они уже будут добавлены в шаблоне дайджеста."""
-
-            # Формируем запрос с примерами новостей
-            prompt = f"""Вот сводка последних значимых бизнес-новостей:
-
-{news_summary}
+        if not news_items:
+            yield "📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nНедостаточно данных для анализа. Для создания общего анализа требуются новости."
+            return
+        
+        # Создаем краткое резюме новостей
+        news_summary = "\n\n".join([
+            f"**{item.get('title', 'Без заголовка')}**\n{item.get('description', 'Нет описания')}"
+            for item in news_items
+        ])
+        
+        # Системный промпт
+        system_prompt = _OVERALL_ANALYSIS_SYSTEM_PROMPT
 
-Пожалуйста, проанализируй эти новости и предоставь подробный анализ текущей ситуации и потенциальных последствий."""
+        # Формируем запрос с примерами новостей
+        prompt = _OVERALL_ANALYSIS_USER_TEMPLATE.format(news_summary=news_summary)
 
-            # Вызываем API с системой автоматических повторов
-            async def make_api_call():
-                response = self.client.chat.complete(
-                    model=self.text_model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=2000
-                )
-                return response
+        header = self.ANALYSIS_HEADERS.get(style, self.ANALYSIS_HEADERS[DigestStyle.COMPACT])
+        
+        # Проверяем кэш до обращения к ограничителю запросов
+        cache_key = self._cache_key(self.text_model, system_prompt, prompt)
+        cached = self._overall_memo.get(cache_key)
+        if cached is None:
+            cached = self._cache.get(cache_key)
+        if cached is not None:
+            self._remember_overall_analysis(cache_key, cached)
+            yield f"{header}\n\n{cached}"
+            return
+        
+        # Ожидаем доступности слота для запроса - обязательно ждем перед каждым запросом
+        print(f"Запрашиваем разрешение на запрос к API для создания общего анализа...")
+        cost = estimate_tokens(system_prompt, prompt, max_tokens=OVERALL_ANALYSIS_MAX_TOKENS)
+        await self.rate_limiter.acquire(cost)
+        
+        # Открываем потоковый ответ с системой автоматических повторов
+        async def make_api_call():
+            return await self._loop_client().chat.stream_async(
+                model=self.text_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=OVERALL_ANALYSIS_MAX_TOKENS
+            )
+        
+        try:
+            stream = await self.retry_with_backoff(make_api_call)
             
-            try:
-                response = await self.retry_with_backoff(make_api_call)
-                
-                # Добавляем заголовок к контенту в зависимости от стиля
-                api_response = response.choices[0].message.content.strip()
-                if style == DigestStyle.STANDARD:
-                    return f"📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\n{api_response}"
-                elif style == DigestStyle.ANALYTICS:
-                    return f"🔍 **ЭКОНОМИЧЕСКИЙ АНАЛИЗ**\n\n{api_response}"
-                elif style == DigestStyle.MEDIA:
-                    return f"📊 **ИТОГИ И ПРОГНОЗ**\n\n{api_response}"
-                elif style == DigestStyle.SOCIAL:
-                    return f"💎 **АНАЛИЗ**\n\n{api_response}"
-                elif style == DigestStyle.CARDS:
-                    return f"📝 **ОБЩИЙ ВЫВОД**\n\n{api_response}"
-                else:  # DigestStyle.COMPACT
-                    return f"💡 **АНАЛИЗ**\n\n{api_response}"
-            except Exception as api_err:
-                error_message = str(api_err).lower()
-                if "401" in error_message or "unauthorized" in error_message or "authentication" in error_message:
-                    raise AuthorizationError(f"Ошибка авторизации API: {api_err}")
-                elif "429" in error_message or "too many requests" in error_message or "rate limit" in error_message:
-                    raise RateLimitError(f"Превышен лимит запросов API: {api_err}")
-                else:
-                    raise api_err  # Пробрасываем другие ошибки дальше
+            # Заголовок отдаем сразу, не дожидаясь первых токенов модели
+            yield f"{header}\n\n"
             
-        except (AuthorizationError, RateLimitError) as e:
-            print(f"Ошибка API при создании общего анализа: {e}")
+            parts = []
+            usage = None
+            finish_reason = None
+            leading = True  # Пропускаем пробельные символы в начале ответа
+            async for chunk in stream:
+                if chunk.data.usage:
+                    usage = chunk.data.usage
+                if not chunk.data.choices:
+                    continue
+                choice = chunk.data.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                delta = choice.delta.content
+                if leading and delta:
+                    delta = delta.lstrip()
+                    leading = not delta
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            
+            await self.rate_limiter.reconcile(cost, getattr(usage, "total_tokens", None))
+            # В кэш попадает только полностью полученный ответ: пустой или обрезанный
+            # по лимиту длины ответ иначе выдавался бы при следующих запусках как готовый
+            analysis = "".join(parts).rstrip()
+            if analysis and finish_reason != "length":
+                self._cache.set(cache_key, analysis)
+                self._remember_overall_analysis(cache_key, analysis)
+        except Exception as api_err:
+            typed_err = typed_api_error(api_err)
+            if typed_err is None or typed_err is api_err:
+                raise  # Пробрасываем другие ошибки дальше
+            raise typed_err from api_err
+    
+    @staticmethod
+    def _overall_analysis_fallback(error: Exception) -> str:
+        """Текст-заглушка общего анализа вместо ответа, который не удалось получить"""
+        if isinstance(error, (AuthorizationError, RateLimitError)):
+            print(f"Ошибка API при создании общего анализа: {error}")
             return "📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nВ настоящее время сервис аналитики недоступен из-за технических ограничений. Пожалуйста, ознакомьтесь с новостями самостоятельно и повторите попытку позже."
+        
+        print(f"Ошибка при создании общего анализа: {error}")
+        return f"📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nАнализ текущих новостей показывает смешанную экономическую картину. Следите за дальнейшим развитием событий для принятия взвешенных финансовых решений."
+    
+    async def generate_overall_analysis_stream_async(self, news_items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD):
+        """
+        Асинхронно создает общий анализ и прогноз, отдавая текст частями по мере генерации моделью
+        
+        Args:
+            news_items: Список проанализированных новостей
+            style: Стиль анализа
             
+        Yields:
+            Фрагменты текста общего анализа; первым идет заголовок, соответствующий стилю
+        """
+        started = False
+        try:
+            async for chunk in self._overall_analysis_chunks(news_items, style):
+                started = True
+                yield chunk
+        except Exception as e:
+            fallback = self._overall_analysis_fallback(e)
+            # Если часть анализа уже отдана, заглушку не добавляем
+            if not started:
+                yield fallback
+    
+    async def generate_overall_analysis_async(self, news_items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD) -> str:
+        """
+        Асинхронно создает общий анализ и прогноз на основе набора новостей
+        
+        Args:
+            news_items: Список проанализированных новостей
+            style: Стиль анализа
+            
+        Returns:
+            Текст с общим анализом и прогнозом
+        """
+        # Собираем потоковый ответ целиком для вызывающих, которым нужен готовый текст
+        try:
+            chunks = [chunk async for chunk in self._overall_analysis_chunks(news_items, style)]
         except Exception as e:
-            print(f"Ошибка при создании общего анализа: {e}")
-            return f"📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nАнализ текущих новостей показывает смешанную экономическую картину. Следите за дальнейшим развитием событий для принятия взвешенных финансовых решений."
+            # Оборванный на середине анализ в дайджест не попадает, вместо него - заглушка
+            return self._overall_analysis_fallback(e)
+        return "".join(chunks).rstrip()
 
-    def generate_overall_analysis(self, news_items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD) -> str:
+    def _generate_overall_analysis_blocking(self, news_items: List[Dict[str, Any]], style: DigestStyle = DigestStyle.STANDARD) -> str:
         """
         Синхронно создает общий анализ и прогноз на основе набора новостей
         
+        Только для синхронного кода: из корутин нужно вызывать generate_overall_analysis_async
+        
         Args:
             news_items: Список проанализированных новостей
             style: Стиль анализа
@@ -677,38 +1493,8 @@ class NewsAnalyzer:
             Текст с общим анализом и прогнозом
         """
         try:
-            # Проверяем, запущен ли уже event loop
-            try:
-                loop = asyncio.get_running_loop()
-                # Если мы здесь, значит event loop уже запущен - используем threading для запуска асинхронного кода
-                import threading
-                import queue
-                
-                result_queue = queue.Queue()
-                
-                def run_in_thread():
-                    try:
-                        # Создаем новый event loop для потока
-                        new_loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(new_loop)
-                        # Запускаем асинхронную функцию
-                        result = new_loop.run_until_complete(self.generate_overall_analysis_async(news_items, style))
-                        result_queue.put(result)
-                    except Exception as e:
-                        print(f"Ошибка в потоке при создании общего анализа: {e}")
-                        result_queue.put("📊 **АНАЛИЗ ТЕНДЕНЦИЙ**\n\nПроизошла ошибка при обработке данных. Пожалуйста, повторите попытку позже.")
-                
-                # Запускаем асинхронный код в отдельном потоке
-                thread = threading.Thread(target=run_in_thread)
-                thread.start()
-                thread.join()  # Ждем завершения потока
-                
-                # Получаем результат
-                return result_queue.get()
-                
-            except RuntimeError:
-                # Event loop не запущен, используем стандартный подход
-                return asyncio.run(self.generate_overall_analysis_async(news_items, style))
+            # Выполняем запрос в постоянном фоновом цикле событий анализатора
+            return self._run_sync(self.generate_overall_analysis_async(news_items, style))
                 
         except Exception as e:
             print(f"Ошибка при синхронном создании общего анализа: {e}")
@@ -718,8 +1504,8 @@ class NewsAnalyzer:
 class DigestGenerator:
     """Генератор дайджеста экономических новостей для Telegram"""
     
-    # Словарь для хранения эмодзи соответствующих категориям
-    CATEGORY_EMOJI = {
+    # Словарь для хранения эмодзи соответствующих категориям (только для чтения)
+    CATEGORY_EMOJI = MappingProxyType({
         "Финансы": "💰",
         "Рынки": "📈",
         "Макроэкономика": "🌐",
@@ -732,7 +1518,14 @@ class DigestGenerator:
         "Недвижимость": "🏗️",
         "Энергетика": "⚡",
         "Технологии": "💻"
-    }
+    })
+    
+    # Названия известных категорий с эмодзи, собранные один раз
+    _FORMATTED_CATEGORY = MappingProxyType({category: f"{emoji} {category}" for category, emoji in CATEGORY_EMOJI.items()})
+    
+    # Подписи тональности для карточек (CARDS) и аналитики (ANALYTICS)
+    _SENTIMENT_BADGES = MappingProxyType({"positive": "📈 Позитивно", "negative": "📉 Негативно"})
+    _SENTIMENT_TRENDS = MappingProxyType({"positive": "📈 Позитивная динамика", "negative": "📉 Негативная динамика"})
     
     # Шаблоны для разных стилей оформления
     TEMPLATES = {
@@ -741,7 +1534,7 @@ class DigestGenerator:
 {% for category, items in news_by_category.items() %}
 {{ category }}
 {% for item in items %}
-- {{ item.title }} {% if item.link %}({{ item.link }}){% endif %} — {{ item.description }}{% if item.image_description %} 🖼 {{ item.image_description }}{% endif %}{% if item.video_link %} 🎬 {{ item.video_link }}{% endif %}
+- {{ item.title }}{% if item.link %} ({{ item.link }}){% endif %} — {{ item.description }}{% if item.image_description %} 🖼 {{ item.image_description }}{% endif %}{% if item.video_link %} 🎬 {{ item.video_link }}{% endif +%}
 {% endfor %}
 
 {% endfor %}
@@ -765,10 +1558,16 @@ class DigestGenerator:
 {% for item in items %}
 🔹 {{ item.title }}
 {{ item.description }}
-{% if item.image_description %}🖼️ {{ item.image_description }}{% endif %}
-{% if item.video_link %}🎬 {{ item.video_link }}{% endif %}
-{% if item.media_caption %}💬 {{ item.media_caption }}{% endif %}
-{{ "—"*30 }}
+{% if item.image_description %}
+🖼️ {{ item.image_description }}
+{% endif %}
+{% if item.video_link %}
+🎬 {{ item.video_link }}
+{% endif %}
+{% if item.media_caption %}
+💬 {{ item.media_caption }}
+{% endif %}
+——————————————————————————————
 {% endfor %}
 
 {% endfor %}
@@ -780,11 +1579,13 @@ class DigestGenerator:
 === {{ category }} ===
 {% for item in items %}
 ┌─────────────────────────────┐
-│ {{ item.title }} {% if item.importance and item.importance|int > 0 %}[{{ "❗" * (item.importance|int) }}]{% endif %}
+│ {{ item.title }}{{ item._importance_badge }}
 │ 
 │ {{ item.description }}
-│ {% if item.sentiment == "positive" %}📈 Позитивно{% elif item.sentiment == "negative" %}📉 Негативно{% else %}📊 Нейтрально{% endif %}
-│ {% if item.image_description %}🖼 {{ item.image_description }}{% endif %}
+│ {{ item._sentiment_badge }}
+{% if item.image_description %}
+│ 🖼 {{ item.image_description }}
+{% endif %}
 └─────────────────────────────┘
 {% endfor %}
 
@@ -796,12 +1597,14 @@ class DigestGenerator:
 {% for category, items in news_by_category.items() %}
 {{ category }}
 {% for item in items %}
-#{{ loop.index }} {{ item.title }} {% if item.importance %}[важность: {{ item.importance }}/5]{% endif %}
+#{{ loop.index }} {{ item.title }}{% if item.importance %} [важность: {{ item.importance }}/5]{% endif +%}
 📊 {{ item.description }}
-{% if item.sentiment == "positive" %}📈 Позитивная динамика{% elif item.sentiment == "negative" %}📉 Негативная динамика{% else %}⚖️ Нейтральная динамика{% endif %}
-{% if item.image_description %}📊 {{ item.image_description }}{% endif %}
-{% endfor %}
+{{ item._sentiment_trend }}
+{% if item.image_description %}
+📊 {{ item.image_description }}
+{% endif %}
 
+{% endfor %}
 {% endfor %}
 {{ overall_analysis }}""",
 
@@ -812,11 +1615,17 @@ class DigestGenerator:
 {% for item in items %}
 🔥 {{ item.title }}
 {{ item.description }}
-{% if item.hashtags %}{{ " ".join(["#" + tag.replace(" ", "") for tag in item.hashtags]) }}{% endif %}
-{% if item.image_description %}📸 {{ item.image_description }}{% endif %}
-{% if item.video_link %}📱 {{ item.video_link }}{% endif %}
-{% endfor %}
+{% if item.hashtags_str %}
+{{ item.hashtags_str }}
+{% endif %}
+{% if item.image_description %}
+📸 {{ item.image_description }}
+{% endif %}
+{% if item.video_link %}
+📱 {{ item.video_link }}
+{% endif %}
 
+{% endfor %}
 {% endfor %}
 {{ overall_analysis }}
 
@@ -837,26 +1646,105 @@ class DigestGenerator:
         self.use_emoji = use_emoji
         self.analyzer = NewsAnalyzer()
         
-        # Сохраняем шаблон и его исходный текст
-        if template_string:
-            self.template = Template(template_string)
-            self.template_source = template_string
-        else:
-            template_text = self.TEMPLATES.get(style, self.TEMPLATES[DigestStyle.STANDARD])
-            self.template = Template(template_text)
-            self.template_source = template_text
+        # Кастомный шаблон не заменяется при смене стиля
+        self._custom_template: Optional[Template] = _compile_template(template_string) if template_string else None
     
     def _add_emoji_to_category(self, category: str) -> str:
         """Добавляет эмодзи к названию категории"""
         if not self.use_emoji:
             return category
+        
+        formatted = self._FORMATTED_CATEGORY.get(category)
+        return formatted if formatted is not None else f"📌 {category}"
+    
+    def _template_for(self, style: Optional[DigestStyle]) -> Template:
+        """Возвращает шаблон для стиля, если не был передан кастомный шаблон"""
+        if self._custom_template is not None:
+            return self._custom_template
+        # Неизвестные стили оформляются как STANDARD
+        return _COMPILED_TEMPLATES.get(style or self.style, _COMPILED_TEMPLATES[DigestStyle.STANDARD])
+    
+    def _group_news_by_category(self, analyzed_news: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Группирует новости по категориям с эмодзи в названиях"""
+        news_by_category: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Категории повторяются, поэтому название с эмодзи формируем один раз на категорию
+        formatted_categories: Dict[str, str] = {}
+        
+        for news in analyzed_news:
+            category = news.get("category", "Экономика")
+            
+            # Добавляем эмодзи к категории при необходимости
+            formatted_category = formatted_categories.get(category)
+            if formatted_category is None:
+                formatted_category = formatted_categories[category] = self._add_emoji_to_category(category)
             
-        emoji = self.CATEGORY_EMOJI.get(category, "📌")
-        return f"{emoji} {category}"
+            # Отметки важности и тональности готовим заранее, чтобы не вычислять их в шаблонах.
+            # Поля только для отображения добавляем в копию: исходные словари новостей
+            # возвращаются вызывающему коду (например, в JSON-ответе веб-API)
+            importance = self._importance_level(news.get("importance")) if news.get("importance") else 0
+            sentiment = news.get("sentiment")
+            view = {
+                **news,
+                "_importance_badge": f" [{'❗' * importance}]" if importance > 0 else "",
+                "_sentiment_badge": self._SENTIMENT_BADGES.get(sentiment, "📊 Нейтрально"),
+                "_sentiment_trend": self._SENTIMENT_TRENDS.get(sentiment, "⚖️ Нейтральная динамика"),
+                # Строку хештегов собираем в Python, а не выражением шаблона для каждой новости
+                "hashtags_str": " ".join("#" + tag.replace(" ", "") for tag in news["hashtags"]) if news.get("hashtags") else ""
+            }
+            
+            news_by_category[formatted_category].append(view)
+        
+        return news_by_category
     
-    def generate_digest(self, analyzed_news: List[Dict[str, Any]], digest_number: int, style: Optional[DigestStyle] = None) -> str:
+    @staticmethod
+    def _importance_level(value: Any) -> int:
+        """Приводит важность к целому числу так же, как фильтр int в Jinja (0, если не число)"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            try:
+                return int(float(value))
+            except (TypeError, ValueError, OverflowError):
+                return 0
+    
+    @staticmethod
+    def _render_standard(news_by_category: Dict[str, List[Dict[str, Any]]], digest_number: int, overall_analysis: str) -> str:
+        """Собирает дайджест в стиле STANDARD напрямую, повторяя вывод шаблона TEMPLATES[DigestStyle.STANDARD]"""
+        parts = [f"Экономический дайджест (#{digest_number})\n\n"]
+        for category, items in news_by_category.items():
+            parts.append(f"{category}\n")
+            for item in items:
+                parts.append(f"- {item.get('title', '')}")
+                if item.get("link"):
+                    parts.append(f" ({item['link']})")
+                parts.append(f" — {item.get('description', '')}")
+                if item.get("image_description"):
+                    parts.append(f" 🖼 {item['image_description']}")
+                if item.get("video_link"):
+                    parts.append(f" 🎬 {item['video_link']}")
+                parts.append("\n")
+            parts.append("\n")
+        parts.append(str(overall_analysis))
+        return "".join(parts)
+    
+    @staticmethod
+    def _render_compact(news_by_category: Dict[str, List[Dict[str, Any]]], digest_number: int, overall_analysis: str) -> str:
+        """Собирает дайджест в стиле COMPACT напрямую, повторяя вывод шаблона TEMPLATES[DigestStyle.COMPACT]"""
+        parts = [f"Дайджест #{digest_number}\n\n"]
+        for category, items in news_by_category.items():
+            parts.append(f"{category}\n")
+            parts.extend(f"• {item.get('title', '')} — {item.get('description', '')}\n" for item in items)
+            parts.append("\n")
+        parts.append(str(overall_analysis))
+        return "".join(parts)
+    
+    async def generate_digest_async(self, analyzed_news: List[Dict[str, Any]], digest_number: int,
+                                    style: Optional[DigestStyle] = None) -> str:
         """
-        Генерирует дайджест новостей по шаблону
+        Асинхронно генерирует дайджест новостей по шаблону
+        
+        Общий анализ запрашивается у модели сразу, а группировка новостей выполняется,
+        пока модель генерирует ответ
         
         Args:
             analyzed_news: Список проанализированных новостей
@@ -869,37 +1757,108 @@ class DigestGenerator:
         # Используем переданный стиль или стиль по умолчанию
         current_style = style or self.style
         
-        # Если передан стиль, отличный от установленного при инициализации,
-        # и не был передан кастомный шаблон, обновляем шаблон
-        if style and style != self.style and self.template_source == self.TEMPLATES.get(self.style, self.TEMPLATES[DigestStyle.STANDARD]):
-            template_text = self.TEMPLATES.get(style, self.TEMPLATES[DigestStyle.STANDARD])
-            self.template = Template(template_text)
-            self.template_source = template_text
-            self.style = style
-        
-        # Группировка новостей по категориям
-        news_by_category: Dict[str, List[Dict[str, Any]]] = {}
+        # Создаем общий анализ и прогноз с учетом выбранного стиля
+        analysis_task = asyncio.create_task(self.analyzer.generate_overall_analysis_async(analyzed_news, current_style))
         
-        for news in analyzed_news:
-            category = news.get("category", "Экономика")
-            
-            # Добавляем эмодзи к категории при необходимости
-            formatted_category = self._add_emoji_to_category(category)
+        try:
+            template = self._template_for(current_style)
             
-            if formatted_category not in news_by_category:
-                news_by_category[formatted_category] = []
-                
-            news_by_category[formatted_category].append(news)
+            # Группировка новостей по категориям
+            news_by_category = self._group_news_by_category(analyzed_news)
+        except Exception:
+            analysis_task.cancel()
+            raise
         
-        # Создаем общий анализ и прогноз с учетом выбранного стиля
-        overall_analysis = self.analyzer.generate_overall_analysis(analyzed_news, current_style)
+        overall_analysis = await analysis_task
+        
+        # Самые частые стили собираем без Jinja, если шаблон не был заменен кастомным
+        if template is _COMPILED_TEMPLATES[DigestStyle.STANDARD]:
+            return self._render_standard(news_by_category, digest_number, overall_analysis)
+        if template is _COMPILED_TEMPLATES[DigestStyle.COMPACT]:
+            return self._render_compact(news_by_category, digest_number, overall_analysis)
         
         # Генерация дайджеста по шаблону
-        return self.template.render(
+        return template.render(
             news_by_category=news_by_category,
             digest_number=digest_number,
             overall_analysis=overall_analysis
         )
+    
+    def generate_digest(self, analyzed_news: List[Dict[str, Any]], digest_number: int, style: Optional[DigestStyle] = None) -> str:
+        """
+        Генерирует дайджест новостей по шаблону
+        
+        Блокирует вызывающий поток до готовности дайджеста. Из корутин нужно
+        вызывать generate_digest_async, чтобы не останавливать свой цикл событий
+        
+        Args:
+            analyzed_news: Список проанализированных новостей
+            digest_number: Номер дайджеста
+            style: Стиль форматирования (если отличается от стиля в конструкторе)
+            
+        Returns:
+            Отформатированный текст дайджеста для Telegram
+        """
+        # Выполняем генерацию в фоновом цикле событий анализатора
+        return self.analyzer._run_sync(self.generate_digest_async(analyzed_news, digest_number, style))
+
+    async def generate_digest_stream_async(self, analyzed_news: List[Dict[str, Any]], digest_number: int,
+                                           style: Optional[DigestStyle] = None) -> Iterator[str]:
+        """
+        Асинхронно готовит дайджест к потоковой отдаче по частям
+
+        Общий анализ дожидается до начала рендеринга, а сам текст шаблона
+        отдается кусками по мере обхода итератора, без сборки всей строки в памяти
+
+        Args:
+            analyzed_news: Список проанализированных новостей
+            digest_number: Номер дайджеста
+            style: Стиль форматирования (если отличается от стиля в конструкторе)
+
+        Returns:
+            Итератор фрагментов текста дайджеста
+        """
+        current_style = style or self.style
+        analysis_task = asyncio.create_task(self.analyzer.generate_overall_analysis_async(analyzed_news, current_style))
+
+        try:
+            template = self._template_for(current_style)
+            news_by_category = self._group_news_by_category(analyzed_news)
+        except Exception:
+            analysis_task.cancel()
+            raise
+
+        context = {
+            "news_by_category": news_by_category,
+            "digest_number": digest_number,
+            "overall_analysis": await analysis_task,
+        }
+
+        # Для стилей без Jinja итоговый текст и так собирается одной строкой
+        if template is _COMPILED_TEMPLATES[DigestStyle.STANDARD]:
+            return iter((self._render_standard(**context),))
+        if template is _COMPILED_TEMPLATES[DigestStyle.COMPACT]:
+            return iter((self._render_compact(**context),))
+
+        stream = template.stream(**context)
+        stream.enable_buffering(DIGEST_STREAM_BUFFER_SIZE)
+        return stream
+
+    def generate_digest_stream(self, analyzed_news: List[Dict[str, Any]], digest_number: int,
+                               style: Optional[DigestStyle] = None) -> Iterator[str]:
+        """
+        Генерирует дайджест новостей по частям
+
+        Args:
+            analyzed_news: Список проанализированных новостей
+            digest_number: Номер дайджеста
+            style: Стиль форматирования (если отличается от стиля в конструкторе)
+
+        Returns:
+            Итератор фрагментов текста дайджеста
+        """
+        # Анализ выполняется в фоновом цикле, а рендеринг - при обходе итератора
+        return self.analyzer._run_sync(self.generate_digest_stream_async(analyzed_news, digest_number, style))
 
     @classmethod
     def get_available_styles(cls) -> List[str]:
@@ -907,6 +1866,40 @@ class DigestGenerator:
         return [style.value for style in DigestStyle]
 
 
+class _LazyBytecodeCache(FileSystemBytecodeCache):
+    """Кэш байт-кода шаблонов, создающий каталог при первой записи, а не при импорте модуля"""
+    
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+# Общее окружение шаблонов дайджеста: байт-код скомпилированных шаблонов кэшируется на диске,
+# а шаблоны встроены в код и не меняются, поэтому их не нужно перепроверять
+_TEMPLATE_ENV = Environment(
+    loader=DictLoader({style.value: template_text for style, template_text in DigestGenerator.TEMPLATES.items()}),
+    # Настройки окружения влияют на скомпилированный код, но не входят в ключ кэша байт-кода,
+    # поэтому кэш с другими настройками хранится в файлах с другим именем
+    bytecode_cache=_LazyBytecodeCache(TEMPLATE_CACHE_DIR, pattern="__jinja2_trim_%s.cache"),
+    auto_reload=False,
+    cache_size=400,
+    # Строки с одними управляющими тегами не оставляют пустых строк в сообщении
+    trim_blocks=True,
+    lstrip_blocks=True
+)
+
+# Шаблоны стилей компилируются один раз при импорте модуля, а не для каждого дайджеста
+_COMPILED_TEMPLATES: Dict[DigestStyle, Template] = {
+    style: _TEMPLATE_ENV.get_template(style.value) for style in DigestGenerator.TEMPLATES
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_template(template_string: str) -> Template:
+    """Компилирует пользовательский шаблон один раз на процесс (различных шаблонов немного)"""
+    return _TEMPLATE_ENV.from_string(template_string)
+
+
 # Пример использования
 if __name__ == "__main__":
     # Создаем анализатор новостей
@@ -945,34 +1938,33 @@ if __name__ == "__main__":
     # Выбираем стиль для примера
     selected_style = DigestStyle.STANDARD
     
-    # Анализируем каждую новость с учетом выбранного стиля
-    analyzed_news = []
-    for news_item in raw_news:
-        if len(news_item) > 2 and news_item[2]:  # Если есть видео
-            result = analyzer.analyze_news(
-                news_item[0], 
-                image_path=news_item[1] if len(news_item) > 1 and news_item[1] else None,
-                style=selected_style,
-                video_link=news_item[2]
-            )
-        else:
-            result = analyzer.analyze_news(
-                news_item[0], 
-                image_path=news_item[1] if len(news_item) > 1 and news_item[1] else None,
-                style=selected_style
-            )
-        analyzed_news.append(result)
-    
-    # Создаем генератор дайджеста с выбранным стилем
-    generator = DigestGenerator(style=selected_style)
-    
-    # Генерируем дайджест
-    digest = generator.generate_digest(analyzed_news, 1)
-    
-    # Выводим результат
-    print(digest)
+    async def main():
+        # Анализируем все новости одним пакетом с учетом выбранного стиля:
+        # запросы к модели выполняются одновременно в одном цикле событий
+        analyzed_news = await analyzer.analyze_news_batch_async(
+            [
+                {
+                    "raw_text": news_item[0],
+                    "image_path": news_item[1] if len(news_item) > 1 and news_item[1] else None,
+                    "video_link": news_item[2] if len(news_item) > 2 and news_item[2] else None
+                }
+                for news_item in raw_news
+            ],
+            style=selected_style
+        )
+        
+        # Создаем генератор дайджеста с выбранным стилем
+        generator = DigestGenerator(style=selected_style)
+        
+        # Генерируем дайджест
+        digest = await generator.generate_digest_async(analyzed_news, 1)
+        
+        # Выводим результат
+        print(digest)
+        
+        # Пример смены стиля для того же набора новостей (общий анализ берется из кэша)
+        print("\n" + "="*50 + "\n")
+        digest_media = await generator.generate_digest_async(analyzed_news, 1, style=DigestStyle.MEDIA)
+        print(digest_media)
     
-    # Пример смены стиля для того же набора новостей
-    print("\n" + "="*50 + "\n")
-    digest_media = generator.generate_digest(analyzed_news, 1, style=DigestStyle.MEDIA)
-    print(digest_media) 
\ No newline at end of file
+    asyncio.run(main())
@@ -1,21 +1,25 @@
 import os
 import json
 import re
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Set
+from typing import List, Dict, Set, FrozenSet
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import random
 import pytz
 import base64
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from pathlib import Path
 from mistralai import Mistral
 import time
 import logging
+import functools
+import ahocorasick
 from db_manager import MongoDBManager
 import traceback
 
@@ -28,6 +32,7 @@ logger = logging.getLogger(__name__)
 
 # Константы
 POSTS_TO_ANALYZE = 20  # Количество последних постов для анализа по умолчанию
+SOURCES_CACHE_TTL = 60  # Через сколько секунд источники пользователя перечитываются из БД
 
 # Пороговые значения для анализа постов
 SIMILARITY_THRESHOLD = 0.6  # Порог для определения похожих постов
@@ -35,6 +40,7 @@ MERGE_SIMILARITY_THRESHOLD = 0.65  # Порог для объединения п
 AD_THRESHOLD = 0.5  # Порог для определения рекламных постов
 ECONOMICS_RELEVANCE_THRESHOLD = 0.4  # Порог для определения релевантности экономической тематике
 AD_FILTER_THRESHOLD = 0.6  # Порог для фильтрации рекламных постов
+SIMILARITY_CHUNK_SIZE = 256  # Сколько строк матрицы сходства считать за один раз
 
 # Веса для оценки источника
 SOURCE_WEIGHTS = {
@@ -86,6 +92,116 @@ NORMALIZATION = {
     'numbers_per_score': 10  # Количество цифр/валютных символов для максимального score
 }
 
+# Ключевые слова и фразы, указывающие на рекламу
+AD_KEYWORDS = {
+    'прямые_призывы': [
+        'реклама', 'рекламный', 'спонсор', 'партнер', 'сотрудничество', 'коллаборация',
+        'акция', 'скидка', 'специальное предложение', 'промокод', 'предложение дня',
+        'купить', 'заказать', 'цена', 'стоимость', 'руб', '₽', 'скидочный',
+        'инвестируй', 'инвестиции', 'брокер', 'трейдинг', 'торговля',
+        'регистрация', 'бонус', 'приз', 'выигрыш', 'розыгрыш', 'конкурс',
+        'подпишись', 'подписка', 'канал', 'каналы', 'telegram', 't.me/',
+        't.me', 'telegram.me', 'telegram.org', 'сейчaс', 'сейчас',
+        'эксклюзив', 'новинка', 'ультра', 'ограничено', 'лимитированное'
+    ],
+    'финансовые_термины': [
+        'депозит', 'вклад', 'кредит', 'займ', 'микрозайм', 'финансирование',
+        'процент', 'годовых', 'доходность', 'прибыль', 'дивиденды', 'акции',
+        'облигации', 'фонд', 'портфель', 'инвестиционный', 'брокерский', 'счет',
+        'карта', 'кэшбэк', 'бонусы', 'ликвидность', 'валюта', 'инфляция',
+        'оборот', 'рентабельность', 'ROI'
+    ],
+    'маркетинговые_слова': [
+        'эксклюзивно', 'только сейчас', 'ограниченное предложение', 'успей',
+        'последний шанс', 'специальная цена', 'выгодно', 'бесплатно',
+        'в подарок', 'при покупке', 'скидка', 'распродажа', 'новинка', 'хит продаж',
+        'бестселлер', 'популярный', 'не пропусти', 'горячее предложение', 'ограниченное время',
+        'топ предложение', 'выбор редакции', 'рекомендация эксперта'
+    ],
+    'призывы_к_действию': [
+        'нажми', 'кликни', 'перейди', 'зарегистрируйся', 'подпишись',
+        'оставь заявку', 'заполни форму', 'свяжитесь', 'позвони', 'напиши',
+        'закажи', 'купи', 'получи', 'воспользуйся', 'присоединяйся', 'запишись',
+        'узнай подробнее', 'детали', 'смотри', 'сегодня', 'не упусти шанс',
+        'подробности', 'сделай заказ'
+    ]
+}
+
+def build_ad_automaton(keywords_by_category):
+    """Строит автомат Ахо-Корасик для поиска всех рекламных ключевых слов за один проход"""
+    categories_by_keyword = {}
+    for category, keywords in keywords_by_category.items():
+        for keyword in keywords:
+            categories_by_keyword.setdefault(keyword, []).append(category)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, categories in categories_by_keyword.items():
+        automaton.add_word(keyword, (keyword, tuple(categories)))
+    automaton.make_automaton()
+    return automaton
+
+AD_AUTOMATON = build_ad_automaton(AD_KEYWORDS)
+
+# Рекламные паттерны (компилируются один раз при загрузке модуля)
+AD_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'\b\d+\s*%\s*(?:скидк|скидка|off|discount)\b',
+    r'\b(?:от|до)\s*\d+\s*(?:руб|₽|р\.)\b',
+    r'\b(?:купи|закажи|получи)\b.*\b(?:бесплатно|в подарок)\b',
+    r'\b(?:подпишись|подписка)\b.*\b(?:канал|каналы)\b',
+    r'\b(?:инвестируй|вкладывай)\b.*\b(?:сейчас|сегодня)\b',
+    r'\b(?:только|лишь)\b.*\b(?:до|по)\b.*\d{1,2}(?:\.\d{1,2})?',
+    r'\b(?:акция|спецпредложение)\b.*\b(?:действует|действует до)\b',
+    r'\b(?:получи|забери)\b.*\b(?:бонус|подарок)\b',
+    r'\b(?:регистрация|заявка)\b.*\b(?:бесплатно|без оплаты)\b'
+]]
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?%?')  # Числа и проценты
+CURRENCY_RE = re.compile(r'[$€£₽₴]')  # Валютные символы
+
+# Разбор чисел вида "1.2K" из счетчиков просмотров и подписчиков
+NUM_RE = re.compile(r'(\d+(?:\.\d+)?)\s*([KkMm]?)')  # Число с необязательным суффиксом K/M
+NUM_SEPARATORS_RE = re.compile(r'[\s,]')  # Разделители разрядов в числах
+NUM_SUFFIXES = {'k': 1_000, 'm': 1_000_000}  # Множители суффиксов
+
+# URL картинки из атрибута style="background-image:url('...')"
+BG_IMAGE_URL_RE = re.compile(r"background-image:url\('([^']+)'\)")
+
+# Префикс "@" или адрес t.me (с /s/ или без) перед именем канала
+CHANNEL_PREFIX_RE = re.compile(r'^@|^.*t\.me/(?:s/)?')
+
+@functools.lru_cache(maxsize=4096)
+def _clean_channel_username(raw: str) -> str:
+    """Приводит @username или ссылку t.me к имени канала"""
+    return CHANNEL_PREFIX_RE.sub('', raw, count=1)
+
+def quantize_embeddings(embeddings):
+    """Квантует эмбеддинги в int8 с отдельным масштабом на каждый вектор
+    
+    Возвращает (векторы int8, масштабы, нормы int8-векторов). Для косинусного
+    сходства масштабы сокращаются, поэтому достаточно самих int8-векторов и их норм
+    """
+    vecs = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vecs / scales[:, None]).astype(np.int8)
+    norms = np.linalg.norm(quantized.astype(np.float32), axis=1)
+    norms[norms == 0] = 1.0
+    return quantized, scales, norms
+
+def quantized_cosine(a, a_norms, b, b_norms):
+    """Матрица косинусного сходства между наборами int8-векторов (скалярные произведения в int32)"""
+    return (a.astype(np.int32) @ b.astype(np.int32).T) / np.outer(a_norms, b_norms)
+
+def pairwise_cosine_chunked(matrix, threshold, chunk=SIMILARITY_CHUNK_SIZE):
+    """Перебирает пары строк (i, j) с косинусным сходством не ниже порога
+    
+    Сходство считается блоками по chunk строк, поэтому полная матрица N×N
+    не материализуется и в памяти не бывает больше chunk×N значений
+    """
+    matrix = normalize(matrix, norm='l2', copy=False)
+    for start in range(0, matrix.shape[0], chunk):
+        rows, cols = (matrix[start:start + chunk] @ matrix.T >= threshold).nonzero()
+        yield from zip((rows + start).tolist(), cols.tolist())
+
 # Инициализация клиента Mistral если есть ключи
 api_keys = os.getenv('MISTRAL_API_KEYS')
 client = None
@@ -105,8 +221,12 @@ data_dir.mkdir(exist_ok=True)
 class NewsAggregator:
     def __init__(self):
         # Изменяем хранение источников: теперь хранится словарь user_id -> sources
-        self.sources = {}
-        self.news_cache = pd.DataFrame(columns=['source', 'text', 'date', 'url'])
+        self.sources: Dict[int, Set[str]] = defaultdict(set)
+        # Время последней загрузки источников пользователя из БД (time.monotonic)
+        self._sources_loaded_at: Dict[int, float] = {}
+        # int8-эмбеддинги эталонных текстов по категориям (запрашиваются один раз)
+        self._reference_embeddings = None
+        self.news_cache: List[Dict] = []  # Накопленные новости (source, text, date, url)
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
@@ -146,142 +266,122 @@ class NewsAggregator:
         """Парсит число из текста, обрабатывая суффиксы K и M"""
         if not text:
             return 0
-            
-        # Удаляем все нецифровые символы, кроме точки, K и M
-        text = text.strip().lower()
-        number = ''
-        decimal = ''
-        has_decimal = False
         
-        for char in text:
-            if char.isdigit():
-                if has_decimal:
-                    decimal += char
-                else:
-                    number += char
-            elif char == '.' and not has_decimal:
-                has_decimal = True
-            elif char == 'k':
-                return int(float(number + '.' + decimal if decimal else number) * 1_000)
-            elif char == 'm':
-                return int(float(number + '.' + decimal if decimal else number) * 1_000_000)
-        
-        return int(number) if number else 0
+        # Убираем разделители разрядов и ищем число с суффиксом одним регулярным выражением
+        match = NUM_RE.search(NUM_SEPARATORS_RE.sub('', text))
+        if not match:
+            return 0
+        return int(float(match.group(1)) * NUM_SUFFIXES.get(match.group(2).lower(), 1))
     
     def extract_post_data(self, post, channel_name):
         """Извлекает данные из поста"""
         try:
-            print(f"Начинаю извлечение данных из поста канала {channel_name}")
+            # Отладочные сообщения по отдельным элементам собираем только при включенном DEBUG
+            debug = logger.isEnabledFor(logging.DEBUG)
             
             # Получаем текст поста
-            text_elem = post.find('div', {'class': 'tgme_widget_message_text'})
+            text_elem = post.css_first('div.tgme_widget_message_text')
             if text_elem:
-                text = text_elem.get_text()
-                print(f"Найден текст поста длиной {len(text)} символов")
+                text = text_elem.text()
             else:
                 text = ""
-                print(f"ВНИМАНИЕ: Текстовый элемент не найден в посте канала {channel_name}")
+                logger.debug("Текстовый элемент не найден в посте канала %s", channel_name)
             
             # Получаем дату
-            date_elem = post.find('time')
+            date_elem = post.css_first('time')
             date = None
-            if date_elem and date_elem.get('datetime'):
-                date_str = date_elem['datetime']
-                print(f"Найдена дата в посте: {date_str}")
+            if date_elem and date_elem.attributes.get('datetime'):
+                date_str = date_elem.attributes['datetime']
                 try:
                     date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    print(f"Преобразованная дата: {date}")
                 except ValueError as e:
-                    print(f"Ошибка преобразования даты '{date_str}': {e}")
+                    logger.warning("Ошибка преобразования даты '%s': %s", date_str, e)
             else:
-                print(f"ВНИМАНИЕ: Элемент даты не найден в посте канала {channel_name}")
+                logger.debug("Элемент даты не найден в посте канала %s", channel_name)
             
             # Получаем просмотры
-            views_elem = post.find('span', {'class': 'tgme_widget_message_views'})
+            views_elem = post.css_first('span.tgme_widget_message_views')
             if views_elem:
-                views_text = views_elem.text.strip()
-                print(f"Найден элемент просмотров: '{views_text}'")
-                views = self.parse_number(views_text)
-                print(f"Преобразованное количество просмотров: {views}")
+                views = self.parse_number(views_elem.text().strip())
             else:
                 views = 0
-                print(f"ВНИМАНИЕ: Элемент просмотров не найден в посте канала {channel_name}")
-            
-            # Получаем ссылки
-            links = []
-            seen_links = set()  # Для отслеживания дубликатов
-            for link in post.find_all('a'):
-                href = link.get('href')
-                # Проверяем, что ссылка начинается с http:// или https://
-                if href and (href.startswith('http://') or href.startswith('https://')):
-                    # Фильтруем ссылки на сам канал и дубликаты
-                    if href not in seen_links and not href.endswith(f"/{channel_name}") and not href.endswith(f"/{channel_name}/"):
-                        links.append(href)
-                        seen_links.add(href)
-            print(f"Найдено {len(links)} уникальных ссылок в посте")
+                logger.debug("Элемент просмотров не найден в посте канала %s", channel_name)
+            
+            # Получаем ссылки: только http(s), без ссылок на сам канал и без дубликатов (с сохранением порядка)
+            channel_suffixes = (f"/{channel_name}", f"/{channel_name}/")
+            links = list(dict.fromkeys(
+                href for href in (link.attributes.get('href') for link in post.css('a'))
+                if href and href.startswith(('http://', 'https://')) and not href.endswith(channel_suffixes)
+            ))
             
             # Получаем ID поста и ссылку на пост
-            post_link = post.find('a', {'class': 'tgme_widget_message_date'})
+            post_link = post.css_first('a.tgme_widget_message_date')
             post_id = None
             post_url = None
-            if post_link and post_link.get('href'):
-                post_url = post_link['href']
+            if post_link and post_link.attributes.get('href'):
+                post_url = post_link.attributes['href']
                 post_id = post_url.split('/')[-1]
-                print(f"Найдена ссылка на пост: {post_url}, ID: {post_id}")
             else:
-                print(f"ВНИМАНИЕ: Элемент ссылки на пост не найден в посте канала {channel_name}")
+                logger.debug("Элемент ссылки на пост не найден в посте канала %s", channel_name)
             
             # Получаем изображения
             images = []
             # Исключаем аватар канала и фото пользователей
-            excluded_classes = ['tgme_widget_message_author_photo', 'tgme_widget_message_user_photo']
+            excluded_classes = {'tgme_widget_message_author_photo', 'tgme_widget_message_user_photo'}
             
             # Ищем изображения в тегах tgme_widget_message_photo_wrap
-            img_wraps = post.find_all('a', {'class': 'tgme_widget_message_photo_wrap'})
-            print(f"Найдено {len(img_wraps)} элементов photo_wrap")
-            
-            for img_wrap in img_wraps:
+            for img_wrap in post.css('a.tgme_widget_message_photo_wrap'):
                 # Извлекаем URL изображения из атрибута style
-                style = img_wrap.get('style', '')
-                if 'background-image:url(' in style:
-                    # Извлекаем URL из строки background-image:url('...')
-                    try:
-                        img_url = style.split("background-image:url('")[1].split("')")[0]
-                        images.append(img_url)
-                        print(f"Найдено изображение в photo_wrap: {img_url[:50]}...")
-                    except Exception as e:
-                        print(f"Ошибка при извлечении URL изображения из стиля '{style}': {e}")
+                match = BG_IMAGE_URL_RE.search(img_wrap.attributes.get('style') or '')
+                if match:
+                    images.append(match.group(1))
+                    if debug:
+                        logger.debug("Найдено изображение в photo_wrap: %s...", match.group(1)[:50])
+            
+            # Заранее помечаем img/a внутри тегов i с классом tgme_page_photo_image или tgme_widget_message_user_photo,
+            # чтобы не подниматься к родителям для каждого элемента
+            excluded_nodes = {
+                node.mem_id for node in post.css(
+                    'i.tgme_page_photo_image img, i.tgme_page_photo_image a, '
+                    'i.tgme_widget_message_user_photo img, i.tgme_widget_message_user_photo a'
+                )
+            }
             
             # Также ищем обычные изображения
-            all_imgs = post.find_all(['img', 'a'])
-            print(f"Найдено {len(all_imgs)} элементов img и a")
-            
-            for img in all_imgs:
+            for img in post.css('img, a'):
                 try:
-                    # Проверяем, не находится ли изображение внутри тега i с классом tgme_page_photo_image или tgme_widget_message_user_photo
-                    parent_i = img.find_parent('i', {'class': ['tgme_page_photo_image', 'tgme_widget_message_user_photo']})
-                    if parent_i:
+                    if img.mem_id in excluded_nodes:
                         continue
-                        
+                    
+                    img_classes = (img.attributes.get('class') or '').split()
                     # Проверяем тег img
-                    if img.name == 'img' and img.get('src'):
+                    if img.tag == 'img' and img.attributes.get('src'):
                         # Исключаем аватар канала и фото пользователей
-                        if not any(cls in img.get('class', []) for cls in excluded_classes):
-                            images.append(img['src'])
-                            print(f"Найдено изображение в теге img: {img['src'][:50]}...")
+                        if excluded_classes.isdisjoint(img_classes):
+                            images.append(img.attributes['src'])
+                            if debug:
+                                logger.debug("Найдено изображение в теге img: %s...", img.attributes['src'][:50])
                     # Проверяем ссылки на изображения
-                    elif img.name == 'a' and img.get('href'):
-                        href = img['href']
+                    elif img.tag == 'a' and img.attributes.get('href'):
+                        href = img.attributes['href']
                         # Исключаем ссылки на аватар канала и фото пользователей
-                        if not any(cls in img.get('class', []) for cls in excluded_classes) and any(href.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif']):
+                        if excluded_classes.isdisjoint(img_classes) and href.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
                             images.append(href)
-                            print(f"Найдено изображение в теге a: {href[:50]}...")
+                            if debug:
+                                logger.debug("Найдено изображение в теге a: %s...", href[:50])
                 except Exception as e:
-                    print(f"Ошибка при обработке элемента изображения: {e}")
+                    logger.warning("Ошибка при обработке элемента изображения: %s", e)
+            
+            # photo_wrap и обычные img/a могут указывать на одно и то же изображение
+            images = list(dict.fromkeys(images))
             
-            print(f"Всего найдено {len(images)} изображений в посте")
+            if debug:
+                logger.debug(
+                    "Пост %s канала %s: текст %d символов, %d просмотров, %d ссылок, %d изображений",
+                    post_id, channel_name, len(text), views, len(links), len(images)
+                )
             
-            result = {
+            return {
                 "channel": channel_name,
                 "post_id": post_id,
                 "post_url": post_url,
@@ -293,11 +393,8 @@ class NewsAggregator:
                 "images_base64": []
             }
             
-            print(f"Успешно извлечены данные из поста канала {channel_name}")
-            return result
-            
         except Exception as e:
-            print(f"КРИТИЧЕСКАЯ ОШИБКА при извлечении данных из поста канала {channel_name}: {e}")
+            logger.error("Ошибка при извлечении данных из поста канала %s: %s", channel_name, e)
             # Предоставляем обратную совместимость, возвращая пустой словарь с базовыми полями
             return {
                 "channel": channel_name,
@@ -318,33 +415,13 @@ class NewsAggregator:
                 result = self.db_manager.add_source(channel_username, user_id, name)
                 if result:
                     # Если источник успешно добавлен в БД, добавляем его в локальный набор
-                    clean_username = channel_username
-                    if clean_username.startswith('@'):
-                        clean_username = clean_username[1:]
-                    elif "t.me/s/" in clean_username:
-                        clean_username = clean_username.split("t.me/s/")[-1]
-                    elif "t.me/" in clean_username:
-                        clean_username = clean_username.split("t.me/")[-1]
-                    
-                    # Инициализируем список источников для пользователя, если он еще не существует
-                    if user_id not in self.sources:
-                        self.sources[user_id] = set()
+                    clean_username = _clean_channel_username(channel_username)
                     
                     self.sources[user_id].add(clean_username)
                 return result
             else:
                 # Если нет подключения к БД, добавляем только в локальный набор
-                clean_username = channel_username
-                if clean_username.startswith('@'):
-                    clean_username = clean_username[1:]
-                elif "t.me/s/" in clean_username:
-                    clean_username = clean_username.split("t.me/s/")[-1]
-                elif "t.me/" in clean_username:
-                    clean_username = clean_username.split("t.me/")[-1]
-                
-                # Инициализируем список источников для пользователя, если он еще не существует
-                if user_id not in self.sources:
-                    self.sources[user_id] = set()
+                clean_username = _clean_channel_username(channel_username)
                 
                 if clean_username in self.sources[user_id]:
                     return False
@@ -352,7 +429,7 @@ class NewsAggregator:
                 self.sources[user_id].add(clean_username)
                 return True
         except Exception as e:
-            print(f"Ошибка при добавлении источника: {e}")
+            logger.error("Ошибка при добавлении источника: %s", e)
             return False
             
     async def add_source_async(self, channel_username: str, user_id: int, name: str = None) -> bool:
@@ -362,33 +439,13 @@ class NewsAggregator:
                 result = await self.db_manager.add_source_async(channel_username, user_id, name)
                 if result:
                     # Если источник успешно добавлен в БД, добавляем его в локальный набор
-                    clean_username = channel_username
-                    if clean_username.startswith('@'):
-                        clean_username = clean_username[1:]
-                    elif "t.me/s/" in clean_username:
-                        clean_username = clean_username.split("t.me/s/")[-1]
-                    elif "t.me/" in clean_username:
-                        clean_username = clean_username.split("t.me/")[-1]
-                    
-                    # Инициализируем список источников для пользователя, если он еще не существует
-                    if user_id not in self.sources:
-                        self.sources[user_id] = set()
+                    clean_username = _clean_channel_username(channel_username)
                     
                     self.sources[user_id].add(clean_username)
                 return result
             else:
                 # Если нет подключения к БД, добавляем только в локальный набор
-                clean_username = channel_username
-                if clean_username.startswith('@'):
-                    clean_username = clean_username[1:]
-                elif "t.me/s/" in clean_username:
-                    clean_username = clean_username.split("t.me/s/")[-1]
-                elif "t.me/" in clean_username:
-                    clean_username = clean_username.split("t.me/")[-1]
-                
-                # Инициализируем список источников для пользователя, если он еще не существует
-                if user_id not in self.sources:
-                    self.sources[user_id] = set()
+                clean_username = _clean_channel_username(channel_username)
                 
                 if clean_username in self.sources[user_id]:
                     return False
@@ -396,7 +453,7 @@ class NewsAggregator:
                 self.sources[user_id].add(clean_username)
                 return True
         except Exception as e:
-            print(f"Ошибка при асинхронном добавлении источника: {e}")
+            logger.error("Ошибка при асинхронном добавлении источника: %s", e)
             return False
             
     def remove_source(self, channel_username: str, user_id: int) -> bool:
@@ -406,34 +463,21 @@ class NewsAggregator:
                 result = self.db_manager.remove_source(channel_username, user_id)
                 if result:
                     # Если источник успешно удален из БД, удаляем его из локального набора
-                    clean_username = channel_username
-                    if clean_username.startswith('@'):
-                        clean_username = clean_username[1:]
-                    elif "t.me/s/" in clean_username:
-                        clean_username = clean_username.split("t.me/s/")[-1]
-                    elif "t.me/" in clean_username:
-                        clean_username = clean_username.split("t.me/")[-1]
+                    clean_username = _clean_channel_username(channel_username)
                     
-                    if user_id in self.sources and clean_username in self.sources[user_id]:
-                        self.sources[user_id].remove(clean_username)
+                    self.sources.get(user_id, set()).discard(clean_username)
                 return result
             else:
                 # Если нет подключения к БД, удаляем только из локального набора
-                clean_username = channel_username
-                if clean_username.startswith('@'):
-                    clean_username = clean_username[1:]
-                elif "t.me/s/" in clean_username:
-                    clean_username = clean_username.split("t.me/s/")[-1]
-                elif "t.me/" in clean_username:
-                    clean_username = clean_username.split("t.me/")[-1]
+                clean_username = _clean_channel_username(channel_username)
                 
-                if user_id not in self.sources or clean_username not in self.sources[user_id]:
+                if clean_username not in self.sources.get(user_id, ()):
                     return False
                 
                 self.sources[user_id].remove(clean_username)
                 return True
         except Exception as e:
-            print(f"Ошибка при удалении источника: {e}")
+            logger.error("Ошибка при удалении источника: %s", e)
             return False
     
     async def remove_source_async(self, channel_username: str, user_id: int) -> bool:
@@ -443,38 +487,32 @@ class NewsAggregator:
                 result = await self.db_manager.remove_source_async(channel_username, user_id)
                 if result:
                     # Если источник успешно удален из БД, удаляем его из локального набора
-                    clean_username = channel_username
-                    if clean_username.startswith('@'):
-                        clean_username = clean_username[1:]
-                    elif "t.me/s/" in clean_username:
-                        clean_username = clean_username.split("t.me/s/")[-1]
-                    elif "t.me/" in clean_username:
-                        clean_username = clean_username.split("t.me/")[-1]
+                    clean_username = _clean_channel_username(channel_username)
                     
-                    if user_id in self.sources and clean_username in self.sources[user_id]:
-                        self.sources[user_id].remove(clean_username)
+                    self.sources.get(user_id, set()).discard(clean_username)
                 return result
             else:
                 # Если нет подключения к БД, удаляем только из локального набора
-                clean_username = channel_username
-                if clean_username.startswith('@'):
-                    clean_username = clean_username[1:]
-                elif "t.me/s/" in clean_username:
-                    clean_username = clean_username.split("t.me/s/")[-1]
-                elif "t.me/" in clean_username:
-                    clean_username = clean_username.split("t.me/")[-1]
+                clean_username = _clean_channel_username(channel_username)
                 
-                if user_id not in self.sources or clean_username not in self.sources[user_id]:
+                if clean_username not in self.sources.get(user_id, ()):
                     return False
                 
                 self.sources[user_id].remove(clean_username)
                 return True
         except Exception as e:
-            print(f"Ошибка при асинхронном удалении источника: {e}")
+            logger.error("Ошибка при асинхронном удалении источника: %s", e)
             return False
             
+    def _sources_expired(self, user_id: int) -> bool:
+        """Проверяет, пора ли перечитать источники пользователя из БД"""
+        loaded_at = self._sources_loaded_at.get(user_id)
+        return loaded_at is None or time.monotonic() - loaded_at > SOURCES_CACHE_TTL
+    
     def _load_sources_for_user(self, user_id: int) -> bool:
         """Загрузка источников из базы данных для конкретного пользователя"""
+        # Отмечаем попытку и при ошибке, чтобы недоступная БД не опрашивалась на каждый запрос
+        self._sources_loaded_at[user_id] = time.monotonic()
         try:
             if self.db_manager is not None:
                 # Получаем список имен пользователей источников
@@ -488,40 +526,37 @@ class NewsAggregator:
     
     async def _load_sources_for_user_async(self, user_id: int) -> bool:
         """Асинхронная загрузка источников из базы данных для конкретного пользователя"""
+        self._sources_loaded_at[user_id] = time.monotonic()
         try:
-            print(f"Начинаем загрузку источников для пользователя {user_id}")
             if self.db_manager is not None:
-                print(f"Есть подключение к БД, получаем источники для пользователя {user_id}")
                 # Получаем список имен пользователей источников
                 usernames = await self.db_manager.get_source_usernames_async(user_id)
-                print(f"Получено {len(usernames)} источников для пользователя {user_id}: {usernames}")
+                logger.debug("Получено %d источников для пользователя %s", len(usernames), user_id)
                 self.sources[user_id] = set(usernames)
                 return True
-            print(f"Нет подключения к БД для пользователя {user_id}")
+            logger.debug("Нет подключения к БД для пользователя %s", user_id)
             return False
         except Exception as e:
-            print(f"Ошибка при асинхронной загрузке источников из БД для пользователя {user_id}: {e}")
+            logger.error("Ошибка при асинхронной загрузке источников из БД для пользователя %s: %s", user_id, e)
             return False
     
-    def get_sources(self, user_id: int) -> Set[str]:
+    def get_sources(self, user_id: int) -> FrozenSet[str]:
         """Получение списка источников для конкретного пользователя"""
-        # Если источников для пользователя нет в кэше, загружаем их из БД
-        if user_id not in self.sources:
+        # Если источников для пользователя нет в кэше или они устарели, загружаем их из БД
+        if user_id not in self.sources or self._sources_expired(user_id):
             self._load_sources_for_user(user_id)
-            if user_id not in self.sources:  # Если после загрузки все еще нет, создаем пустой набор
-                self.sources[user_id] = set()
-                
-        return self.sources[user_id]
+        
+        # Отдаем снимок, чтобы вызывающий код не мог изменить кэш источников
+        return frozenset(self.sources[user_id])
     
-    async def get_sources_async(self, user_id: int) -> Set[str]:
+    async def get_sources_async(self, user_id: int) -> FrozenSet[str]:
         """Асинхронное получение списка источников для конкретного пользователя"""
-        # Если источников для пользователя нет в кэше, загружаем их из БД
-        if user_id not in self.sources:
+        # Если источников для пользователя нет в кэше или они устарели, загружаем их из БД
+        if user_id not in self.sources or self._sources_expired(user_id):
             await self._load_sources_for_user_async(user_id)
-            if user_id not in self.sources:  # Если после загрузки все еще нет, создаем пустой набор
-                self.sources[user_id] = set()
-                
-        return self.sources[user_id]
+        
+        # Отдаем снимок, чтобы вызывающий код не мог изменить кэш источников
+        return frozenset(self.sources[user_id])
     
     def get_source_details(self, user_id: int) -> List[Dict]:
         """Получение детальной информации об источниках для конкретного пользователя"""
@@ -560,19 +595,11 @@ class NewsAggregator:
             with open(json_file, 'r', encoding='utf-8') as file:
                 channels = json.load(file)
                 
-            # Инициализируем список источников для пользователя, если он еще не существует
-            if user_id not in self.sources:
-                self.sources[user_id] = set()
-                
             for channel in channels:
                 # Извлекаем username из URL
                 url = channel['url']
-                if url.startswith('https://t.me/s/'):
-                    username = url.replace('https://t.me/s/', '')
-                    self.sources[user_id].add(username)
-                elif url.startswith('https://t.me/'):
-                    username = url.replace('https://t.me/', '')
-                    self.sources[user_id].add(username)
+                if url.startswith('https://t.me/'):
+                    self.sources[user_id].add(_clean_channel_username(url))
             
             # Если есть подключение к БД, импортируем источники из JSON в БД
             if self.db_manager is not None:
@@ -588,19 +615,12 @@ class NewsAggregator:
         try:
             # Проверяем, существует ли файл
             if not os.path.exists(json_file):
-                print(f"Файл {json_file} не найден, пропускаем загрузку")
+                logger.debug("Файл %s не найден, пропускаем загрузку", json_file)
                 return False
                 
             with open(json_file, 'r', encoding='utf-8') as file:
                 json_data = json.load(file)
             
-            # Проверяем формат JSON данных
-            print(f"Формат JSON данных: {type(json_data)}")
-            
-            # Инициализируем список источников для пользователя, если он еще не существует
-            if user_id not in self.sources:
-                self.sources[user_id] = set()
-            
             # Обрабатываем разные форматы данных
             # Проверяем новый формат с ключом "users"
             if isinstance(json_data, dict) and "users" in json_data:
@@ -608,36 +628,25 @@ class NewsAggregator:
                 user_id_str = str(user_id)
                 if user_id_str in json_data["users"]:
                     user_sources = json_data["users"][user_id_str].get("sources", [])
-                    print(f"Найдены источники для пользователя {user_id} в users: {user_sources}")
+                    logger.debug("Найдено %d источников для пользователя %s в users", len(user_sources), user_id)
                     
                     # Добавляем источники в набор
-                    for source in user_sources:
-                        self.sources[user_id].add(source)
-                        print(f"Добавлен источник: {source}")
+                    self.sources[user_id].update(user_sources)
                 else:
                     # Если пользователя нет, используем default_sources
                     default_sources = json_data.get("default_sources", [])
-                    print(f"Пользователь {user_id} не найден, используем default_sources: {default_sources}")
+                    logger.debug("Пользователь %s не найден, используем default_sources", user_id)
                     
-                    for source in default_sources:
-                        self.sources[user_id].add(source)
-                        print(f"Добавлен источник по умолчанию: {source}")
+                    self.sources[user_id].update(default_sources)
             
             # Старый формат - список объектов с url
             elif isinstance(json_data, list):
-                print(f"Найден старый формат данных (список)")
                 for channel in json_data:
                     if isinstance(channel, dict) and "url" in channel:
                         # Извлекаем username из URL
                         url = channel['url']
-                        if url.startswith('https://t.me/s/'):
-                            username = url.replace('https://t.me/s/', '')
-                            self.sources[user_id].add(username)
-                            print(f"Добавлен источник из URL: {username}")
-                        elif url.startswith('https://t.me/'):
-                            username = url.replace('https://t.me/', '')
-                            self.sources[user_id].add(username)
-                            print(f"Добавлен источник из URL: {username}")
+                        if url.startswith('https://t.me/'):
+                            self.sources[user_id].add(_clean_channel_username(url))
             
             # Если есть подключение к БД, импортируем источники из JSON в БД
             if self.db_manager is not None:
@@ -651,9 +660,7 @@ class NewsAggregator:
                     
             return True
         except Exception as e:
-            print(f"Ошибка при асинхронной загрузке источников из JSON: {e}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception("Ошибка при асинхронной загрузке источников из JSON: %s", e)
             return False
     
     def save_sources_to_json(self, json_file: str = None, user_id: int = None) -> bool:
@@ -803,22 +810,22 @@ class NewsAggregator:
                     return []
                 
                 parse_start_time = time.time()
-                soup = BeautifulSoup(html, 'html.parser')
+                tree = LexborHTMLParser(html)
                 parse_time = time.time() - parse_start_time
                 print(f"[DEBUG] Время парсинга HTML: {parse_time:.2f} сек.")
                 
                 # Находим все сообщения канала
                 posts_search_start = time.time()
-                posts = soup.find_all('div', {'class': 'tgme_widget_message'})
+                posts = tree.css('div.tgme_widget_message')
                 posts_search_time = time.time() - posts_search_start
                 print(f"[DEBUG] Найдено {len(posts)} сообщений для канала {channel}, время поиска: {posts_search_time:.2f} сек.")
                 
                 if not posts:
                     print(f"[WARNING] Не найдены сообщения для канала {channel}")
                     # Проверяем наличие страницы канала вообще
-                    channel_info = soup.find('div', {'class': 'tgme_page_additional'})
+                    channel_info = tree.css_first('div.tgme_page_additional')
                     if channel_info:
-                        print(f"[INFO] Информация о канале {channel} найдена: {channel_info.text}")
+                        print(f"[INFO] Информация о канале {channel} найдена: {channel_info.text()}")
                     else:
                         print(f"[ERROR] Информация о канале {channel} не найдена, возможно неверное имя канала или блокировка доступа")
                         
@@ -832,15 +839,17 @@ class NewsAggregator:
                         print(f"[ERROR] Не удалось сохранить отладочный HTML: {e}")
                     return []
                 
-                # Анализируем найденные посты
+                # Анализируем найденные посты с конца: на странице они идут от старых к новым,
+                # поэтому после первого слишком старого поста остальные можно не разбирать
                 print(f"[DEBUG] Начинаю обработку {len(posts)} постов из канала {channel}")
-                for post_index, post in enumerate(posts):
+                for post_index in range(len(posts) - 1, -1, -1):
+                    post = posts[post_index]
                     try:
                         post_start_time = time.time()
                         print(f"[DEBUG] Обработка поста #{post_index+1}/{len(posts)} из канала {channel}")
                         
                         # Получаем ID поста для отладки
-                        post_id = post.get('data-post-id', 'unknown')
+                        post_id = post.attributes.get('data-post-id', 'unknown')
                         print(f"[DEBUG] ID поста #{post_index+1}: {post_id}")
                         
                         # Извлекаем данные поста
@@ -880,8 +889,8 @@ class NewsAggregator:
                         print(f"[DEBUG] Пост #{post_index+1} от {post_date}, разница со временем отсечения: {hours_diff:.2f} часов")
                         
                         if post_date < time_cutoff:
-                            print(f"[INFO] Пост #{post_index+1} слишком старый (до {time_cutoff}), пропускаем")
-                            continue
+                            print(f"[INFO] Пост #{post_index+1} слишком старый (до {time_cutoff}), более ранние посты не разбираем")
+                            break
                             
                         # Добавляем пост в список новостей
                         news_item = {
@@ -905,6 +914,8 @@ class NewsAggregator:
                         print(f"{error_info}")
                         continue
                 
+                # Возвращаем посты в порядке публикации
+                channel_news.reverse()
                 total_time = time.time() - start_time
                 print(f"[DEBUG] Обработка канала {channel} завершена, получено {len(channel_news)} новостей, общее время: {total_time:.2f} сек.")
                         
@@ -1136,8 +1147,9 @@ class NewsAggregator:
         if not embeddings:
             return []
         
-        # Вычисляем попарную схожесть
-        similarity_matrix = cosine_similarity(embeddings)
+        # Вычисляем попарную схожесть по int8-квантованным эмбеддингам
+        quantized, _, norms = quantize_embeddings(embeddings)
+        similarity_matrix = quantized_cosine(quantized, norms, quantized, norms)
         
         # Группируем похожие посты
         similar_groups = []
@@ -1179,17 +1191,22 @@ class NewsAggregator:
         best_index = group_indices[post_scores.index(max(post_scores))]
         return posts[best_index]
 
-    def calculate_cosine_similarity(self, text1, text2):
-        """Вычисляет косинусное сходство между двумя текстами"""
-        vectorizer = TfidfVectorizer()
-        try:
-            tfidf_matrix = vectorizer.fit_transform([text1, text2])
-            return cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        except:
-            return 0.0
-
     def merge_similar_posts(self, posts, similarity_threshold=MERGE_SIMILARITY_THRESHOLD):
         """Объединяет похожие посты на основе косинусного сходства"""
+        if not posts:
+            return []
+        
+        # Обучаем TF-IDF один раз на всем корпусе и собираем только пары выше порога
+        try:
+            tfidf_matrix = TfidfVectorizer().fit_transform([post["text"] for post in posts])
+        except ValueError:
+            # Пустой словарь (например, все тексты пустые) - объединять нечего
+            return list(posts)
+        similar = [[] for _ in posts]
+        for i, j in pairwise_cosine_chunked(tfidf_matrix, similarity_threshold):
+            if j > i:
+                similar[i].append(j)
+        
         merged_posts = []
         used_indices = set()
         
@@ -1200,13 +1217,9 @@ class NewsAggregator:
             current_group = [post1]
             used_indices.add(i)
             
-            for j, post2 in enumerate(posts[i+1:], i+1):
-                if j in used_indices:
-                    continue
-                    
-                similarity = self.calculate_cosine_similarity(post1["text"], post2["text"])
-                if similarity >= similarity_threshold:
-                    current_group.append(post2)
+            for j in sorted(similar[i]):
+                if j not in used_indices:
+                    current_group.append(posts[j])
                     used_indices.add(j)
             
             if len(current_group) > 1:
@@ -1220,79 +1233,32 @@ class NewsAggregator:
 
     def is_advertisement(self, text, links):
         """Определяет, является ли пост рекламным"""
-        # Ключевые слова и фразы, указывающие на рекламу
-        ad_keywords = {
-            'прямые_призывы': [
-                'реклама', 'рекламный', 'спонсор', 'партнер', 'сотрудничество', 'коллаборация',
-                'акция', 'скидка', 'специальное предложение', 'промокод', 'предложение дня',
-                'купить', 'заказать', 'цена', 'стоимость', 'руб', '₽', 'скидочный',
-                'инвестируй', 'инвестиции', 'брокер', 'трейдинг', 'торговля',
-                'регистрация', 'бонус', 'приз', 'выигрыш', 'розыгрыш', 'конкурс',
-                'подпишись', 'подписка', 'канал', 'каналы', 'telegram', 't.me/',
-                't.me', 'telegram.me', 'telegram.org', 'сейчaс', 'сейчас',
-                'эксклюзив', 'новинка', 'ультра', 'ограничено', 'лимитированное'
-            ],
-            'финансовые_термины': [
-                'депозит', 'вклад', 'кредит', 'займ', 'микрозайм', 'финансирование',
-                'процент', 'годовых', 'доходность', 'прибыль', 'дивиденды', 'акции',
-                'облигации', 'фонд', 'портфель', 'инвестиционный', 'брокерский', 'счет',
-                'карта', 'кэшбэк', 'бонусы', 'ликвидность', 'валюта', 'инфляция',
-                'оборот', 'рентабельность', 'ROI'
-            ],
-            'маркетинговые_слова': [
-                'эксклюзивно', 'только сейчас', 'ограниченное предложение', 'успей',
-                'последний шанс', 'специальная цена', 'выгодно', 'бесплатно',
-                'в подарок', 'при покупке', 'скидка', 'распродажа', 'новинка', 'хит продаж',
-                'бестселлер', 'популярный', 'не пропусти', 'горячее предложение', 'ограниченное время',
-                'топ предложение', 'выбор редакции', 'рекомендация эксперта'
-            ],
-            'призывы_к_действию': [
-                'нажми', 'кликни', 'перейди', 'зарегистрируйся', 'подпишись',
-                'оставь заявку', 'заполни форму', 'свяжитесь', 'позвони', 'напиши',
-                'закажи', 'купи', 'получи', 'воспользуйся', 'присоединяйся', 'запишись',
-                'узнай подробнее', 'детали', 'смотри', 'сегодня', 'не упусти шанс',
-                'подробности', 'сделай заказ'
-            ]
-        }
-
-        # Проверка на наличие рекламных ключевых слов
+        # Проверка на наличие рекламных ключевых слов одним проходом автомата
         text_lower = text.lower()
-        keyword_scores = {}
-        total_keyword_score = 0
+        found_keywords = {keyword: categories for _, (keyword, categories) in AD_AUTOMATON.iter(text_lower)}
+        hits = Counter(category for categories in found_keywords.values() for category in categories)
         
-        for category, keywords in ad_keywords.items():
-            matches = sum(1 for keyword in keywords if keyword in text_lower)
-            score = matches / len(keywords)
-            keyword_scores[category] = score
-            total_keyword_score += score
+        keyword_scores = {
+            category: hits[category] / len(keywords)
+            for category, keywords in AD_KEYWORDS.items()
+        }
+        total_keyword_score = sum(keyword_scores.values())
         
         # Проверка на наличие множества ссылок
         link_score = min(len(links) / NORMALIZATION['links_per_score'], 1.0)  # Нормализуем до 1.0
         
         # Проверка на наличие рекламных паттернов в тексте
-        ad_patterns = [
-            r'\b\d+\s*%\s*(?:скидк|скидка|off|discount)\b',
-            r'\b(?:от|до)\s*\d+\s*(?:руб|₽|р\.)\b',
-            r'\b(?:купи|закажи|получи)\b.*\b(?:бесплатно|в подарок)\b',
-            r'\b(?:подпишись|подписка)\b.*\b(?:канал|каналы)\b',
-            r'\b(?:инвестируй|вкладывай)\b.*\b(?:сейчас|сегодня)\b',
-            r'\b(?:только|лишь)\b.*\b(?:до|по)\b.*\d{1,2}(?:\.\d{1,2})?',
-            r'\b(?:акция|спецпредложение)\b.*\b(?:действует|действует до)\b',
-            r'\b(?:получи|забери)\b.*\b(?:бонус|подарок)\b',
-            r'\b(?:регистрация|заявка)\b.*\b(?:бесплатно|без оплаты)\b'
-        ]
-        
-        pattern_matches = sum(1 for pattern in ad_patterns if re.search(pattern, text_lower, re.IGNORECASE))
-        pattern_score = pattern_matches / len(ad_patterns)
+        pattern_matches = sum(1 for pattern in AD_PATTERNS if pattern.search(text_lower))
+        pattern_score = pattern_matches / len(AD_PATTERNS)
         
         # Проверка на наличие множества цифр и валютных символов
-        number_count = len(re.findall(r'\d+(?:\.\d+)?%?', text))
-        currency_count = len(re.findall(r'[$€£₽₴]', text))
+        number_count = len(NUMBER_RE.findall(text))
+        currency_count = len(CURRENCY_RE.findall(text))
         number_score = min((number_count + currency_count) / NORMALIZATION['numbers_per_score'], 1.0)  # Нормализуем до 1.0
         
         # Вычисляем итоговый score с весами
         ad_score = (
-            AD_WEIGHTS['keywords'] * (total_keyword_score / len(ad_keywords)) +  # Вес ключевых слов
+            AD_WEIGHTS['keywords'] * (total_keyword_score / len(AD_KEYWORDS)) +  # Вес ключевых слов
             AD_WEIGHTS['links'] * link_score +                               # Вес количества ссылок
             AD_WEIGHTS['patterns'] * pattern_score +                            # Вес паттернов
             AD_WEIGHTS['numbers'] * number_score +                            # Вес цифр и валют
@@ -1349,23 +1315,29 @@ class NewsAggregator:
         if not text_embedding:
             return False, 0, {}
         
-        text_embedding = text_embedding[0]
+        text_q, _, text_norms = quantize_embeddings(text_embedding)
         
-        # Получаем эмбеддинги для эталонных текстов по категориям
-        category_embeddings = {}
-        for category, refs in reference_texts.items():
-            # Обрабатываем эталонные тексты небольшими батчами
-            ref_embeddings = self.get_text_embedding(refs, batch_size=2)
-            if not ref_embeddings:
-                continue
-            category_embeddings[category] = ref_embeddings
+        # Эмбеддинги эталонных текстов запрашиваем один раз и храним в int8
+        category_embeddings = self._reference_embeddings
+        if category_embeddings is None:
+            category_embeddings = {}
+            for category, refs in reference_texts.items():
+                # Обрабатываем эталонные тексты небольшими батчами
+                ref_embeddings = self.get_text_embedding(refs, batch_size=2)
+                if not ref_embeddings:
+                    continue
+                ref_q, _, ref_norms = quantize_embeddings(ref_embeddings)
+                category_embeddings[category] = (ref_q, ref_norms)
+            # Неполный набор не запоминаем, чтобы повторить запрос в следующий раз
+            if len(category_embeddings) == len(reference_texts):
+                self._reference_embeddings = category_embeddings
         
         # Вычисляем схожесть с эталонными текстами
         scores = {}
         
-        for category, ref_embeddings in category_embeddings.items():
-            similarities = cosine_similarity([text_embedding], ref_embeddings)[0]
-            scores[category] = max(similarities)
+        for category, (ref_q, ref_norms) in category_embeddings.items():
+            similarities = quantized_cosine(text_q, text_norms, ref_q, ref_norms)[0]
+            scores[category] = float(similarities.max())
         
         # Вычисляем итоговый score
         total_score = sum(score * ECONOMICS_WEIGHTS[category] 
@@ -1553,19 +1525,19 @@ class NewsAggregator:
                 async with session.get(preview_url, headers=headers) as response:
                     if response.status == 200:
                         html = await response.text()
-                        soup = BeautifulSoup(html, 'html.parser')
+                        tree = LexborHTMLParser(html)
                         
                         # Извлекаем количество подписчиков
                         subscribers = 0
-                        subscribers_text = soup.find('div', {'class': 'tgme_header_counter'})
+                        subscribers_text = tree.css_first('div.tgme_header_counter')
                         if subscribers_text:
                             # Ищем число подписчиков в тексте
-                            match = re.search(r'(\d+(?:\.\d+)?[KkMm]?)\s*(?:subscribers|подписчиков)', subscribers_text.text)
+                            match = re.search(r'(\d+(?:\.\d+)?[KkMm]?)\s*(?:subscribers|подписчиков)', subscribers_text.text())
                             if match:
                                 subscribers = self.parse_number(match.group(1))
                         
                         # Анализируем последние посты
-                        posts = soup.find_all('div', {'class': 'tgme_widget_message'})
+                        posts = tree.css('div.tgme_widget_message')
                         
                         now = datetime.now(pytz.UTC)
                         day_ago = now - timedelta(days=days_to_analyze)
@@ -1577,20 +1549,20 @@ class NewsAggregator:
                         
                         for post in posts[:posts_count]:  # Используем переданное количество постов
                             # Проверяем наличие ссылок
-                            links = post.find_all('a')
+                            links = post.css('a')
                             if links:
                                 posts_with_links += 1
                             
                             # Подсчитываем просмотры
-                            views_elem = post.find('span', {'class': 'tgme_widget_message_views'})
+                            views_elem = post.css_first('span.tgme_widget_message_views')
                             if views_elem:
-                                views = self.parse_number(views_elem.text.strip())
+                                views = self.parse_number(views_elem.text().strip())
                                 total_views += views
                             
                             # Проверяем дату поста
-                            date_elem = post.find('time')
-                            if date_elem and date_elem.get('datetime'):
-                                post_date = datetime.fromisoformat(date_elem['datetime'].replace('Z', '+00:00'))
+                            date_elem = post.css_first('time')
+                            if date_elem and date_elem.attributes.get('datetime'):
+                                post_date = datetime.fromisoformat(date_elem.attributes['datetime'].replace('Z', '+00:00'))
                                 if post_date > day_ago:
                                     recent_posts.append(post)
                                     # Извлекаем данные поста
@@ -1750,22 +1722,22 @@ class NewsAggregator:
                     return []
                 
                 parse_start_time = time.time()
-                soup = BeautifulSoup(html, 'html.parser')
+                tree = LexborHTMLParser(html)
                 parse_time = time.time() - parse_start_time
                 print(f"[DEBUG] Время парсинга HTML: {parse_time:.2f} сек.")
                 
                 # Находим все сообщения канала
                 posts_search_start = time.time()
-                posts = soup.find_all('div', {'class': 'tgme_widget_message'})
+                posts = tree.css('div.tgme_widget_message')
                 posts_search_time = time.time() - posts_search_start
                 print(f"[DEBUG] Найдено {len(posts)} сообщений для канала {channel}, время поиска: {posts_search_time:.2f} сек.")
                 
                 if not posts:
                     print(f"[WARNING] Не найдены сообщения для канала {channel}")
                     # Проверяем наличие страницы канала вообще
-                    channel_info = soup.find('div', {'class': 'tgme_page_additional'})
+                    channel_info = tree.css_first('div.tgme_page_additional')
                     if channel_info:
-                        print(f"[INFO] Информация о канале {channel} найдена: {channel_info.text}")
+                        print(f"[INFO] Информация о канале {channel} найдена: {channel_info.text()}")
                     else:
                         print(f"[ERROR] Информация о канале {channel} не найдена, возможно неверное имя канала или блокировка доступа")
                         
@@ -1779,15 +1751,17 @@ class NewsAggregator:
                         print(f"[ERROR] Не удалось сохранить отладочный HTML: {e}")
                     return []
                 
-                # Анализируем найденные посты
+                # Анализируем найденные посты с конца: на странице они идут от старых к новым,
+                # поэтому после первого слишком старого поста остальные можно не разбирать
                 print(f"[DEBUG] Начинаю обработку {len(posts)} постов из канала {channel}")
-                for post_index, post in enumerate(posts):
+                for post_index in range(len(posts) - 1, -1, -1):
+                    post = posts[post_index]
                     try:
                         post_start_time = time.time()
                         print(f"[DEBUG] Обработка поста #{post_index+1}/{len(posts)} из канала {channel}")
                         
                         # Получаем ID поста для отладки
-                        post_id = post.get('data-post-id', 'unknown')
+                        post_id = post.attributes.get('data-post-id', 'unknown')
                         print(f"[DEBUG] ID поста #{post_index+1}: {post_id}")
                         
                         # Извлекаем данные поста
@@ -1827,8 +1801,8 @@ class NewsAggregator:
                         print(f"[DEBUG] Пост #{post_index+1} от {post_date}, разница со временем отсечения: {hours_diff:.2f} часов")
                         
                         if post_date < time_cutoff:
-                            print(f"[INFO] Пост #{post_index+1} слишком старый (до {time_cutoff}), пропускаем")
-                            continue
+                            print(f"[INFO] Пост #{post_index+1} слишком старый (до {time_cutoff}), более ранние посты не разбираем")
+                            break
                             
                         # Добавляем пост в список новостей
                         news_item = {
@@ -1852,6 +1826,8 @@ class NewsAggregator:
                         print(f"{error_info}")
                         continue
                 
+                # Возвращаем посты в порядке публикации
+                channel_news.reverse()
                 total_time = time.time() - start_time
                 print(f"[DEBUG] Обработка канала {channel} завершена, получено {len(channel_news)} новостей, общее время: {total_time:.2f} сек.")
                         
@@ -1,8 +1,10 @@
 import os
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, jsonify, render_template, session
 from dotenv import load_dotenv
 import json
+import orjson
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from new_generator import DigestStyle, NewsAnalyzer, DigestGenerator
 from db_manager import MongoDBManager
 from news_aggregator import NewsAggregator
@@ -23,29 +25,20 @@ def run_async_safely(coro: Coroutine) -> T:
     Returns:
         Результат выполнения корутины
     """
+    # _get_running_loop возвращает None вместо исключения RuntimeError, если цикл не запущен
+    if asyncio.events._get_running_loop() is not None:
+        # В этом потоке уже работает event loop - запустить в нем еще один нельзя,
+        # поэтому выполняем корутину в отдельном потоке со своим циклом
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+    
+    # Event loop в текущем потоке не запущен, создаем новый
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
-        # Пытаемся получить существующий event loop
-        loop = asyncio.get_event_loop()
-        # Проверяем, запущен ли уже event loop
-        if loop.is_running():
-            # Если event loop уже запущен, используем asyncio.create_task
-            # и ждем результата с помощью sync_to_async или другого механизма
-            # В данном случае создаем новый event loop в отдельном потоке
-            new_loop = asyncio.new_event_loop()
-            result = new_loop.run_until_complete(coro)
-            new_loop.close()
-            return result
-        else:
-            # Если loop не запущен, используем его
-            return loop.run_until_complete(coro)
-    except RuntimeError:
-        # Если event loop отсутствует в текущем потоке, создаем новый
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(coro)
-        finally:
-            loop.close()
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -127,7 +120,8 @@ class DigestWebModule:
         def generate_digest():
             """API для генерации дайджеста"""
             try:
-                data = request.json
+                # Тело запроса и ответ с новостями разбираем и сериализуем через orjson
+                data = orjson.loads(request.get_data())
                 token = session.get('token') 
                 
                 # Получаем параметры из запроса или используем значения по умолчанию
@@ -184,7 +178,7 @@ class DigestWebModule:
                 if username:
                     personalized = True
                     
-                return jsonify({
+                return Response(orjson.dumps({
                     'digest': digest_result['digest'],
                     'analysis': digest_result['analysis'],
                     'analyzed_news': digest_result['analyzed_news'],
@@ -192,7 +186,7 @@ class DigestWebModule:
                     'personalized': personalized,
                     'username': username,
                     'user_id': user_id
-                })
+                }, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
@@ -509,7 +503,7 @@ class DigestWebModule:
             if include_analysis:
                 # Анализ уже будет добавлен в дайджест самим DigestGenerator,
                 # поэтому нам не нужно генерировать его отдельно здесь
-                digest_text = self.digest_generator.generate_digest(analyzed_news, digest_number, style)
+                digest_text = await self.digest_generator.generate_digest_async(analyzed_news, digest_number, style)
                 # Генерируем анализ только для отдельного возврата, если требуется
                 overall_analysis = await self._generate_overall_analysis_async(analyzed_news)
             else:
@@ -518,9 +512,8 @@ class DigestWebModule:
                 class NoAnalysisDigestGenerator(DigestGenerator):
                     def generate_digest(self, analyzed_news, digest_number, style=None):
                         # Используем родительский метод, но передаем пустой текст анализа
-                        current_style = style or self.style
                         news_by_category = self._group_news_by_category(analyzed_news)
-                        return self.template.render(
+                        return self._template_for(style).render(
                             news_by_category=news_by_category,
                             digest_number=digest_number,
                             overall_analysis=""  # Пустой анализ
@@ -540,6 +533,11 @@ class DigestWebModule:
         except Exception as e:
             print(f"Ошибка при генерации дайджеста: {e}")
             return {'error': str(e)}
+        finally:
+            # Цикл событий живет только в рамках запроса, поэтому открытые в нем
+            # HTTP-соединения анализаторов закрываем до его завершения
+            await self.news_analyzer.aclose()
+            await self.digest_generator.analyzer.aclose()
     
     async def _analyze_news_item_async(self, user_id: str, news_item: Dict[str, Any]) -> Dict[str, Any]:
         """